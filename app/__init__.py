@@ -25,12 +25,23 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     login_manager.init_app(app)
 
+    # Shared Gemini API client (one per app, reused across requests and threads)
+    from app import ai_client
+    ai_client.init_app(app)
+
     # Register blueprints
     from app.routes import bp as main_bp
     app.register_blueprint(main_bp)
 
     # Import models here to ensure they are registered with the app
     from app import models
+    from app import fulltext # Registers the FTS5 index hooks on the metadata
+
+    # Register CLI commands (e.g. 'flask embeddings backfill')
+    from app.commands import embeddings_cli, ai_cache_cli, jobs_cli
+    app.cli.add_command(embeddings_cli)
+    app.cli.add_command(ai_cache_cli)
+    app.cli.add_command(jobs_cli)
 
     # Helper function for gamification
     def award_points(user, points, activity):
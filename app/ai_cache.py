@@ -0,0 +1,151 @@
+"""Persistent, content-addressed cache of Gemini responses.
+
+Responses are stored in the `ai_response_cache` table under a SHA-256 key of
+(function, model, prompt-template version, inputs), so the same code sent to
+the same prompt is only paid for once. Entries expire after AI_CACHE_TTL
+seconds and the least recently used ones are evicted beyond AI_CACHE_SIZE.
+
+The cache uses its own short transactions on the engine, never the request's
+ORM session, so a lookup cannot commit half-finished work of the caller.
+"""
+
+import functools
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app import db
+from app.ai_client import DEFAULT_MODEL
+from app.models import AIResponseCache
+
+_table = AIResponseCache.__table__
+
+
+def cache_key(function, model, version, inputs):
+    """Returns the SHA-256 hex key of one AI call."""
+    payload = json.dumps([function, model, version, list(inputs)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _provider_model(model):
+    """
+    Returns the model name entries are keyed and stored under, qualified by
+    AI_PROVIDER unless it is the real Gemini API, so that replies of the fake
+    provider are never served to an application using the real one.
+    """
+    provider = current_app.config['AI_PROVIDER']
+    return model if provider == 'gemini' else f'{provider}:{model}'
+
+
+def lookup(key):
+    """Returns the cached response for a key and marks it used, or None if missing or expired."""
+    now = datetime.utcnow()
+    oldest = now - timedelta(seconds=current_app.config['AI_CACHE_TTL'])
+    with db.engine.begin() as connection:
+        response = connection.scalar(sa.select(_table.c.response).where(
+            _table.c.key == key, _table.c.created_at >= oldest))
+        if response is not None:
+            connection.execute(_table.update().where(_table.c.key == key).values(
+                last_used_at=now, hits=_table.c.hits + 1))
+    return response
+
+
+def store(key, function, model, response):
+    """Stores a response, replacing any expired entry and evicting the least recently used beyond the size limit."""
+    now = datetime.utcnow()
+    max_size = current_app.config['AI_CACHE_SIZE']
+    with db.engine.begin() as connection:
+        connection.execute(_table.delete().where(_table.c.key == key))
+        connection.execute(_table.insert().values(
+            key=key, function=function, model=model, response=response,
+            created_at=now, last_used_at=now, hits=0))
+        excess = connection.scalar(sa.select(sa.func.count()).select_from(_table)) - max_size
+        if excess > 0:
+            stale = sa.select(_table.c.key).order_by(_table.c.last_used_at).limit(excess)
+            connection.execute(_table.delete().where(_table.c.key.in_(stale.scalar_subquery())))
+
+
+def cached_response(function, version=1, model=DEFAULT_MODEL):
+    """
+    Decorates an ai_services function so identical calls are answered from the cache.
+
+    Error responses (strings starting with "Error:") are never cached. Bump
+    `version` whenever the function's prompt changes.
+
+    Args:
+        function (str): The name the entries are stored under.
+        version (int): The prompt-template version.
+        model (str): The model the function calls.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            if current_app.config['AI_CACHE_SIZE'] <= 0:
+                return func(*args)
+            stored_model = _provider_model(model)
+            key = cache_key(function, stored_model, version, args)
+            try:
+                response = lookup(key)
+            except sa.exc.SQLAlchemyError as e:
+                current_app.logger.warning(f"AI cache lookup failed: {e}")
+                return func(*args)
+            if response is not None:
+                return response
+
+            response = func(*args)
+            if not response.startswith("Error:"):
+                try:
+                    store(key, function, stored_model, response)
+                except sa.exc.SQLAlchemyError as e:
+                    current_app.logger.warning(f"AI cache store failed: {e}")
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_stream(function, version=1, model=DEFAULT_MODEL):
+    """
+    Decorates a streaming ai_services function (a generator of text chunks) so
+    it shares the cache entries of the `cached_response` function of the same name.
+
+    A cached response is yielded as one chunk. A streamed response is stored,
+    stripped like a non-streamed one, only once the stream completed.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            if current_app.config['AI_CACHE_SIZE'] <= 0:
+                yield from func(*args)
+                return
+            stored_model = _provider_model(model)
+            key = cache_key(function, stored_model, version, args)
+            try:
+                response = lookup(key)
+            except sa.exc.SQLAlchemyError as e:
+                current_app.logger.warning(f"AI cache lookup failed: {e}")
+                response = None
+            if response is not None:
+                yield response
+                return
+
+            chunks = []
+            for chunk in func(*args):
+                chunks.append(chunk)
+                yield chunk
+            response = ''.join(chunks).strip()
+            if response:
+                try:
+                    store(key, function, stored_model, response)
+                except sa.exc.SQLAlchemyError as e:
+                    current_app.logger.warning(f"AI cache store failed: {e}")
+        return wrapper
+    return decorator
+
+
+def clear_ai_cache():
+    """Deletes every cached response."""
+    with db.engine.begin() as connection:
+        connection.execute(_table.delete())
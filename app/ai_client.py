@@ -0,0 +1,218 @@
+"""A long-lived Gemini API client shared by all requests and worker threads.
+
+The client is set up once per application in `create_app` instead of calling
+`genai.configure()` on every request. It keeps one GenerativeServiceClient,
+so HTTP connections are pooled and reused with keep-alive, caches one
+GenerativeModel per model name and generation config, and applies explicit
+connect and read timeouts to every call. Callers can give each call a
+shorter deadline, and a circuit breaker fails calls fast while the API is down.
+"""
+
+import threading
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from flask import current_app
+from google.api_core import exceptions as api_exceptions
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+from app.throttle import CircuitBreaker
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+
+class _TimeoutAdapter(HTTPAdapter):
+    """Pooled HTTP adapter that gives every request a (connect, read) timeout."""
+
+    def __init__(self, connect_timeout, read_timeout, pool_size):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+
+    def send(self, request, timeout=None, **kwargs):
+        # The API library passes its overall per-call deadline as a single number
+        read_timeout = self.read_timeout
+        if isinstance(timeout, (int, float)):
+            read_timeout = min(read_timeout, timeout)
+        return super().send(request, timeout=(self.connect_timeout, read_timeout), **kwargs)
+
+
+def _is_outage(error):
+    """Whether an error suggests the API is down or overloaded, rather than a bad request."""
+    if isinstance(error, api_exceptions.ClientError):
+        return isinstance(error, api_exceptions.TooManyRequests)
+    return isinstance(error, (api_exceptions.GoogleAPIError, RequestException, TimeoutError, ConnectionError))
+
+
+class GeminiClient:
+    """
+    Thread-safe holder of the configured Gemini clients and models.
+
+    The underlying service client is created on first use, so an app without
+    an API key still starts and only the AI features report errors.
+    """
+
+    def __init__(self, api_key=None, transport='rest', connect_timeout=5.0,
+                 read_timeout=60.0, pool_size=16, breaker=None):
+        self.api_key = api_key
+        self.transport = transport
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self._service = None
+        self._models = {}  # {(model name, generation config items): GenerativeModel}
+        self._lock = threading.Lock()
+
+    @property
+    def service(self):
+        """The shared GenerativeServiceClient, created on first use."""
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    self._service = self._create_service()
+        return self._service
+
+    def _create_service(self):
+        service = glm.GenerativeServiceClient(
+            client_options={'api_key': self.api_key}, transport=self.transport)
+        session = getattr(service._transport, '_session', None)
+        if session is not None:
+            adapter = _TimeoutAdapter(self.connect_timeout, self.read_timeout, self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        return service
+
+    def request_options(self, timeout=None):
+        """
+        Per-call options: the overall deadline for one API request.
+
+        Args:
+            timeout (float): The operation's deadline budget in seconds; the
+                             client's connect and read timeouts cap it.
+        """
+        limit = self.connect_timeout + self.read_timeout
+        return {'timeout': limit if timeout is None else min(timeout, limit)}
+
+    def _call(self, func):
+        """Runs one API call through the circuit breaker."""
+        self.breaker.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            if _is_outage(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()  # The API answered, just not favourably
+            raise
+        self.breaker.record_success()
+        return result
+
+    def model(self, model_name=DEFAULT_MODEL, generation_config=None):
+        """
+        Returns the shared GenerativeModel for a model name and generation config.
+
+        Args:
+            model_name (str): The Gemini model, e.g. "gemini-2.5-flash".
+            generation_config (dict): Sampling settings such as temperature.
+
+        Returns:
+            genai.GenerativeModel: A model bound to the shared service client.
+        """
+        key = (model_name, tuple(sorted((generation_config or {}).items())))
+        model = self._models.get(key)
+        if model is None:
+            service = self.service
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = genai.GenerativeModel(model_name=model_name,
+                                                  generation_config=generation_config)
+                    model._client = service
+                    self._models[key] = model
+        return model
+
+    def generate(self, prompt, model_name=DEFAULT_MODEL, generation_config=None, timeout=None):
+        """
+        Generates text for a prompt.
+
+        Returns:
+            str: The response text, stripped of surrounding whitespace.
+
+        Raises:
+            CircuitOpenError: If the API has been failing and is in its cool-down.
+        """
+        model = self.model(model_name, generation_config)
+        return self._call(lambda: model.generate_content(
+            prompt, request_options=self.request_options(timeout)).text.strip())
+
+    def generate_stream(self, prompt, model_name=DEFAULT_MODEL, generation_config=None, timeout=None):
+        """
+        Generates text for a prompt, yielding it chunk by chunk as the model writes it.
+
+        `timeout` bounds the wait for each chunk, not the whole stream.
+
+        Yields:
+            str: The next piece of the response text.
+        """
+        model = self.model(model_name, generation_config)
+        self.breaker.before_call()
+        try:
+            response = model.generate_content(
+                prompt, stream=True, request_options=self.request_options(timeout))
+            for chunk in response:
+                if chunk.parts:
+                    yield chunk.text
+        except GeneratorExit:
+            self.breaker.record_success()  # The reader stopped early, but the API was answering
+            raise
+        except Exception as e:
+            if _is_outage(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+
+    def embed(self, model_name, content, task_type, timeout=None):
+        """
+        Embeds one text, or a list of texts in one request.
+
+        Returns:
+            list: The embedding, or one embedding per text.
+        """
+        return self._call(lambda: self._embed_content(
+            model_name, content, task_type, self.request_options(timeout)))
+
+    def _embed_content(self, model_name, content, task_type, request_options):
+        return genai.embed_content(model=model_name, content=content, task_type=task_type,
+                                   client=self.service, request_options=request_options)['embedding']
+
+
+def init_app(app):
+    """Creates the application's AI client, Gemini or the fake one, from its config."""
+    config = app.config
+    if config['AI_PROVIDER'] not in ('gemini', 'fake'):
+        raise ValueError(f"Unsupported AI provider: {config['AI_PROVIDER']}")
+    options = dict(
+        connect_timeout=config['GEMINI_CONNECT_TIMEOUT'],
+        read_timeout=config['GEMINI_READ_TIMEOUT'],
+        breaker=CircuitBreaker(failure_threshold=config['GEMINI_BREAKER_FAILURES'],
+                               cooldown=config['GEMINI_BREAKER_COOLDOWN']))
+    if config['AI_PROVIDER'] == 'fake':
+        from app.fake_ai import FakeAIClient
+        app.extensions['gemini'] = FakeAIClient(
+            latency=config['AI_FAKE_LATENCY'], error_rate=config['AI_FAKE_ERROR_RATE'],
+            embedding_dim=config['AI_FAKE_EMBEDDING_DIM'], seed=config['AI_FAKE_SEED'], **options)
+    else:
+        app.extensions['gemini'] = GeminiClient(
+            api_key=config['GEMINI_API_KEY'],
+            transport=config['GEMINI_TRANSPORT'],
+            pool_size=config['GEMINI_POOL_SIZE'],
+            **options)
+
+
+def gemini():
+    """Returns the AI client of the current application (see AI_PROVIDER)."""
+    return current_app.extensions['gemini']
@@ -1,10 +1,126 @@
 """Handles all interactions with the external Google Gemini API."""
 
-import google.generativeai as genai
-from flask import current_app
+import functools
+import re
+import zlib
+
+from flask import current_app, has_request_context
+from flask_login import current_user
 import numpy as np
 
+from app.ai_cache import cached_response, cached_stream
+from app.ai_client import gemini
+from app.cache import TTLCache
+from app.throttle import SingleFlight, RateLimiter, RateLimitExceeded
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+# Sampling settings for code generation
+CODE_GENERATION_CONFIG = {
+    "temperature": 0.4,
+    "top_p": 1,
+    "top_k": 32,
+    "max_output_tokens": 4096,
+}
+
+
+class AIStreamError(Exception):
+    """Raised by the streaming functions; the message is safe to show to users."""
+
+
+def _single_flight():
+    flight = current_app.extensions.get('ai_single_flight')
+    if flight is None:
+        flight = current_app.extensions.setdefault('ai_single_flight', SingleFlight())
+    return flight
+
+
+def rate_limiter():
+    """Returns the rate limiter of outbound Gemini calls for the current application."""
+    limiter = current_app.extensions.get('ai_rate_limiter')
+    if limiter is None:
+        config = current_app.config
+        limiter = current_app.extensions.setdefault('ai_rate_limiter', RateLimiter(
+            rate=config['AI_RATE_LIMIT'], burst=config['AI_RATE_BURST'],
+            user_rate=config['AI_USER_RATE_LIMIT'], user_burst=config['AI_USER_RATE_BURST'],
+            max_wait=config['AI_RATE_LIMIT_WAIT']))
+    return limiter
+
+
+def _acquire_rate_limit():
+    """Spends a token of the global budget and, within a user's request, of their budget."""
+    user = None
+    if has_request_context() and current_user.is_authenticated:
+        user = current_user.id
+    rate_limiter().acquire(user)
+
+
+def throttled(function):
+    """
+    Decorates an ai_services function so that identical concurrent calls share
+    one Gemini request, and every request spends a rate-limit token.
+
+    Raises:
+        RateLimitExceeded: If the call cannot be made within AI_RATE_LIMIT_WAIT seconds.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            def call():
+                _acquire_rate_limit()
+                return func(*args)
+            return _single_flight().do((function, args), call)[0]
+        return wrapper
+    return decorator
+
+
+def _code_generation_prompt(prompt_text):
+    return (
+        "You are a code generation expert. "
+        "Based on the following prompt, generate only the code block requested. "
+        "Do not include any explanation, preamble, or markdown formatting. "
+        "Just return the raw code.\n\n"
+        f"PROMPT: \"{prompt_text}\""
+    )
+
+
+def _code_explanation_prompt(code_to_explain):
+    return (
+        "You are a code explanation expert. Provide a detailed, "
+        "line-by-line explanation of the following code. "
+        "Use Markdown for formatting, including bullet points and bold text. "
+        "Do not wrap the entire response in a code block.\n\n"
+        "CODE:\n"
+        f"```\n{code_to_explain}\n```"
+    )
+
+
+def _leetcode_solution_prompt(problem_title, problem_description, language):
+    return (
+        f"You are an expert LeetCode solution generator. "
+        f"Generate a complete, correct, and efficient solution in {language} for the following LeetCode problem. "
+        f"Provide only the code, without any explanation, preamble, or markdown formatting. "
+        f"Problem Title: {problem_title}\n"
+        f"Problem Description: {problem_description}\n\n"
+        f"SOLUTION ({language}):"
+    )
+
+
+def _stream(prompt, error_message, log_label, deadline, generation_config=None):
+    """Yields the chunks of a streamed generation, turning API errors into AIStreamError."""
+    try:
+        _acquire_rate_limit()
+    except RateLimitExceeded as e:
+        raise AIStreamError(f"Error: {e}") from e
+    try:
+        yield from gemini().generate_stream(prompt, generation_config=generation_config,
+                                            timeout=current_app.config[deadline])
+    except Exception as e:
+        current_app.logger.error(f"Gemini API error ({log_label}): {e}")
+        raise AIStreamError(error_message) from e
 
+
+@throttled('generate_code_from_prompt')
 def generate_code_from_prompt(prompt_text):
     """
     Generates code from a text prompt using the Gemini API.
@@ -16,29 +132,31 @@ def generate_code_from_prompt(prompt_text):
         str: The generated code block as a string, or an error message.
     """
     try:
-        genai.configure(api_key=current_app.config['GEMINI_API_KEY'])
-        generation_config = {
-            "temperature": 0.4,
-            "top_p": 1,
-            "top_k": 32,
-            "max_output_tokens": 4096,
-        }
-        model = genai.GenerativeModel(model_name="gemini-2.5-flash",
-                                      generation_config=generation_config)
-        full_prompt = (
-            "You are a code generation expert. "
-            "Based on the following prompt, generate only the code block requested. "
-            "Do not include any explanation, preamble, or markdown formatting. "
-            "Just return the raw code.\n\n"
-            f"PROMPT: \"{prompt_text}\""
-        )
-        response = model.generate_content(full_prompt)
-        return response.text.strip()
+        return gemini().generate(_code_generation_prompt(prompt_text),
+                                 generation_config=CODE_GENERATION_CONFIG,
+                                 timeout=current_app.config['GEMINI_GENERATION_DEADLINE'])
     except Exception as e:
         current_app.logger.error(f"Gemini API error (generation): {e}")
         return "Error: Could not generate code. Please check the API key and server logs."
 
 
+def stream_code_from_prompt(prompt_text):
+    """
+    Streams the code generated for a text prompt, as in generate_code_from_prompt.
+
+    Yields:
+        str: The next chunk of generated code.
+
+    Raises:
+        AIStreamError: If the API call fails.
+    """
+    return _stream(_code_generation_prompt(prompt_text),
+                   "Error: Could not generate code. Please check the API key and server logs.",
+                   'generation', 'GEMINI_GENERATION_DEADLINE', CODE_GENERATION_CONFIG)
+
+
+@cached_response('explain_code')
+@throttled('explain_code')
 def explain_code(code_to_explain):
     """
     Generates an explanation for a block of code using the Gemini API.
@@ -50,23 +168,31 @@ def explain_code(code_to_explain):
         str: The AI-generated explanation in Markdown format, or an error message.
     """
     try:
-        genai.configure(api_key=current_app.config['GEMINI_API_KEY'])
-        model = genai.GenerativeModel(model_name="gemini-2.5-flash")
-        prompt = (
-            "You are a code explanation expert. Provide a detailed, "
-            "line-by-line explanation of the following code. "
-            "Use Markdown for formatting, including bullet points and bold text. "
-            "Do not wrap the entire response in a code block.\n\n"
-            "CODE:\n"
-            f"```\n{code_to_explain}\n```"
-        )
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return gemini().generate(_code_explanation_prompt(code_to_explain),
+                                 timeout=current_app.config['GEMINI_ANALYSIS_DEADLINE'])
     except Exception as e:
         current_app.logger.error(f"Gemini API error (explanation): {e}")
         return "Error: Could not generate explanation."
 
 
+@cached_stream('explain_code')
+def stream_code_explanation(code_to_explain):
+    """
+    Streams the explanation of a block of code, sharing explain_code's cache.
+
+    Yields:
+        str: The next chunk of the Markdown explanation.
+
+    Raises:
+        AIStreamError: If the API call fails.
+    """
+    yield from _stream(_code_explanation_prompt(code_to_explain),
+                       "Error: Could not generate explanation.", 'explanation',
+                       'GEMINI_ANALYSIS_DEADLINE')
+
+
+@cached_response('suggest_tags_for_code')
+@throttled('suggest_tags_for_code')
 def suggest_tags_for_code(code_to_analyze):
     """
     Generates suggested tags for a block of code using the Gemini API.
@@ -78,8 +204,6 @@ def suggest_tags_for_code(code_to_analyze):
         str: A comma-separated string of tags, or an error message.
     """
     try:
-        genai.configure(api_key=current_app.config['GEMINI_API_KEY'])
-        model = genai.GenerativeModel(model_name="gemini-2.5-flash")
         prompt = (
             "You are a code analysis expert. Analyze the following code and generate a "
             "comma-separated list of 3 to 5 relevant, lowercase tags. "
@@ -88,16 +212,119 @@ def suggest_tags_for_code(code_to_analyze):
             "CODE:\n"
             f"```\n{code_to_analyze}\n```"
         )
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return gemini().generate(prompt, timeout=current_app.config['GEMINI_ANALYSIS_DEADLINE'])
     except Exception as e:
         current_app.logger.error(f"Gemini API error (tagging): {e}")
         return "Error: Could not suggest tags."
 
 
+class GeminiEmbeddingProvider:
+    """Embeds text with the Gemini embedding model."""
+
+    name = EMBEDDING_MODEL
+
+    def embed(self, texts, task_type):
+        deadline = ('GEMINI_QUERY_EMBEDDING_DEADLINE' if task_type == "RETRIEVAL_QUERY"
+                    else 'GEMINI_EMBEDDING_DEADLINE')
+        return gemini().embed(EMBEDDING_MODEL, list(texts), task_type,
+                              timeout=current_app.config[deadline])
+
+
+class LocalEmbeddingProvider:
+    """
+    Embeds text offline with NumPy: hashed word, word-pair and character
+    trigram features, weighted by sublinear term frequency, are projected to
+    `dim` dimensions by a fixed, seeded random sign matrix and L2-normalized.
+
+    The hashing and the projection are deterministic, so vectors are stable
+    across processes and restarts. There is no corpus-wide IDF, which would
+    change every stored vector as the corpus grows.
+    """
+
+    _BUCKETS = 2 ** 15
+    _SEED = 20240607
+    _TOKEN = re.compile(r'[a-z]+|[0-9]+')
+    _projections = {}  # {dim: projection matrix}, shared by all instances
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f'local/hashed-ngrams-v1-{dim}'
+
+    def _projection(self):
+        matrix = self._projections.get(self.dim)
+        if matrix is None:
+            rng = np.random.default_rng(self._SEED)
+            signs = rng.integers(0, 2, size=(self._BUCKETS, self.dim), dtype=np.int8) * 2 - 1
+            matrix = self._projections.setdefault(self.dim, signs)
+        return matrix
+
+    def _features(self, text):
+        # Split identifiers such as parseHTTPResponse and snake_case into words
+        text = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', text).lower()
+        words = self._TOKEN.findall(text)
+        features = list(words)
+        features += [f'{a} {b}' for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f'<{word}>'
+            features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        return features
+
+    def embed_one(self, text):
+        buckets, counts = np.unique(
+            [zlib.crc32(feature.encode('utf-8')) % self._BUCKETS for feature in self._features(text)],
+            return_counts=True)
+        if buckets.size == 0:
+            return np.zeros(self.dim, dtype=np.float32)
+        weights = (1 + np.log(counts)).astype(np.float32)
+        vector = weights @ self._projection()[buckets].astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, texts, task_type):
+        return [self.embed_one(text).tolist() for text in texts]
+
+
+class FakeEmbeddingProvider:
+    """Embeds text with the fake AI client (AI_PROVIDER = 'fake'), under its own name."""
+
+    def __init__(self, dim):
+        self.name = f'fake/hash-{dim}'
+
+    def embed(self, texts, task_type):
+        return gemini().embed(self.name, list(texts), task_type,
+                              timeout=current_app.config['GEMINI_EMBEDDING_DEADLINE'])
+
+
+EMBEDDING_PROVIDERS = {
+    'gemini': lambda config: GeminiEmbeddingProvider(),
+    'local': lambda config: LocalEmbeddingProvider(dim=config['LOCAL_EMBEDDING_DIM']),
+    'fake': lambda config: FakeEmbeddingProvider(dim=config['AI_FAKE_EMBEDDING_DIM']),
+}
+
+
+def embedding_provider():
+    """Returns the embedding provider selected by EMBEDDING_PROVIDER for the current application."""
+    provider = current_app.extensions.get('embedding_provider')
+    if provider is None:
+        name = current_app.config['EMBEDDING_PROVIDER']
+        if name not in EMBEDDING_PROVIDERS:
+            raise ValueError(f"Unsupported embedding provider: {name}")
+        if (name == 'fake') != (current_app.config['AI_PROVIDER'] == 'fake'):
+            # Fake vectors must never be stored under a real model's name, or vice versa
+            raise ValueError("EMBEDDING_PROVIDER 'fake' requires AI_PROVIDER 'fake', and vice versa.")
+        provider = current_app.extensions.setdefault(
+            'embedding_provider', EMBEDDING_PROVIDERS[name](current_app.config))
+    return provider
+
+
+def embedding_model_name():
+    """The name stored with every embedding, so vectors of different providers are never compared."""
+    return embedding_provider().name
+
+
 def generate_embedding(text_to_embed, task_type="RETRIEVAL_DOCUMENT"):
     """
-    Generates a vector embedding for a block of text using the Gemini API.
+    Generates a vector embedding for a block of text with the configured provider.
 
     Args:
         text_to_embed (str): The text to create an embedding for.
@@ -108,48 +335,94 @@ def generate_embedding(text_to_embed, task_type="RETRIEVAL_DOCUMENT"):
         list: A list of floats representing the vector embedding, or None on error.
     """
     try:
-        genai.configure(api_key=current_app.config['GEMINI_API_KEY'])
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=text_to_embed,
-            task_type=task_type
-        )
-        return result['embedding']
+        return embedding_provider().embed([text_to_embed], task_type)[0]
+    except Exception as e:
+        current_app.logger.error(f"Embedding error: {e}")
+        return None
+
+
+def generate_embeddings(texts, task_type="RETRIEVAL_DOCUMENT"):
+    """
+    Generates vector embeddings for several texts in a single provider request.
+
+    Args:
+        texts (list): The texts to create embeddings for.
+        task_type (str): The embedding task type, as in generate_embedding.
+
+    Returns:
+        list: One list of floats per input text, or None on error.
+    """
+    try:
+        return embedding_provider().embed(texts, task_type)
     except Exception as e:
-        current_app.logger.error(f"Gemini API error (embedding): {e}")
+        current_app.logger.error(f"Embedding error (batch): {e}")
         return None
 
 
+def normalize_query(query):
+    """Collapses whitespace and case so equivalent queries share a cache entry."""
+    return ' '.join(query.split()).casefold()
+
+
+def query_embedding_cache():
+    """Returns the query-embedding cache for the current application."""
+    cache = current_app.extensions.get('query_embedding_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('query_embedding_cache', TTLCache(
+            maxsize=current_app.config['QUERY_EMBEDDING_CACHE_SIZE'],
+            ttl=current_app.config['QUERY_EMBEDDING_CACHE_TTL']))
+    return cache
+
+
+def generate_query_embedding(query):
+    """
+    Generates the embedding for a search query, reusing a cached one if the
+    same normalized query was embedded recently.
+
+    Args:
+        query (str): The user's search query.
+
+    Returns:
+        np.ndarray: A read-only float32 vector, or None on error.
+    """
+    normalized = normalize_query(query)
+    cache = query_embedding_cache()
+    key = (embedding_model_name(), normalized)
+    vector = cache.get(key)
+    if vector is not None:
+        return vector
+
+    embedding = generate_embedding(normalized, task_type="RETRIEVAL_QUERY")
+    if embedding is None:
+        return None  # Failures are not cached so the next search retries
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector.flags.writeable = False
+    cache.set(key, vector)
+    return vector
+
+
+@throttled('generate_leetcode_solution')
 def generate_leetcode_solution(problem_title, problem_description, language):
     try:
-        genai.configure(api_key=current_app.config['GEMINI_API_KEY'])
-        generation_config = {
-            "temperature": 0.4,
-            "top_p": 1,
-            "top_k": 32,
-            "max_output_tokens": 4096,
-        }
-        model = genai.GenerativeModel(model_name="gemini-2.5-flash",
-                                      generation_config=generation_config)
-        full_prompt = (
-            f"You are an expert LeetCode solution generator. "
-            f"Generate a complete, correct, and efficient solution in {language} for the following LeetCode problem. "
-            f"Provide only the code, without any explanation, preamble, or markdown formatting. "
-            f"Problem Title: {problem_title}\n"
-            f"Problem Description: {problem_description}\n\n"
-            f"SOLUTION ({language}):"
-        )
-        response = model.generate_content(full_prompt)
-        return response.text.strip()
+        return gemini().generate(_leetcode_solution_prompt(problem_title, problem_description, language),
+                                 generation_config=CODE_GENERATION_CONFIG,
+                                 timeout=current_app.config['GEMINI_GENERATION_DEADLINE'])
     except Exception as e:
         current_app.logger.error(f"Gemini API error (solution generation): {e}")
         return "Error: Could not generate solution. Please check the API key and server logs."
 
 
+def stream_leetcode_solution(problem_title, problem_description, language):
+    """Streams the code of a LeetCode solution, as in generate_leetcode_solution."""
+    return _stream(_leetcode_solution_prompt(problem_title, problem_description, language),
+                   "Error: Could not generate solution. Please check the API key and server logs.",
+                   'solution generation', 'GEMINI_GENERATION_DEADLINE', CODE_GENERATION_CONFIG)
+
+
+@cached_response('explain_leetcode_solution')
+@throttled('explain_leetcode_solution')
 def explain_leetcode_solution(solution_code, problem_title, language):
     try:
-        genai.configure(api_key=current_app.config['GEMINI_API_KEY'])
-        model = genai.GenerativeModel(model_name="gemini-2.5-flash")
         prompt = (
             f"You are an expert at explaining LeetCode solutions. "
             f"Provide a concise but educative explanation for the following {language} solution to the problem '{problem_title}'. "
@@ -163,17 +436,16 @@ def explain_leetcode_solution(solution_code, problem_title, language):
             f"SOLUTION ({language}):\n"
             f"```\n{solution_code}\n```"
         )
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return gemini().generate(prompt, timeout=current_app.config['GEMINI_ANALYSIS_DEADLINE'])
     except Exception as e:
         current_app.logger.error(f"Gemini API error (explanation): {e}")
         return "Error: Could not generate explanation."
 
 
+@cached_response('classify_leetcode_solution')
+@throttled('classify_leetcode_solution')
 def classify_leetcode_solution(solution_code, problem_description):
     try:
-        genai.configure(api_key=current_app.config['GEMINI_API_KEY'])
-        model = genai.GenerativeModel(model_name="gemini-2.5-flash")
         prompt = (
             "You are an expert in LeetCode problem classification. "
             "Analyze the following problem description and its solution. "
@@ -184,26 +456,7 @@ def classify_leetcode_solution(solution_code, problem_description):
             f"PROBLEM DESCRIPTION:\n{problem_description}\n\n"
             f"SOLUTION CODE:\n```\n{solution_code}\n```"
         )
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return gemini().generate(prompt, timeout=current_app.config['GEMINI_ANALYSIS_DEADLINE'])
     except Exception as e:
         current_app.logger.error(f"Gemini API error (classification): {e}")
         return "Error: Could not classify solution."
-
-
-def cosine_similarity(v1, v2):
-    """
-    Calculates the cosine similarity between two vectors.
-
-    Args:
-        v1 (np.array): The first vector.
-        v2 (np.array): The second vector.
-
-    Returns:
-        float: The cosine similarity between v1 and v2, or 0.0 if a norm is zero.
-    """
-    norm_v1 = np.linalg.norm(v1)
-    norm_v2 = np.linalg.norm(v2)
-    if norm_v1 == 0 or norm_v2 == 0:
-        return 0.0
-    return np.dot(v1, v2) / (norm_v1 * norm_v2)
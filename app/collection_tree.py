@@ -0,0 +1,93 @@
+"""A user's collection hierarchy, loaded with one recursive CTE.
+
+`collection_tree` walks down from the top-level collections and returns every
+collection with its depth, its path and the number of snippets in it and in
+its whole subtree, plus the user's total snippet count. The walk only follows
+parent links from the roots, so it always terminates, and `descendant_ids`
+lets callers refuse parent choices that would create a cycle.
+"""
+
+import sqlalchemy as sa
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.models import Collection, Snippet
+
+PATH_SEPARATOR = ' / '
+
+
+def _tree_query(user_id):
+    counts = (sa.select(Snippet.collection_id, sa.func.count().label('snippet_count'))
+              .where(Snippet.user_id == user_id)
+              .group_by(Snippet.collection_id)
+              .cte('snippet_counts'))
+
+    # id_path ('/1/4/') identifies a subtree by prefix; path is the readable name path
+    tree = (sa.select(Collection.id, Collection.parent_id, Collection.name, Collection.order,
+                      sa.literal(0).label('depth'),
+                      ('/' + sa.cast(Collection.id, sa.String) + '/').label('id_path'),
+                      Collection.name.label('path'))
+            .where(Collection.user_id == user_id, Collection.parent_id.is_(None))
+            .cte('collection_tree', recursive=True))
+    child = aliased(Collection)
+    tree = tree.union_all(
+        sa.select(child.id, child.parent_id, child.name, child.order,
+                  tree.c.depth + 1,
+                  tree.c.id_path + sa.cast(child.id, sa.String) + '/',
+                  tree.c.path + PATH_SEPARATOR + child.name)
+        .where(child.parent_id == tree.c.id, child.user_id == user_id))
+
+    descendant = tree.alias('descendant')
+    subtree_count = (sa.select(sa.func.coalesce(sa.func.sum(counts.c.snippet_count), 0))
+                     .select_from(descendant.join(counts, counts.c.collection_id == descendant.c.id))
+                     .where(descendant.c.id_path.startswith(tree.c.id_path))
+                     .scalar_subquery())
+    # The user's total, including snippets outside any collection, is a one-row
+    # select joined to every node; the outer join keeps it for users without collections
+    totals = (sa.select(sa.func.coalesce(sa.func.sum(counts.c.snippet_count), 0).label('total_snippets'))
+              .subquery('totals'))
+    return (sa.select(tree, sa.func.coalesce(counts.c.snippet_count, 0).label('snippet_count'),
+                      subtree_count.label('subtree_count'), totals.c.total_snippets)
+            .select_from(totals)
+            .outerjoin(tree, sa.true())
+            .outerjoin(counts, counts.c.collection_id == tree.c.id))
+
+
+def collection_tree(user_id):
+    """
+    Loads all of a user's collections as a tree, and their snippet counts, in one query.
+
+    Returns:
+        tuple: (rows, total snippet count of the user). The rows have id,
+               parent_id, name, order, depth, id_path, path, snippet_count
+               (snippets directly in the collection) and subtree_count
+               (snippets in the collection and its descendants), in
+               depth-first order with siblings sorted by order, then name.
+    """
+    rows = db.session.execute(_tree_query(user_id)).all()
+    total = rows[0].total_snippets
+    children = {}
+    for row in rows:
+        if row.id is not None:  # A user without collections gets one row with only the total
+            children.setdefault(row.parent_id, []).append(row)
+
+    ordered = []
+    def visit(parent_id):
+        for row in sorted(children.get(parent_id, ()), key=lambda r: (r.order or 0, r.name)):
+            ordered.append(row)
+            visit(row.id)
+    visit(None)
+    return ordered, total
+
+
+def subtree(tree, collection_id):
+    """Returns the rows of a collection and all its descendants, or [] if it is not in the tree."""
+    root = next((row for row in tree if row.id == collection_id), None)
+    if root is None:
+        return []
+    return [row for row in tree if row.id_path.startswith(root.id_path)]
+
+
+def descendant_ids(tree, collection_id):
+    """Returns the ids of a collection and all its descendants, none of which may become its parent."""
+    return {row.id for row in subtree(tree, collection_id)} | {collection_id}
@@ -0,0 +1,250 @@
+"""Flask CLI commands for maintaining the Sophia database."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.orm import joinedload
+
+from app import db, ai_services
+from app.ai_cache import clear_ai_cache
+from app.embeddings import content_hash, embedding_model
+from app.jobs import JobWorkerPool, run_pending_jobs
+from app.models import User, Snippet, LeetcodeSolution, AIResponseCache, Job
+from app.search import invalidate_snippet_searches
+from app.related import rebuild_related_snippets
+from app.vector_index import snippet_indexes, update_solutions
+
+embeddings_cli = AppGroup('embeddings', help='Manage snippet and solution embeddings.')
+ai_cache_cli = AppGroup('ai-cache', help='Inspect and clear the cache of AI responses.')
+jobs_cli = AppGroup('jobs', help='Run and inspect background AI jobs.')
+
+# {name used on the command line: model}
+EMBEDDED_MODELS = {
+    'snippets': Snippet,
+    'solutions': LeetcodeSolution,
+}
+
+# Relationships read by embedding_text(), loaded up front to avoid a query per row
+_EAGER_RELATIONSHIPS = {
+    LeetcodeSolution: ('problem',),
+}
+
+
+def needs_embedding(obj, force=False):
+    """
+    Checks whether an object's stored embedding is missing or stale.
+
+    An embedding is stale when it was built from different text than the
+    object's current content, or by a different embedding model.
+    """
+    if force or obj.embedding_data is None:
+        return True
+    if obj.embedding_hash != content_hash(obj.embedding_text()):
+        return True
+    try:
+        return embedding_model(obj.embedding_data) != ai_services.embedding_model_name()
+    except ValueError:
+        return True
+
+
+def _embed_batch(app, texts):
+    with app.app_context():
+        return ai_services.generate_embeddings(texts, task_type="RETRIEVAL_DOCUMENT")
+
+
+def _refresh_indexes(objs):
+    """
+    Updates this process's indexes and bumps the index versions once per
+    user, so running web servers rebuild their indexes and drop cached searches.
+    """
+    snippets = [obj for obj in objs if isinstance(obj, Snippet)]
+    for snippet in snippets:
+        snippet_indexes().update(snippet)
+    for user_id in {snippet.user_id for snippet in snippets}:
+        invalidate_snippet_searches(user_id)
+    solutions = [obj for obj in objs if not isinstance(obj, Snippet)]
+    if solutions:
+        update_solutions(solutions)
+
+
+def backfill_embeddings(model, start_after=0, chunk_size=200, batch_size=50,
+                        concurrency=4, force=False, report=None):
+    """
+    Embeds every row of a model whose embedding is missing or stale.
+
+    Rows are visited in id order and committed one chunk at a time, so an
+    interrupted run loses at most one chunk of work. Re-running skips rows
+    that are already up to date; `start_after` skips ahead explicitly.
+
+    Args:
+        model: Snippet or LeetcodeSolution.
+        start_after (int): Only rows with a greater id are visited.
+        chunk_size (int): Rows loaded and committed per transaction.
+        batch_size (int): Texts sent per embedding API request.
+        concurrency (int): Maximum embedding requests in flight.
+        force (bool): Re-embed rows even if they look up to date.
+        report (callable): Called with a progress dict after each chunk.
+
+    Returns:
+        dict: Totals for scanned, embedded and failed rows, the last id
+              visited, and the elapsed time.
+    """
+    app = current_app._get_current_object()
+    options = [joinedload(getattr(model, name)) for name in _EAGER_RELATIONSHIPS.get(model, ())]
+    totals = {'scanned': 0, 'embedded': 0, 'failed': 0, 'last_id': start_after, 'elapsed': 0.0}
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            rows = db.session.scalars(
+                sa.select(model).options(*options)
+                .where(model.id > totals['last_id'])
+                .order_by(model.id).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            totals['scanned'] += len(rows)
+            totals['last_id'] = rows[-1].id
+
+            pending = [obj for obj in rows if needs_embedding(obj, force)]
+            texts = [obj.embedding_text() for obj in pending]
+            batches = [(pending[i:i + batch_size], texts[i:i + batch_size])
+                       for i in range(0, len(pending), batch_size)]
+            futures = [pool.submit(_embed_batch, app, batch_texts) for _, batch_texts in batches]
+
+            embedded = []
+            for (batch, batch_texts), future in zip(batches, futures):
+                vectors = future.result()
+                if vectors is None or len(vectors) != len(batch):
+                    totals['failed'] += len(batch)
+                    continue
+                for obj, text, vector in zip(batch, batch_texts, vectors):
+                    obj.embedding = vector
+                    obj.embedding_hash = content_hash(text)
+                    embedded.append(obj)
+            db.session.commit()
+
+            _refresh_indexes(embedded)
+            totals['embedded'] += len(embedded)
+            totals['elapsed'] = time.monotonic() - started
+            if report is not None:
+                report(dict(totals))
+
+    totals['elapsed'] = time.monotonic() - started
+    return totals
+
+
+def _rate(totals):
+    return totals['embedded'] / totals['elapsed'] if totals['elapsed'] else 0.0
+
+
+@embeddings_cli.command('backfill')
+@click.option('--only', type=click.Choice(list(EMBEDDED_MODELS)), default=None,
+              help='Only process snippets or solutions.')
+@click.option('--start-after', type=int, default=0, help='Resume after this row id.')
+@click.option('--chunk-size', type=int, default=200, show_default=True,
+              help='Rows committed per transaction.')
+@click.option('--batch-size', type=int, default=50, show_default=True,
+              help='Texts per embedding API request.')
+@click.option('--concurrency', type=int, default=4, show_default=True,
+              help='Maximum embedding requests in flight.')
+@click.option('--force', is_flag=True, help='Re-embed everything, e.g. after a model change.')
+def backfill(only, start_after, chunk_size, batch_size, concurrency, force):
+    """
+    Generate missing or stale embeddings for snippets and solutions.
+
+    Running web servers pick up the new embeddings on their next search.
+    """
+    for name, model in EMBEDDED_MODELS.items():
+        if only is not None and name != only:
+            continue
+        click.echo(f"Backfilling {name}...")
+
+        def report(totals):
+            click.echo(f"  {name}: scanned {totals['scanned']}, embedded {totals['embedded']}, "
+                       f"failed {totals['failed']} (last id {totals['last_id']}, "
+                       f"{_rate(totals):.1f}/s)")
+
+        totals = backfill_embeddings(model, start_after=start_after, chunk_size=chunk_size,
+                                     batch_size=batch_size, concurrency=concurrency,
+                                     force=force, report=report)
+        click.echo(f"Done with {name}: embedded {totals['embedded']} of {totals['scanned']} rows, "
+                   f"{totals['failed']} failed, in {totals['elapsed']:.1f}s "
+                   f"({_rate(totals):.1f} rows/s).")
+        if totals['failed']:
+            click.echo(f"Re-run the command to retry the {totals['failed']} failed rows.")
+        if model is Snippet and totals['embedded']:
+            click.echo("Run 'flask embeddings related' to refresh the related-snippets graph.")
+
+
+@embeddings_cli.command('related')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s graph.')
+def related(user_id):
+    """Rebuild the related-snippets graph from the stored embeddings."""
+    user_ids = [user_id] if user_id is not None else db.session.scalars(
+        sa.select(User.id).order_by(User.id)).all()
+    started = time.monotonic()
+    edges = 0
+    for uid in user_ids:
+        edges += rebuild_related_snippets(uid)
+    click.echo(f"Rebuilt the related-snippets graph for {len(user_ids)} users "
+               f"({edges} edges) in {time.monotonic() - started:.1f}s.")
+
+@ai_cache_cli.command('stats')
+def ai_cache_stats_command():
+    """Report cached AI responses and their hit rate per function."""
+    rows = db.session.execute(
+        sa.select(AIResponseCache.function, sa.func.count(), sa.func.sum(AIResponseCache.hits))
+        .group_by(AIResponseCache.function).order_by(AIResponseCache.function)).all()
+    if not rows:
+        click.echo("The AI cache is empty.")
+    for function, entries, hits in rows:
+        # Every entry was created by one miss
+        click.echo(f"{function}: {entries} entries, {hits} hits, "
+                   f"{hits / (hits + entries):.0%} hit rate")
+
+
+@ai_cache_cli.command('clear')
+def ai_cache_clear_command():
+    """Delete every cached AI response."""
+    clear_ai_cache()
+    click.echo("Cleared the AI cache.")
+
+
+@jobs_cli.command('work')
+@click.option('--workers', type=int, default=None, help='Worker threads (default: JOB_WORKERS).')
+def jobs_work_command(workers):
+    """Process background jobs until interrupted (for JOB_QUEUE_MODE=external)."""
+    pool = JobWorkerPool(current_app._get_current_object(),
+                         size=workers or current_app.config['JOB_WORKERS'],
+                         poll_interval=current_app.config['JOB_POLL_INTERVAL'])
+    pool.start()
+    click.echo(f"Processing jobs with {pool.size} workers. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        click.echo("Stopping after the current jobs...")
+        pool.stop()
+
+
+@jobs_cli.command('run')
+def jobs_run_command():
+    """Process the jobs that are due now, then exit."""
+    click.echo(f"Ran {run_pending_jobs()} jobs.")
+
+
+@jobs_cli.command('stats')
+def jobs_stats_command():
+    """Report the number of jobs per kind and status."""
+    rows = db.session.execute(
+        sa.select(Job.kind, Job.status, sa.func.count())
+        .group_by(Job.kind, Job.status).order_by(Job.kind, Job.status)).all()
+    if not rows:
+        click.echo("There are no jobs.")
+    for kind, status, count in rows:
+        click.echo(f"{kind}: {count} {status}")
@@ -0,0 +1,187 @@
+"""Near-duplicate snippet detection with MinHash and locality-sensitive hashing.
+
+Each snippet's code is normalized into overlapping token shingles and
+summarized by a MinHash signature, whose matching positions estimate the
+Jaccard similarity of two shingle sets. Signatures are split into bands and
+bucketed by band, so near-duplicates of a snippet are found by looking up
+its own buckets instead of comparing it with every other snippet.
+"""
+
+import re
+import threading
+import zlib
+from collections import defaultdict
+
+import numpy as np
+import sqlalchemy as sa
+from flask import current_app
+
+from app import db
+from app.index_versions import UserIndexRegistry
+
+NUM_PERM = 64 # MinHash signature length
+BANDS = 16 # LSH bands of NUM_PERM // BANDS rows; pairs above ~0.5 similarity become candidates
+SHINGLE_SIZE = 5 # Tokens per shingle
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, _PRIME, size=NUM_PERM, dtype=np.int64)
+_B = _rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.int64)
+
+
+def shingles(code):
+    """
+    Returns the hashed token shingles of a piece of code.
+
+    The code is lowercased and split into words and punctuation, so changes
+    in whitespace, indentation and letter case do not matter.
+
+    Args:
+        code (str): The source code.
+
+    Returns:
+        np.ndarray: The distinct shingle hashes (may be empty).
+    """
+    tokens = re.findall(r'\w+|[^\w\s]', (code or '').lower())
+    if not tokens:
+        return np.empty(0, dtype=np.int64)
+    count = max(1, len(tokens) - SHINGLE_SIZE + 1)
+    hashes = {zlib.crc32(' '.join(tokens[i:i + SHINGLE_SIZE]).encode('utf-8')) for i in range(count)}
+    return np.fromiter(hashes, dtype=np.int64, count=len(hashes))
+
+
+def signature(code):
+    """
+    Computes the MinHash signature of a piece of code.
+
+    Returns:
+        np.ndarray: NUM_PERM minimum hash values, or None if the code has no tokens.
+    """
+    hashes = shingles(code)
+    if hashes.size == 0:
+        return None
+    hashes %= _PRIME
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(signature_a, signature_b):
+    """Estimates the Jaccard similarity of two shingle sets from their signatures."""
+    return float(np.mean(signature_a == signature_b))
+
+
+def _band_keys(sig):
+    rows = NUM_PERM // BANDS
+    return [(band, sig[band * rows:(band + 1) * rows].tobytes()) for band in range(BANDS)]
+
+
+class DuplicateIndex:
+    """LSH buckets of MinHash signatures for one user's snippets."""
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self._signatures = {}  # {item_id: signature}
+        self._buckets = defaultdict(set)  # {(band, band bytes): item ids}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, item_id):
+        return item_id in self._signatures
+
+    def upsert(self, item_id, code):
+        """Indexes (or re-indexes) an item's code."""
+        sig = signature(code)
+        with self._lock:
+            self.remove(item_id)
+            if sig is None:
+                return
+            self._signatures[item_id] = sig
+            for key in _band_keys(sig):
+                self._buckets[key].add(item_id)
+
+    def remove(self, item_id):
+        """Removes an item from the index, if present."""
+        with self._lock:
+            sig = self._signatures.pop(item_id, None)
+            if sig is None:
+                return
+            for key in _band_keys(sig):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(item_id)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def _matches(self, sig, exclude=None):
+        candidates = set()
+        for key in _band_keys(sig):
+            candidates |= self._buckets.get(key, set())
+        candidates.discard(exclude)
+        matches = []
+        for item_id in candidates:
+            score = similarity(sig, self._signatures[item_id])
+            if score >= self.threshold:
+                matches.append((item_id, score))
+        return matches
+
+    def find(self, code, exclude=None):
+        """
+        Finds the indexed items whose code is a near-duplicate of the given code.
+
+        Args:
+            code (str): The code to check.
+            exclude (int): An item id to leave out, e.g. the snippet being edited.
+
+        Returns:
+            list: (item id, estimated similarity) pairs, most similar first.
+        """
+        sig = signature(code)
+        if sig is None:
+            return []
+        with self._lock:
+            matches = self._matches(sig, exclude)
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def collapse(self, ranked_ids):
+        """
+        Drops every item that is a near-duplicate of an item ranked above it.
+
+        Args:
+            ranked_ids (list): Item ids, best first.
+
+        Returns:
+            list: The remaining ids, in the same order.
+        """
+        kept, kept_ids = [], set()
+        with self._lock:
+            for item_id in ranked_ids:
+                sig = self._signatures.get(item_id)
+                if sig is not None and any(match in kept_ids for match, _ in self._matches(sig, item_id)):
+                    continue
+                kept.append(item_id)
+                kept_ids.add(item_id)
+        return kept
+
+
+class DuplicateIndexRegistry(UserIndexRegistry):
+    """Lazily builds and caches one DuplicateIndex per user."""
+
+    def _build(self, user_id):
+        from app.models import Snippet
+
+        index = DuplicateIndex(threshold=current_app.config['DUPLICATE_SIMILARITY'])
+        rows = db.session.execute(
+            sa.select(Snippet.id, Snippet.code).where(Snippet.user_id == user_id)
+        ).all()
+        for snippet_id, code in rows:
+            index.upsert(snippet_id, code)
+        return index
+
+    def _upsert(self, index, snippet):
+        index.upsert(snippet.id, snippet.code)
+
+
+def duplicate_indexes():
+    """Returns the duplicate index registry for the current application."""
+    return current_app.extensions.setdefault('duplicate_index', DuplicateIndexRegistry())
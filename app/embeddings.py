@@ -0,0 +1,121 @@
+"""Compact binary serialization for vector embeddings.
+
+An encoded embedding is a small fixed header followed by the raw
+little-endian vector data:
+
+    magic (2s) | version (B) | dtype code (B) | dimension (I) | model length (H)
+    model name (utf-8) | padding to an 8-byte boundary | vector data
+
+The padding keeps the vector data aligned so it can be read back with
+`np.frombuffer` without copying.
+"""
+
+import hashlib
+import struct
+
+import numpy as np
+
+_MAGIC = b'SE'
+_VERSION = 1
+_HEADER = struct.Struct('<2sBBIH')
+_ALIGNMENT = 8
+
+# {name: (dtype code, numpy dtype)}
+STORAGE_DTYPES = {
+    'float32': (0, np.dtype('<f4')),
+    'float16': (1, np.dtype('<f2')),
+}
+_DTYPES_BY_CODE = {code: dtype for code, dtype in STORAGE_DTYPES.values()}
+
+
+def encode_embedding(vector, model, dtype='float32'):
+    """
+    Packs an embedding into its binary storage format.
+
+    Args:
+        vector: A list or array of numbers, or None.
+        model (str): The name of the model that produced the embedding.
+        dtype (str): The storage precision, 'float32' or 'float16'.
+
+    Returns:
+        bytes: The encoded embedding, or None if `vector` is None or empty.
+    """
+    if vector is None:
+        return None
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unsupported embedding storage dtype: {dtype}")
+    code, np_dtype = STORAGE_DTYPES[dtype]
+
+    array = np.asarray(vector, dtype=np_dtype)
+    if array.ndim != 1 or array.size == 0:
+        return None
+
+    model_bytes = (model or '').encode('utf-8')
+    header = _HEADER.pack(_MAGIC, _VERSION, code, array.size, len(model_bytes)) + model_bytes
+    padding = b'\x00' * (-len(header) % _ALIGNMENT)
+    return header + padding + array.tobytes()
+
+
+def read_header(data):
+    """
+    Parses the header of an encoded embedding.
+
+    Args:
+        data (bytes): The encoded embedding.
+
+    Returns:
+        tuple: (numpy dtype, dimension, model name, byte offset of the vector data).
+
+    Raises:
+        ValueError: If the data is not a valid encoded embedding.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Encoded embedding is truncated.")
+    magic, version, code, dim, model_length = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION or code not in _DTYPES_BY_CODE:
+        raise ValueError("Unrecognized embedding encoding.")
+
+    model_end = _HEADER.size + model_length
+    model = bytes(data[_HEADER.size:model_end]).decode('utf-8')
+    offset = model_end + (-model_end % _ALIGNMENT)
+    np_dtype = _DTYPES_BY_CODE[code]
+    if len(data) < offset + dim * np_dtype.itemsize:
+        raise ValueError("Encoded embedding is truncated.")
+    return np_dtype, dim, model, offset
+
+
+def decode_embedding(data, model=None):
+    """
+    Returns a read-only view of the vector stored in an encoded embedding.
+
+    Args:
+        data (bytes): The encoded embedding, or None.
+        model (str): If given, embeddings produced by any other model are
+                     treated as missing, so vectors from different providers
+                     are never compared.
+
+    Returns:
+        np.ndarray: The vector (no copy is made), or None if `data` is None
+                    or was produced by a different model.
+
+    Raises:
+        ValueError: If the data is not a valid encoded embedding.
+    """
+    if data is None:
+        return None
+    np_dtype, dim, stored_model, offset = read_header(data)
+    if model is not None and stored_model != model:
+        return None
+    return np.frombuffer(data, dtype=np_dtype, count=dim, offset=offset)
+
+
+def content_hash(text):
+    """Returns the SHA-256 hex digest of the text an embedding was built from."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def embedding_model(data):
+    """Returns the model name recorded in an encoded embedding, or None."""
+    if data is None:
+        return None
+    return read_header(data)[2]
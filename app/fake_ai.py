@@ -0,0 +1,113 @@
+"""A deterministic stand-in for the Gemini API, selected with AI_PROVIDER = 'fake'.
+
+It answers every prompt offline with text derived from a hash of the prompt,
+embeds text as a hash-seeded unit vector, and can add artificial latency and
+a seeded rate of failures. Load tests and benchmarks then measure this
+application rather than the network, and runs with the same seed are
+reproducible. The fake goes through the same circuit breaker and deadline
+handling as the real client.
+"""
+
+import hashlib
+import random
+import threading
+import time
+
+import numpy as np
+from google.api_core import exceptions as api_exceptions
+
+from app.ai_client import GeminiClient
+
+_WORDS = ('array', 'binary', 'cache', 'function', 'graph', 'hash', 'index', 'loop', 'map',
+          'pointer', 'queue', 'recursion', 'search', 'stack', 'string', 'tree', 'value', 'window')
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+class FakeAIClient(GeminiClient):
+    """
+    Drop-in replacement for GeminiClient that never touches the network.
+
+    Args:
+        latency (float): Seconds every call takes (spread over the chunks when streaming).
+        error_rate (float): Fraction of calls, 0 to 1, that fail with a 503.
+        embedding_dim (int): The dimension of the fake embeddings.
+        seed (int): Seeds the sequence of injected failures.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, embedding_dim=768, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.embedding_dim = embedding_dim
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    @property
+    def service(self):
+        raise RuntimeError("The fake AI client has no service client.")
+
+    def model(self, model_name=None, generation_config=None):
+        return _FakeModel(self)
+
+    def _wait(self, seconds, timeout):
+        """Sleeps like a slow API call, raising as the real one would past its deadline."""
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise api_exceptions.DeadlineExceeded("Fake AI call exceeded its deadline.")
+        time.sleep(seconds)
+
+    def _maybe_fail(self):
+        with self._random_lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise api_exceptions.ServiceUnavailable("Fake AI call failed (injected error).")
+
+    def _embed_content(self, model_name, content, task_type, request_options):
+        self._maybe_fail()
+        self._wait(self.latency, request_options.get('timeout'))
+        texts = [content] if isinstance(content, str) else content
+        vectors = [self.fake_embedding(text) for text in texts]
+        return vectors[0] if isinstance(content, str) else vectors
+
+    def fake_embedding(self, text):
+        """Returns the deterministic unit vector for a text."""
+        rng = np.random.default_rng(int.from_bytes(_digest(text)[:8], 'little'))
+        vector = rng.standard_normal(self.embedding_dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    @staticmethod
+    def fake_text(prompt):
+        """Returns the deterministic response text for a prompt."""
+        rng = random.Random(_digest(prompt))
+        return ' '.join(rng.choice(_WORDS) for _ in range(24))
+
+
+class _FakeModel:
+    """Mimics the parts of genai.GenerativeModel that GeminiClient uses."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        timeout = (request_options or {}).get('timeout')
+        text = self.client.fake_text(prompt)
+        self.client._maybe_fail()
+        if not stream:
+            self.client._wait(self.client.latency, timeout)
+            return _FakeChunk(text)
+        return self._stream(text, timeout)
+
+    def _stream(self, text, timeout):
+        words = text.split(' ')
+        for number, word in enumerate(words):
+            self.client._wait(self.client.latency / len(words), timeout)
+            yield _FakeChunk(word if number == 0 else f' {word}')
+
+
+class _FakeChunk:
+    def __init__(self, text):
+        self.text = text
+        self.parts = [text]
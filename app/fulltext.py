@@ -0,0 +1,233 @@
+"""SQLite FTS5 full-text indexes used by the keyword stage of search.
+
+Each indexed table gets an external-content FTS5 table kept in sync by
+triggers, so the text is not stored twice. When the database is not SQLite,
+FTS5 is not compiled in, or the query cannot be expressed as an FTS5 match,
+the keyword search falls back to the original `ilike` scans.
+"""
+
+import re
+
+import sqlalchemy as sa
+from sqlalchemy import or_
+from flask import current_app, has_app_context
+
+from app import db
+
+TOKENIZERS = ('unicode61', 'trigram')
+
+# {FTS table: (content table, indexed columns)}
+FTS_TABLES = {
+    'snippet_fts': ('snippet', ('title', 'description', 'code', 'tags')),
+    'leetcode_solution_fts': ('leetcode_solution', ('solution_code', 'explanation', 'classification')),
+    'leetcode_problem_fts': ('leetcode_problem', ('title', 'description', 'tags')),
+}
+
+
+def _create_statements(fts_table, content_table, columns, tokenizer):
+    cols = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    delete_old = (f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) "
+                  f"VALUES ('delete', old.id, {old_values});")
+    insert_new = f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts_table} USING fts5({cols}, content='{content_table}', "
+        f"content_rowid='id', tokenize='{tokenizer}')",
+        f"CREATE TRIGGER {fts_table}_ai AFTER INSERT ON {content_table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER {fts_table}_ad AFTER DELETE ON {content_table} BEGIN {delete_old} END",
+        f"CREATE TRIGGER {fts_table}_au AFTER UPDATE OF {cols} ON {content_table} "
+        f"BEGIN {delete_old} {insert_new} END",
+        f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')",
+    ]
+
+
+def create_fulltext_indexes(connection, tokenizer='unicode61'):
+    """
+    Creates (and populates) the FTS5 tables and their sync triggers.
+
+    Args:
+        connection: A SQLAlchemy connection to the application database.
+        tokenizer (str): 'unicode61' for word matching, or 'trigram' for
+                         substring matching inside code.
+
+    Returns:
+        bool: True if the indexes exist afterwards, False if the database
+              does not support FTS5.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    if tokenizer not in TOKENIZERS:
+        raise ValueError(f"Unsupported full-text tokenizer: {tokenizer}")
+
+    existing = set(connection.execute(sa.text(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")).scalars())
+    try:
+        with connection.begin_nested():
+            for fts_table, (content_table, columns) in FTS_TABLES.items():
+                if fts_table in existing:
+                    continue
+                for statement in _create_statements(fts_table, content_table, columns, tokenizer):
+                    connection.execute(sa.text(statement))
+    except sa.exc.OperationalError as e:
+        if has_app_context():
+            current_app.logger.warning(f"FTS5 unavailable, keyword search will use LIKE scans: {e}")
+        return False
+    return True
+
+
+def drop_fulltext_indexes(connection):
+    """Drops the FTS5 tables and their triggers, if present."""
+    if connection.dialect.name != 'sqlite':
+        return
+    for fts_table in FTS_TABLES:
+        for suffix in ('ai', 'ad', 'au'):
+            connection.execute(sa.text(f"DROP TRIGGER IF EXISTS {fts_table}_{suffix}"))
+        connection.execute(sa.text(f"DROP TABLE IF EXISTS {fts_table}"))
+
+
+@sa.event.listens_for(db.metadata, 'after_create')
+def _after_create(target, connection, **kw):
+    tokenizer = 'unicode61'
+    if has_app_context():
+        tokenizer = current_app.config['FULLTEXT_TOKENIZER']
+    create_fulltext_indexes(connection, tokenizer)
+
+
+@sa.event.listens_for(db.metadata, 'before_drop')
+def _before_drop(target, connection, **kw):
+    drop_fulltext_indexes(connection)
+
+
+def fulltext_tokenizer():
+    """
+    Returns the tokenizer of the installed FTS5 indexes, or None when they
+    are missing and keyword search must fall back to LIKE scans.
+    """
+    state = current_app.extensions.get('fulltext')
+    if state is None:
+        state = {'tokenizer': None}
+        if db.engine.dialect.name == 'sqlite':
+            sql = db.session.scalar(sa.text(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'snippet_fts'"))
+            if sql:
+                state['tokenizer'] = 'trigram' if 'trigram' in sql else 'unicode61'
+        current_app.extensions['fulltext'] = state
+    return state['tokenizer']
+
+
+def build_match_query(query, tokenizer):
+    """
+    Turns free text into a safe FTS5 MATCH expression.
+
+    With the trigram tokenizer the whole query is matched as a substring, like
+    the LIKE scan it replaces. Otherwise every word must match, as a prefix.
+
+    Returns:
+        str: The MATCH expression, or None if FTS5 cannot express the query.
+    """
+    if tokenizer == 'trigram':
+        query = query.strip()
+        if len(query) < 3:
+            return None  # Trigrams cannot match shorter strings
+        return '"' + query.replace('"', '""') + '"'
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _ranked_ids(sql, params):
+    try:
+        return db.session.scalars(sa.text(sql), params).all()
+    except sa.exc.OperationalError as e:
+        current_app.logger.warning(f"Full-text query failed, falling back to LIKE: {e}")
+        return None
+
+
+def keyword_snippet_ids(user_id, query):
+    """
+    Finds a user's snippets whose title, description, code or tags match a query.
+
+    Args:
+        user_id (int): The owner of the snippets.
+        query (str): The search text.
+
+    Returns:
+        list: Matching snippet ids, best BM25 match first when FTS5 is used.
+    """
+    from app.models import Snippet
+
+    tokenizer = fulltext_tokenizer()
+    match = build_match_query(query, tokenizer) if tokenizer else None
+    ids = None
+    if match is not None:
+        ids = _ranked_ids(
+            "SELECT snippet_fts.rowid FROM snippet_fts "
+            "JOIN snippet ON snippet.id = snippet_fts.rowid "
+            "WHERE snippet_fts MATCH :match AND snippet.user_id = :user_id "
+            "ORDER BY bm25(snippet_fts)",
+            {'match': match, 'user_id': user_id})
+
+    if ids is None:
+        ids = db.session.scalars(
+            sa.select(Snippet.id).where(
+                Snippet.user_id == user_id,
+                or_(
+                    Snippet.title.ilike(f'%{query}%'),
+                    Snippet.description.ilike(f'%{query}%'),
+                    Snippet.code.ilike(f'%{query}%'),
+                    Snippet.tags.ilike(f'%{query}%')
+                )
+            )
+        ).all()
+    return ids
+
+
+def keyword_solution_ids(query):
+    """
+    Finds approved solutions whose own text or problem matches a query.
+
+    Args:
+        query (str): The search text.
+
+    Returns:
+        list: Matching solution ids, best BM25 match first when FTS5 is used.
+    """
+    from app.models import LeetcodeProblem, LeetcodeSolution
+
+    tokenizer = fulltext_tokenizer()
+    match = build_match_query(query, tokenizer) if tokenizer else None
+    ids = None
+    if match is not None:
+        # A solution matches through its own text or through its problem's text
+        ids = _ranked_ids(
+            "SELECT matches.id FROM ("
+            "  SELECT leetcode_solution_fts.rowid AS id, bm25(leetcode_solution_fts) AS rank"
+            "  FROM leetcode_solution_fts WHERE leetcode_solution_fts MATCH :match"
+            "  UNION ALL"
+            "  SELECT leetcode_solution.id, bm25(leetcode_problem_fts)"
+            "  FROM leetcode_problem_fts"
+            "  JOIN leetcode_solution ON leetcode_solution.problem_id = leetcode_problem_fts.rowid"
+            "  WHERE leetcode_problem_fts MATCH :match"
+            ") AS matches "
+            "JOIN leetcode_solution ON leetcode_solution.id = matches.id "
+            "WHERE leetcode_solution.approved = 1 "
+            "GROUP BY matches.id ORDER BY MIN(matches.rank)",
+            {'match': match})
+
+    if ids is None:
+        ids = db.session.scalars(
+            sa.select(LeetcodeSolution.id).where(
+                LeetcodeSolution.approved == True,
+                or_(
+                    LeetcodeSolution.solution_code.ilike(f'%{query}%'),
+                    LeetcodeSolution.explanation.ilike(f'%{query}%'),
+                    LeetcodeSolution.classification.ilike(f'%{query}%'),
+                    LeetcodeSolution.problem.has(LeetcodeProblem.title.ilike(f'%{query}%')),
+                    LeetcodeSolution.problem.has(LeetcodeProblem.description.ilike(f'%{query}%')),
+                    LeetcodeSolution.problem.has(LeetcodeProblem.tags.ilike(f'%{query}%'))
+                )
+            )
+        ).all()
+    return ids
@@ -0,0 +1,126 @@
+"""Keeps the in-memory indexes of every process in step with the database.
+
+Each process builds its snippet, duplicate and solution indexes lazily and
+keeps them in memory, but the data behind them is also changed by other web
+workers, `flask jobs work` and `flask embeddings backfill`. Whoever changes
+that data bumps a counter in the `index_version` table after committing.
+Before an index is used its version is compared with the stored one and
+the index is rebuilt if they differ; cached search results are keyed by
+the version too. A process that already applied its own change to an index
+in place just advances the index to the version it bumped to.
+"""
+
+import threading
+
+import sqlalchemy as sa
+
+from app import db
+from app.models import IndexVersion
+
+SOLUTIONS_SCOPE = 'solutions'
+
+
+def snippet_scope(user_id):
+    """Returns the scope of one user's snippet indexes and cached searches."""
+    return f'snippets:{user_id}'
+
+
+def current_version(scope):
+    """Returns the stored version of a scope, 0 if it never changed."""
+    version = db.session.scalar(sa.select(IndexVersion.version).where(IndexVersion.scope == scope))
+    return version or 0
+
+
+def bump_version(scope):
+    """
+    Records that the data of a scope changed, in its own transaction.
+
+    Call it after committing the change.
+
+    Returns:
+        int: The new version.
+    """
+    for attempt in range(2):
+        try:
+            updated = db.session.execute(
+                sa.update(IndexVersion).where(IndexVersion.scope == scope)
+                .values(version=IndexVersion.version + 1)
+                .execution_options(synchronize_session=False)).rowcount
+            if not updated:
+                db.session.add(IndexVersion(scope=scope, version=1))
+                db.session.flush()
+            version = current_version(scope)
+            db.session.commit()
+            return version
+        except sa.exc.IntegrityError:
+            # Another process created the scope first; update its row instead
+            db.session.rollback()
+            if attempt:
+                raise
+
+
+class UserIndexRegistry:
+    """
+    Lazily builds and caches one index per user, rebuilding it once another
+    process changed the user's snippets. Subclasses implement `_build` and `_upsert`.
+    """
+
+    def __init__(self):
+        self._indexes = {}  # {user_id: (index, version it was built at)}
+        self._lock = threading.Lock()
+
+    def _build(self, user_id):
+        raise NotImplementedError
+
+    def _upsert(self, index, snippet):
+        raise NotImplementedError
+
+    def get(self, user_id):
+        """
+        Returns the index for a user, building it from the database on first use
+        or when it is out of date.
+
+        Args:
+            user_id (int): The id of the user.
+        """
+        # Read before building, so changes committed during the build trigger another one
+        version = current_version(snippet_scope(user_id))
+        with self._lock:
+            entry = self._indexes.get(user_id)
+            if entry is None or entry[1] != version:
+                entry = self._indexes[user_id] = (self._build(user_id), version)
+            return entry[0]
+
+    def update(self, snippet):
+        """Indexes (or re-indexes) a snippet after it has been committed."""
+        with self._lock:
+            entry = self._indexes.get(snippet.user_id)
+        if entry is not None:
+            self._upsert(entry[0], snippet)
+
+    def remove(self, user_id, snippet_id):
+        """Drops a deleted snippet, or one whose embedding is stale, from its owner's index."""
+        with self._lock:
+            entry = self._indexes.get(user_id)
+        if entry is not None:
+            entry[0].remove(snippet_id)
+
+    def advance(self, user_id, version):
+        """
+        Marks a user's index as current at `version` after this process bumped
+        it to that, having applied its change in place. An index that missed
+        a change of another process in between is dropped instead.
+        """
+        with self._lock:
+            entry = self._indexes.get(user_id)
+            if entry is None:
+                return
+            if entry[1] == version - 1:
+                self._indexes[user_id] = (entry[0], version)
+            else:
+                del self._indexes[user_id]
+
+    def clear(self):
+        """Drops every cached index; they are rebuilt on next use."""
+        with self._lock:
+            self._indexes.clear()
@@ -0,0 +1,324 @@
+"""A small database-backed job queue for slow AI work on the write path.
+
+Routes add Job rows in the same transaction as the data they refer to (an
+outbox), commit, and call `dispatch()`. Jobs are then run by a pool of
+worker threads in the web process, or by a separate `flask jobs work`
+process, depending on JOB_QUEUE_MODE:
+
+    'threads'  - an in-process pool of JOB_WORKERS threads, started on first use
+    'external' - only `flask jobs work` (or `flask jobs run`) processes jobs
+    'eager'    - jobs run inside the request right after it commits
+
+Failed jobs are retried with exponential backoff up to `max_attempts` times.
+Handlers bump the index versions of what they changed (see app.index_versions),
+so the web processes rebuild their search indexes whichever process ran the job.
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app import db
+from app.models import Job
+
+JOB_MODES = ('threads', 'external', 'eager')
+
+# {job kind: handler function}
+HANDLERS = {}
+
+
+class JobError(Exception):
+    """Raised by a job handler to fail the current attempt and retry later."""
+
+
+def job_handler(kind):
+    """Registers a function as the handler for one kind of job."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload, user_id=None, subject=None):
+    """
+    Adds a job to the session; it is queued when the caller commits.
+
+    Args:
+        kind (str): A registered job kind, e.g. 'embed_snippet'.
+        payload (dict): JSON-serializable keyword arguments for the handler.
+        user_id (int): The user allowed to see the job's status.
+        subject (str): What the job works on, e.g. 'solution:12'.
+
+    Returns:
+        Job: The pending job.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job(kind=kind, payload=json.dumps(payload), user_id=user_id, subject=subject,
+              max_attempts=current_app.config['JOB_MAX_ATTEMPTS'])
+    db.session.add(job)
+    return job
+
+
+def _claim():
+    """Atomically marks the next due job as running and returns it, or None."""
+    now = datetime.utcnow()
+    # Jobs left running longer than the lease belong to a worker that died
+    expired = now - timedelta(seconds=current_app.config['JOB_LEASE_SECONDS'])
+    due = sa.or_(
+        sa.and_(Job.status == 'pending', Job.run_after <= now),
+        sa.and_(Job.status == 'running', Job.started_at < expired),
+    )
+    while True:
+        candidate = db.session.execute(
+            sa.select(Job.id, Job.status).where(due).order_by(Job.run_after, Job.id).limit(1)).first()
+        if candidate is None:
+            db.session.commit()
+            return None
+        claimed = db.session.execute(
+            sa.update(Job).where(Job.id == candidate.id, Job.status == candidate.status, due)
+            .values(status='running', attempts=Job.attempts + 1, started_at=now)
+            .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, candidate.id, populate_existing=True)
+
+
+def _backoff(attempts):
+    base = current_app.config['JOB_RETRY_BACKOFF']
+    return min(base * 2 ** (attempts - 1), 3600)
+
+
+def run_next_job():
+    """
+    Claims and runs one due job in the current thread.
+
+    Returns:
+        bool: True if a job was run, False if none was due.
+    """
+    job = _claim()
+    if job is None:
+        return False
+    job_id, kind, payload = job.id, job.kind, json.loads(job.payload)
+
+    try:
+        result = HANDLERS[kind](**payload)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.error = str(e) or type(e).__name__
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            current_app.logger.error(f"Job {job_id} ({kind}) failed for good: {job.error}")
+        else:
+            job.status = 'pending'
+            job.run_after = datetime.utcnow() + timedelta(seconds=_backoff(job.attempts))
+            current_app.logger.warning(f"Job {job_id} ({kind}) failed, retrying: {job.error}")
+        db.session.commit()
+        return True
+
+    job = db.session.get(Job, job_id)
+    job.status = 'done'
+    job.result = json.dumps(result) if result is not None else None
+    job.error = None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+def run_pending_jobs():
+    """Runs jobs in the current thread until none are due; returns how many ran."""
+    count = 0
+    while run_next_job():
+        count += 1
+    return count
+
+
+class JobWorkerPool:
+    """Worker threads that run jobs until stopped, waking early on `notify()`."""
+
+    def __init__(self, app, size=2, poll_interval=5.0):
+        self.app = app
+        self.size = size
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for number in range(self.size):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        """Wakes idle workers because new jobs were committed."""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """Stops the workers after their current job."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    ran = run_next_job()
+                    db.session.remove()
+            except Exception:
+                self.app.logger.exception("Job worker error")
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+
+_pool_lock = threading.Lock()
+
+
+def worker_pool():
+    """Returns the application's in-process worker pool, starting it on first use."""
+    pool = current_app.extensions.get('job_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = current_app.extensions.get('job_pool')
+            if pool is None:
+                pool = JobWorkerPool(current_app._get_current_object(),
+                                     size=current_app.config['JOB_WORKERS'],
+                                     poll_interval=current_app.config['JOB_POLL_INTERVAL'])
+                pool.start()
+                current_app.extensions['job_pool'] = pool
+    return pool
+
+
+def dispatch():
+    """Hands committed jobs to the workers, according to JOB_QUEUE_MODE."""
+    mode = current_app.config['JOB_QUEUE_MODE']
+    if mode not in JOB_MODES:
+        raise ValueError(f"Unsupported job queue mode: {mode}")
+    if mode == 'eager':
+        run_pending_jobs()
+    elif mode == 'threads':
+        worker_pool().notify()
+
+
+def _fan_out_executor():
+    executor = current_app.extensions.get('ai_fan_out_executor')
+    if executor is None:
+        with _pool_lock:
+            executor = current_app.extensions.get('ai_fan_out_executor')
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=current_app.config['AI_FAN_OUT_WORKERS'],
+                                              thread_name_prefix='ai-fan-out')
+                current_app.extensions['ai_fan_out_executor'] = executor
+    return executor
+
+
+def fan_out(calls, timeout):
+    """
+    Runs independent AI calls concurrently and waits for them until a shared deadline.
+
+    Args:
+        calls (dict): {name: zero-argument function}, each run in an app context.
+        timeout (float): Seconds to wait for all of them together.
+
+    Returns:
+        dict: {name: result} for the calls that finished in time without raising.
+              Calls that are still running are left to finish in the background.
+    """
+    app = current_app._get_current_object()
+
+    def run(func):
+        with app.app_context():
+            return func()
+
+    deadline = time.monotonic() + timeout
+    futures = {name: _fan_out_executor().submit(run, func) for name, func in calls.items()}
+    wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+    results = {}
+    for name, future in futures.items():
+        if not future.done():
+            current_app.logger.warning(f"AI call {name} missed its deadline")
+        elif future.exception() is not None:
+            current_app.logger.error(f"AI call {name} failed: {future.exception()}")
+        else:
+            results[name] = future.result()
+    return results
+
+
+# --- Job handlers ---
+
+@job_handler('embed_snippet')
+def embed_snippet(snippet_id):
+    """Embeds a snippet and refreshes its search index, related snippets and cached searches."""
+    from app.models import Snippet
+    from app.related import update_related_snippets
+    from app.search import invalidate_snippet_searches
+    from app.vector_index import snippet_indexes
+
+    snippet = db.session.get(Snippet, snippet_id)
+    if snippet is None:
+        return None  # Deleted in the meantime
+    snippet.generate_and_set_embedding()
+    if snippet.embedding_data is None:
+        raise JobError("The embedding API returned no embedding.")
+    db.session.commit()
+    snippet_indexes().update(snippet)
+    update_related_snippets(snippet)
+    invalidate_snippet_searches(snippet.user_id)
+    return {'snippet_id': snippet_id}
+
+
+@job_handler('enrich_solution')
+def enrich_solution(solution_id):
+    """
+    Writes the AI explanation, classification and embedding of a solution.
+
+    The explanation and classification are requested concurrently under one
+    deadline (SOLUTION_AI_DEADLINE), and the embedding follows as soon as the
+    explanation it includes is known. Whatever succeeded is saved even if
+    another part failed; the retry then only repeats the missing parts.
+    """
+    from app import ai_services
+    from app.models import LeetcodeSolution
+    from app.vector_index import update_solution
+
+    solution = db.session.get(LeetcodeSolution, solution_id)
+    if solution is None:
+        return None
+    code, title, description, language = (solution.solution_code, solution.problem.title,
+                                          solution.problem.description, solution.language)
+    calls = {}
+    if solution.explanation is None:
+        calls['explanation'] = lambda: ai_services.explain_leetcode_solution(code, title, language)
+    if solution.classification is None:
+        calls['classification'] = lambda: ai_services.classify_leetcode_solution(code, description)
+
+    missing = []
+    results = fan_out(calls, current_app.config['SOLUTION_AI_DEADLINE'])
+    for name in calls:
+        result = results.get(name)
+        if result is None or result.startswith("Error:"):
+            missing.append(name)
+        else:
+            setattr(solution, name, result)
+
+    if solution.explanation is not None:
+        solution.generate_and_set_embedding()
+        if solution.embedding_data is None:
+            missing.append('embedding')
+    db.session.commit()
+    if solution.embedding_data is not None:
+        update_solution(solution)
+    if missing:
+        raise JobError(f"Could not generate the {', '.join(missing)}.")
+    return {'solution_id': solution_id}
@@ -2,9 +2,26 @@
 
 from datetime import datetime
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask import current_app
 from flask_login import UserMixin
 from app import db, login_manager
+from app.embeddings import encode_embedding, decode_embedding, content_hash
+
+
+def _encode_model_embedding(vector):
+    """Encodes an embedding from the configured provider for storage, tagged with its name."""
+    from app import ai_services
+    return encode_embedding(vector, ai_services.embedding_model_name(),
+                            dtype=current_app.config['EMBEDDING_STORAGE_DTYPE'])
+
+
+def _decode_model_embedding(data):
+    """Decodes a stored embedding, or returns None if another provider made it."""
+    from app import ai_services
+    return decode_embedding(data, ai_services.embedding_model_name())
 
 
 @login_manager.user_loader
@@ -73,6 +90,85 @@ class Collection(db.Model):
         return f'<Collection {self.name}>'
 
 
+class Tag(db.Model):
+    """A normalized tag shared by snippets and Leetcode problems."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_tag_name', 'name', unique=True),
+    )
+
+    @staticmethod
+    def normalize(name):
+        """Returns the canonical form of a tag name: trimmed, lowercase, at most 50 characters."""
+        return ' '.join(name.split()).lower()[:50]
+
+    @classmethod
+    def split(cls, tags):
+        """
+        Splits a comma-separated tag string into unique normalized names.
+
+        Args:
+            tags (str): e.g. "SQLAlchemy, orm,  sqlalchemy", or None.
+
+        Returns:
+            list: The names in their original order, e.g. ['sqlalchemy', 'orm'].
+        """
+        names = []
+        for part in (tags or '').split(','):
+            name = cls.normalize(part)
+            if name and name not in names:
+                names.append(name)
+        return names
+
+    @classmethod
+    def _insert_missing(cls, names):
+        """Inserts tag names, skipping any that exist, even if a concurrent transaction just added them."""
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = (sqlite if dialect == 'sqlite' else postgresql).insert(cls.__table__)
+            statement = insert.on_conflict_do_nothing(index_elements=['name'])
+        else:
+            statement = cls.__table__.insert().prefix_with('IGNORE', dialect='mysql')
+        db.session.execute(statement, [{'name': name} for name in names])
+
+    @classmethod
+    def resolve(cls, names):
+        """Returns the Tag rows for the given names, creating any that are missing."""
+        if not names:
+            return []
+        # No autoflush: this runs while the owning object may still be half-built
+        with db.session.no_autoflush:
+            existing = {tag.name: tag for tag in db.session.scalars(
+                sa.select(cls).where(cls.name.in_(names)))}
+            missing = [name for name in names if name not in existing]
+            if missing:
+                cls._insert_missing(missing)
+                existing.update((tag.name, tag) for tag in db.session.scalars(
+                    sa.select(cls).where(cls.name.in_(missing))))
+        return [existing[name] for name in names]
+
+    def __repr__(self):
+        return f'<Tag {self.name}>'
+
+
+# Association tables; the (tag_id, item) indexes serve "everything with this tag" lookups
+snippet_tag = db.Table(
+    'snippet_tag',
+    db.Column('snippet_id', db.Integer, db.ForeignKey('snippet.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_snippet_tag_tag_id', 'tag_id', 'snippet_id'),
+)
+
+problem_tag = db.Table(
+    'problem_tag',
+    db.Column('problem_id', db.Integer, db.ForeignKey('leetcode_problem.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_problem_tag_tag_id', 'tag_id', 'problem_id'),
+)
+
+
 class Snippet(db.Model):
     """Represents a code snippet in the database."""
     id = db.Column(db.Integer, primary_key=True)
@@ -82,30 +178,154 @@ class Snippet(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     tags = db.Column(db.String(200), nullable=True)
-    embedding = db.Column(db.JSON, nullable=True)
+    embedding_data = db.Column(db.LargeBinary, nullable=True) # Encoded with app.embeddings
+    embedding_hash = db.Column(db.String(64), nullable=True) # SHA-256 of the text that was embedded
     collection_id = db.Column(db.Integer, db.ForeignKey('collection.id'), nullable=True)
     language = db.Column(db.String(50), nullable=False, default='python')
+    # Normalized copy of `tags`, kept in sync whenever `tags` is assigned
+    tag_list = db.relationship('Tag', secondary=snippet_tag, lazy='selectin', order_by='Tag.name')
 
     __table_args__ = (
         db.Index('ix_snippet_timestamp', 'timestamp'),
         db.Index('ix_snippet_user_id', 'user_id'),
+        db.Index('ix_snippet_user_id_language', 'user_id', 'language'),
     )
 
-    def generate_and_set_embedding(self):
-        """Generates and saves a vector embedding for the snippet's content."""
+    @validates('tags')
+    def _sync_tags(self, key, tags):
+        # Only the Tag rows are normalized; the text is kept as the user typed it
+        self.tag_list = Tag.resolve(Tag.split(tags))
+        return tags
+
+    @property
+    def embedding(self):
+        """The snippet's embedding as a read-only NumPy array, or None (also if another provider made it)."""
+        return _decode_model_embedding(self.embedding_data)
+
+    @embedding.setter
+    def embedding(self, vector):
+        self.embedding_data = _encode_model_embedding(vector)
+
+    def embedding_text(self):
+        """Returns the text that the snippet's embedding is generated from."""
+        # Combine the most important text fields for a rich embedding
+        return f"Title: {self.title}\nDescription: {self.description}\nCode: {self.code}"
+
+    def generate_and_set_embedding(self, force=False):
+        """
+        Generates and saves a vector embedding for the snippet's content.
+
+        The API call is skipped when the stored embedding was already built
+        from identical text by the current provider, unless `force` is set.
+        """
         # Import locally to avoid circular dependencies at startup
         from app import ai_services
 
-        # Combine the most important text fields for a rich embedding
-        text_to_embed = f"Title: {self.title}\nDescription: {self.description}\nCode: {self.code}"
+        text_to_embed = self.embedding_text()
+        text_hash = content_hash(text_to_embed)
+        if not force and self.embedding is not None and self.embedding_hash == text_hash:
+            return
         self.embedding = ai_services.generate_embedding(
             text_to_embed, task_type="RETRIEVAL_DOCUMENT")
+        self.embedding_hash = text_hash if self.embedding_data is not None else None
+
+    def copy_embedding_from(self, other):
+        """
+        Reuses another snippet's stored embedding instead of calling the API.
+
+        Call it once the copy's own fields are set. The hash is taken from the
+        copy's text, which only differs by its title, so the embedding is not
+        considered stale by backfills and the next edit.
+        """
+        self.embedding_data = other.embedding_data
+        self.embedding_hash = content_hash(self.embedding_text()) if other.embedding_data is not None else None
 
     def __repr__(self):
         """String representation of the Snippet object."""
         return f'<Snippet {self.title}>'
 
 
+class SnippetNeighbor(db.Model):
+    """One edge of the precomputed related-snippets graph (see app.related)."""
+    snippet_id = db.Column(db.Integer, db.ForeignKey('snippet.id', ondelete='CASCADE'), primary_key=True)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey('snippet.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False) # Cosine similarity of the two embeddings
+
+    __table_args__ = (
+        db.Index('ix_snippet_neighbor_neighbor_id', 'neighbor_id'),
+    )
+
+    def __repr__(self):
+        return f'<SnippetNeighbor {self.snippet_id} -> {self.neighbor_id}>'
+
+
+class AIResponseCache(db.Model):
+    """A cached Gemini response, keyed by a hash of the call (see app.ai_cache)."""
+    key = db.Column(db.String(64), primary_key=True) # SHA-256 of function, model, prompt version and inputs
+    function = db.Column(db.String(64), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow) # For the TTL
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow) # For LRU eviction
+    hits = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_ai_response_cache_last_used_at', 'last_used_at'),
+        db.Index('ix_ai_response_cache_function', 'function'),
+    )
+
+    def __repr__(self):
+        return f'<AIResponseCache {self.function} {self.key[:8]}>'
+
+
+class Job(db.Model):
+    """A unit of background AI work, queued in the same transaction as its data (see app.jobs)."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False) # e.g. 'embed_snippet'
+    payload = db.Column(db.Text, nullable=False) # JSON keyword arguments for the handler
+    subject = db.Column(db.String(64), nullable=True) # What the job works on, e.g. 'solution:12'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # Not retried before this
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    result = db.Column(db.Text, nullable=True) # JSON
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+        db.Index('ix_job_subject', 'subject'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'error': self.error,
+        }
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+
+class IndexVersion(db.Model):
+    """A counter bumped whenever the data behind an in-memory index changes (see app.index_versions)."""
+    scope = db.Column(db.String(64), primary_key=True) # e.g. 'snippets:3' or 'solutions'
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<IndexVersion {self.scope} {self.version}>'
+
+
 class Point(db.Model):
     """Represents points awarded to a user for gamification."""
     id = db.Column(db.Integer, primary_key=True)
@@ -171,6 +391,8 @@ class LeetcodeProblem(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id')) # User who added the problem
 
     solutions = db.relationship('LeetcodeSolution', backref='problem', lazy='dynamic')
+    # Normalized copy of `tags`, kept in sync whenever `tags` is assigned
+    tag_list = db.relationship('Tag', secondary=problem_tag, lazy='selectin', order_by='Tag.name')
 
     __table_args__ = (
         db.Index('ix_leetcode_problem_title', 'title', unique=True),
@@ -178,6 +400,12 @@ class LeetcodeProblem(db.Model):
         db.Index('ix_leetcode_problem_timestamp', 'timestamp'),
     )
 
+    @validates('tags')
+    def _sync_tags(self, key, tags):
+        # Only the Tag rows are normalized; the text is kept as the user typed it
+        self.tag_list = Tag.resolve(Tag.split(tags))
+        return tags
+
     def __repr__(self):
         return f'<LeetcodeProblem {self.title}>'
 
@@ -192,20 +420,38 @@ class LeetcodeSolution(db.Model):
     classification = db.Column(db.String(255), nullable=True) # e.g., "Dynamic Programming, BFS"
     approved = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    embedding = db.Column(db.JSON, nullable=True) # For semantic search of solutions
+    embedding_data = db.Column(db.LargeBinary, nullable=True) # For semantic search of solutions
+    embedding_hash = db.Column(db.String(64), nullable=True) # SHA-256 of the text that was embedded
 
     __table_args__ = (
         db.Index('ix_leetcode_solution_problem_id', 'problem_id'),
         db.Index('ix_leetcode_solution_user_id', 'user_id'),
         db.Index('ix_leetcode_solution_approved', 'approved'),
+        db.Index('ix_leetcode_solution_language', 'language'),
         db.Index('ix_leetcode_solution_timestamp', 'timestamp'),
     )
 
-    def generate_and_set_embedding(self):
+    @property
+    def embedding(self):
+        """The solution's embedding as a read-only NumPy array, or None (also if another provider made it)."""
+        return _decode_model_embedding(self.embedding_data)
+
+    @embedding.setter
+    def embedding(self, vector):
+        self.embedding_data = _encode_model_embedding(vector)
+
+    def embedding_text(self):
+        return f"Problem: {self.problem.title}\nSolution: {self.solution_code}\nExplanation: {self.explanation}"
+
+    def generate_and_set_embedding(self, force=False):
         from app import ai_services
-        text_to_embed = f"Problem: {self.problem.title}\nSolution: {self.solution_code}\nExplanation: {self.explanation}"
+        text_to_embed = self.embedding_text()
+        text_hash = content_hash(text_to_embed)
+        if not force and self.embedding is not None and self.embedding_hash == text_hash:
+            return
         self.embedding = ai_services.generate_embedding(
             text_to_embed, task_type="RETRIEVAL_DOCUMENT")
+        self.embedding_hash = text_hash if self.embedding_data is not None else None
 
     def __repr__(self):
         return f'<LeetcodeSolution for {self.problem.title} by {self.contributor.username}>'
@@ -0,0 +1,174 @@
+"""Precomputed "related snippets": a k-nearest-neighbour graph over each
+user's snippet embeddings.
+
+The graph is stored as SnippetNeighbor rows, so rendering a snippet's related
+snippets is an indexed lookup. It is built in batch with blocked matrix
+products and kept up to date incrementally as snippets change.
+"""
+
+import numpy as np
+import sqlalchemy as sa
+from flask import current_app
+
+from app import db
+from app.models import Snippet, SnippetNeighbor
+from app.vector_index import snippet_indexes
+
+_BLOCK = 1024 # Rows scored per matrix product when building a whole graph
+
+
+def knn_graph(ids, matrix, k):
+    """
+    Finds the `k` nearest neighbours of every row of a normalized matrix.
+
+    Args:
+        ids (np.ndarray): The item id of each row.
+        matrix (np.ndarray): One L2-normalized embedding per row.
+        k (int): Neighbours per item.
+
+    Returns:
+        tuple: (source ids, neighbour ids, scores) as parallel NumPy arrays,
+               each source's neighbours best first.
+    """
+    n = ids.shape[0]
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    sources, neighbors, scores = [], [], []
+    for start in range(0, n, _BLOCK):
+        block = matrix[start:start + _BLOCK] @ matrix.T
+        rows = np.arange(block.shape[0])
+        block[rows, start + rows] = -np.inf  # An item is not its own neighbour
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        sources.append(np.repeat(ids[start:start + block.shape[0]], k))
+        neighbors.append(ids[top].ravel())
+        scores.append(np.take_along_axis(top_scores, order, axis=1).ravel())
+    return np.concatenate(sources), np.concatenate(neighbors), np.concatenate(scores)
+
+
+def _user_snippet_ids(user_id):
+    return sa.select(Snippet.id).where(Snippet.user_id == user_id)
+
+
+def _insert_edges(sources, neighbors, scores):
+    rows = [{'snippet_id': int(s), 'neighbor_id': int(t), 'score': float(v)}
+            for s, t, v in zip(sources, neighbors, scores)]
+    if rows:
+        db.session.execute(sa.insert(SnippetNeighbor), rows)
+
+
+def rebuild_related_snippets(user_id):
+    """
+    Recomputes the whole related-snippets graph for one user and commits it.
+
+    Returns:
+        int: The number of edges stored.
+    """
+    index = snippet_indexes().get(user_id)
+    sources, neighbors, scores = knn_graph(
+        index.ids.copy(), index.matrix, current_app.config['RELATED_SNIPPETS_K'])
+    db.session.execute(sa.delete(SnippetNeighbor).where(
+        SnippetNeighbor.snippet_id.in_(_user_snippet_ids(user_id))))
+    _insert_edges(sources, neighbors, scores)
+    db.session.commit()
+    return len(sources)
+
+
+def _refill(index, snippet_ids, k):
+    """Recomputes the neighbour lists of specific snippets from the index."""
+    snippets = db.session.scalars(sa.select(Snippet).where(Snippet.id.in_(snippet_ids))).all()
+    db.session.execute(sa.delete(SnippetNeighbor).where(SnippetNeighbor.snippet_id.in_(snippet_ids)))
+    for snippet in snippets:
+        ids, scores = index.search(snippet.embedding, k=k + 1)
+        keep = ids != snippet.id
+        ids, scores = ids[keep][:k], scores[keep][:k]
+        _insert_edges(np.full(ids.shape[0], snippet.id), ids, scores)
+
+
+def update_related_snippets(snippet):
+    """
+    Updates the graph after a snippet was created or edited, and commits.
+
+    The snippet gets a fresh neighbour list, snippets that listed it are
+    recomputed, and it is added to every other snippet's list it now
+    belongs in, using one scoring pass over the user's index.
+    """
+    k = current_app.config['RELATED_SNIPPETS_K']
+    index = snippet_indexes().get(snippet.user_id)
+
+    # Snippets that listed the old version of this snippet must be recomputed
+    affected = set(db.session.scalars(sa.select(SnippetNeighbor.snippet_id).where(
+        SnippetNeighbor.neighbor_id == snippet.id)))
+    db.session.execute(sa.delete(SnippetNeighbor).where(sa.or_(
+        SnippetNeighbor.snippet_id == snippet.id, SnippetNeighbor.neighbor_id == snippet.id)))
+
+    if snippet.id in index:
+        ids, scores = index.search(snippet.embedding)
+        keep = ids != snippet.id
+        ids, scores = ids[keep], scores[keep]
+        _insert_edges(np.full(min(k, ids.shape[0]), snippet.id), ids[:k], scores[:k])
+
+        # Offer the snippet to every other snippet whose list it would improve
+        lists = {source: (count, weakest) for source, count, weakest in db.session.execute(
+            sa.select(SnippetNeighbor.snippet_id, sa.func.count(), sa.func.min(SnippetNeighbor.score))
+            .where(SnippetNeighbor.snippet_id.in_(_user_snippet_ids(snippet.user_id)))
+            .group_by(SnippetNeighbor.snippet_id))}
+        improved = [(other, score) for other, score in zip(ids.tolist(), scores.tolist())
+                    if other not in affected and
+                    (lists.get(other, (0, None))[0] < k or score > lists[other][1])]
+        _insert_edges([other for other, _ in improved], np.full(len(improved), snippet.id),
+                      [score for _, score in improved])
+        full = [other for other, _ in improved if lists.get(other, (0, None))[0] >= k]
+        if full:
+            _drop_weakest(full)
+
+    affected.discard(snippet.id)
+    if affected:
+        _refill(index, affected, k)
+    db.session.commit()
+
+
+def _drop_weakest(snippet_ids):
+    """Deletes the lowest-scoring edge of each of the given snippets."""
+    weakest = sa.select(SnippetNeighbor.snippet_id, sa.func.min(SnippetNeighbor.score).label('score')).where(
+        SnippetNeighbor.snippet_id.in_(snippet_ids)).group_by(SnippetNeighbor.snippet_id).subquery()
+    edges = db.session.execute(sa.select(SnippetNeighbor.snippet_id, SnippetNeighbor.neighbor_id).join(
+        weakest, sa.and_(weakest.c.snippet_id == SnippetNeighbor.snippet_id,
+                         weakest.c.score == SnippetNeighbor.score))).all()
+    dropped = set()
+    for source, neighbor in edges:
+        if source not in dropped:
+            dropped.add(source)
+            db.session.execute(sa.delete(SnippetNeighbor).where(
+                SnippetNeighbor.snippet_id == source, SnippetNeighbor.neighbor_id == neighbor))
+
+
+def remove_related_snippet(user_id, snippet_id):
+    """Removes a deleted snippet from the graph, refills the lists it was in, and commits."""
+    affected = set(db.session.scalars(sa.select(SnippetNeighbor.snippet_id).where(
+        SnippetNeighbor.neighbor_id == snippet_id)))
+    db.session.execute(sa.delete(SnippetNeighbor).where(sa.or_(
+        SnippetNeighbor.snippet_id == snippet_id, SnippetNeighbor.neighbor_id == snippet_id)))
+    affected.discard(snippet_id)
+    if affected:
+        _refill(snippet_indexes().get(user_id), affected, current_app.config['RELATED_SNIPPETS_K'])
+    db.session.commit()
+
+
+def related_snippets(snippet):
+    """
+    Returns a snippet's precomputed related snippets.
+
+    Returns:
+        list: (Snippet, similarity) pairs, most similar first.
+    """
+    return db.session.execute(
+        sa.select(Snippet, SnippetNeighbor.score)
+        .join(SnippetNeighbor, SnippetNeighbor.neighbor_id == Snippet.id)
+        .where(SnippetNeighbor.snippet_id == snippet.id)
+        .order_by(SnippetNeighbor.score.desc())
+    ).all()
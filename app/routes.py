@@ -1,36 +1,68 @@
 """Defines the routes and view functions for the Sophia application."""
 
-import numpy as np
+import json
+
 import sqlalchemy as sa
-from sqlalchemy import or_
 from flask import (Blueprint, render_template, flash, redirect, url_for,
-                   request, current_app, jsonify)
+                   request, current_app, jsonify, Response, stream_with_context)
 from flask_login import current_user, login_user, logout_user, login_required
 
 from app import db, ai_services
-from app.ai_services import cosine_similarity
+from app.ai_services import AIStreamError
 from app.forms import (RegistrationForm, LoginForm, SnippetForm,
                        AIGenerationForm, CollectionForm,
-                       LeetcodeProblemForm, GenerateSolutionForm, ApproveSolutionForm)
-from app.models import User, Snippet, Collection, LeetcodeProblem, LeetcodeSolution
+                       LeetcodeProblemForm, GenerateSolutionForm, ApproveSolutionForm,
+                       MoveSnippetForm)
+from app.models import User, Snippet, Collection, LeetcodeProblem, LeetcodeSolution, Job
+from app.search import (search_snippets, search_approved_solutions, invalidate_snippet_searches,
+                        snippet_criteria)
+from app.vector_index import snippet_indexes, update_solution
+from app.dedup import duplicate_indexes
+from app.embeddings import content_hash
+from app.related import related_snippets, update_related_snippets, remove_related_snippet
+from app.jobs import enqueue, dispatch
+from app.collection_tree import collection_tree, subtree, descendant_ids
+from app.throttle import RateLimitExceeded
 from io import StringIO
 
 # Create the main Blueprint
 bp = Blueprint('main', __name__)
 
 
+@bp.errorhandler(RateLimitExceeded)
+def rate_limit_exceeded(e):
+    """Rejects an AI request over its rate budget with a 429 (JSON) or a flashed warning."""
+    retry_after = str(max(1, round(e.retry_after)))
+    if request.is_json:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': retry_after}
+    flash(str(e), 'warning')
+    return redirect(request.referrer or url_for('main.index')), 302, {'Retry-After': retry_after}
+
+
+def _list_filters():
+    """Returns the tag and language filters set in the query string, e.g. {'tag': 'sqlalchemy'}."""
+    filters = {}
+    for name in ('tag', 'language'):
+        value = request.args.get(name, '').strip()
+        if value:
+            filters[name] = value
+    return filters
+
+
 @bp.route('/')
 @bp.route('/index')
 def index():
     """Renders the homepage, displaying snippets for logged-in users."""
     page = request.args.get('page', 1, type=int)
+    filters = _list_filters()
     pagination = None
     if current_user.is_authenticated:
         # Query for the user's snippets and paginate the results
-        pagination = current_user.snippets.order_by(Snippet.timestamp.desc()).paginate(
+        pagination = current_user.snippets.filter(*snippet_criteria(**filters)).order_by(
+            Snippet.timestamp.desc()).paginate(
             page=page, per_page=current_app.config['POSTS_PER_PAGE'], error_out=False)
 
-    return render_template('index.html', title='Home', snippets=pagination)
+    return render_template('index.html', title='Home', snippets=pagination, filters=filters)
 
 
 @bp.route('/login', methods=['GET', 'POST'])
@@ -82,7 +114,8 @@ def view_snippet(snippet_id):
     if snippet is None or snippet.author != current_user:
         flash('Snippet not found or you do not have permission to view it.', 'danger')
         return redirect(url_for('main.index'))
-    return render_template('view_snippet.html', title=snippet.title, snippet=snippet)
+    return render_template('view_snippet.html', title=snippet.title, snippet=snippet,
+                           related=related_snippets(snippet))
 
 
 @bp.route('/create_snippet', methods=['GET', 'POST'])
@@ -105,6 +138,7 @@ def create_snippet():
 
     if form.validate_on_submit():
         collection_id = form.collection.data if form.collection.data != 0 else None
+        duplicates = duplicate_indexes().get(current_user.id).find(form.code.data)
         snippet = Snippet(
             title=form.title.data,
             description=form.description.data,
@@ -114,11 +148,20 @@ def create_snippet():
             language=form.language.data,
             collection_id=collection_id
         )
-        snippet.generate_and_set_embedding()
         db.session.add(snippet)
+        db.session.flush()
+        # The embedding, semantic index and related snippets are updated in the background
+        enqueue('embed_snippet', {'snippet_id': snippet.id},
+                user_id=current_user.id, subject=f'snippet:{snippet.id}')
         db.session.commit()
+        duplicate_indexes().update(snippet)
+        invalidate_snippet_searches(current_user.id)
+        dispatch()
         current_app.award_points(current_user, 10, "Snippet Created") # Award points for creating a snippet
         flash('Your snippet has been saved!', 'success')
+        if duplicates:
+            flash(f'This snippet looks like a near-duplicate of {len(duplicates)} of your existing '
+                  f'snippets (up to {duplicates[0][1]:.0%} similar code).', 'warning')
         return redirect(url_for('main.index'))
 
     return render_template('create_snippet.html', title='Create Snippet', form=form)
@@ -145,8 +188,20 @@ def edit_snippet(snippet_id):
         snippet.tags = form.tags.data
         snippet.language = form.language.data
         snippet.collection_id = collection_id
-        snippet.generate_and_set_embedding()
+        # Until the job re-embeds the new content, the snippet has no embedding
+        # rather than a stale one, in the database and in this process's index
+        embedding_is_stale = snippet.embedding_hash != content_hash(snippet.embedding_text())
+        if embedding_is_stale:
+            snippet.embedding_data = None
+            snippet.embedding_hash = None
+        enqueue('embed_snippet', {'snippet_id': snippet.id},
+                user_id=current_user.id, subject=f'snippet:{snippet.id}')
         db.session.commit()
+        if embedding_is_stale:
+            snippet_indexes().remove(current_user.id, snippet.id)
+        duplicate_indexes().update(snippet)
+        invalidate_snippet_searches(current_user.id)
+        dispatch()
         flash('Your snippet has been updated!', 'success')
         return redirect(url_for('main.view_snippet', snippet_id=snippet.id))
 
@@ -166,12 +221,37 @@ def delete_snippet(snippet_id):
         flash('Snippet not found or you do not have permission to delete it.', 'danger')
         return redirect(url_for('main.index'))
 
+    snippet_id, user_id = snippet.id, snippet.user_id
     db.session.delete(snippet)
     db.session.commit()
+    snippet_indexes().remove(user_id, snippet_id)
+    duplicate_indexes().remove(user_id, snippet_id)
+    remove_related_snippet(user_id, snippet_id)
+    invalidate_snippet_searches(user_id)
     flash('Your snippet has been deleted.', 'success')
     return redirect(url_for('main.index'))
 
 
+def _sse(event, data):
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _event_stream(events):
+    """Returns a streaming text/event-stream response for a generator of `_sse` messages."""
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _relay(chunks, field):
+    """Forwards streamed text as 'chunk' events and returns the full, stripped text."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield _sse('chunk', {'field': field, 'text': chunk})
+    return ''.join(parts).strip()
+
+
 @bp.route('/generate', methods=['GET', 'POST'])
 @login_required
 def generate():
@@ -194,6 +274,35 @@ def generate():
     return render_template('generate.html', title='AI Code Generation', form=form)
 
 
+@bp.route('/generate/stream', methods=['POST'])
+@login_required
+def generate_stream():
+    """
+    Streaming variant of `generate`: sends the code and then its explanation as
+    Server-Sent Events while they are written, and finally the create-snippet URL.
+    """
+    form = AIGenerationForm()
+    if not form.validate_on_submit():
+        return jsonify({'error': 'Invalid request.', 'errors': form.errors}), 400
+    prompt = form.prompt.data
+
+    def events():
+        try:
+            generated_code = yield from _relay(ai_services.stream_code_from_prompt(prompt), 'code')
+        except AIStreamError as e:
+            yield _sse('error', {'error': str(e)})
+            return
+        try:
+            generated_explanation = yield from _relay(
+                ai_services.stream_code_explanation(generated_code), 'explanation')
+        except AIStreamError as e:
+            generated_explanation = str(e)  # Passed on to the create page, as in `generate`
+        yield _sse('done', {'redirect': url_for('main.create_snippet', generated_code=generated_code,
+                                                generated_explanation=generated_explanation)})
+
+    return _event_stream(events())
+
+
 @bp.route('/explain', methods=['POST'])
 @login_required
 def explain():
@@ -207,6 +316,27 @@ def explain():
     return jsonify({'explanation': explanation})
 
 
+@bp.route('/explain/stream', methods=['POST'])
+@login_required
+def explain_stream():
+    """Streaming variant of `explain`: sends the explanation as Server-Sent Events."""
+    data = request.get_json()
+    if not data or 'code' not in data:
+        return jsonify({'error': 'Missing code in request.'}), 400
+
+    code = data['code']
+
+    def events():
+        try:
+            explanation = yield from _relay(ai_services.stream_code_explanation(code), 'explanation')
+        except AIStreamError as e:
+            yield _sse('error', {'error': str(e)})
+            return
+        yield _sse('done', {'explanation': explanation})
+
+    return _event_stream(events())
+
+
 @bp.route('/suggest-tags', methods=['POST'])
 @login_required
 def suggest_tags():
@@ -227,80 +357,19 @@ def search():
     query = request.args.get('q', '')
     if not query:
         return redirect(url_for('main.index'))
+    page = request.args.get('page', 1, type=int)
+    filters = _list_filters()
+    collapse = request.args.get('collapse', 0, type=int) == 1
 
-    # --- Keyword Search ---
-    keyword_results = db.session.scalars(
-        sa.select(Snippet).where(
-            Snippet.user_id == current_user.id,
-            or_(
-                Snippet.title.ilike(f'%{query}%'),
-                Snippet.description.ilike(f'%{query}%'),
-                Snippet.code.ilike(f'%{query}%'),
-                Snippet.tags.ilike(f'%{query}%')
-            )
-        )
-    ).all()
-
-    # --- Semantic Search ---
-    query_embedding = ai_services.generate_embedding(
-        query, task_type="RETRIEVAL_QUERY")
-
-    semantic_results = []
-    if query_embedding is not None:
-        query_vector = np.array(query_embedding)
-        
-        # Filter snippets to ensure embeddings are valid
-        valid_snippets_with_embeddings = []
-        for s in current_user.snippets.order_by(Snippet.timestamp.desc()).all():
-            if s.embedding is not None and isinstance(s.embedding, list) and len(s.embedding) > 0:
-                if all(isinstance(x, (int, float)) for x in s.embedding):
-                    valid_snippets_with_embeddings.append(s)
-
-        if valid_snippets_with_embeddings:
-            snippet_vectors = {s.id: np.array(s.embedding, dtype=np.float32)
-                               for s in valid_snippets_with_embeddings}
-
-            similarities = {
-                sid: ai_services.cosine_similarity(query_vector, s_vector)
-                for sid, s_vector in snippet_vectors.items()
-            }
-
-            SIMILARITY_THRESHOLD = 0.65
-            relevant_ids = {
-                sid: score for sid, score in similarities.items()
-                if score > SIMILARITY_THRESHOLD
-            }
-
-            snippet_map = {s.id: s for s in valid_snippets_with_embeddings}
-            semantic_results = [snippet_map[sid] for sid in sorted(
-                relevant_ids, key=relevant_ids.get, reverse=True)]
-
-    # --- Combine and Re-rank Results ---
-    combined_results = {} # {snippet_id: snippet_object}
-
-    # Add keyword results with a base score
-    for snippet in keyword_results:
-        combined_results[snippet.id] = {'snippet': snippet, 'score': 0.1} # Base score for keyword match
-
-    # Add semantic results, boosting scores if already present from keyword search
-    for snippet in semantic_results:
-        if snippet.id in combined_results:
-            # If already found by keyword, boost its score with semantic similarity
-            combined_results[snippet.id]['score'] += similarities[snippet.id]
-        else:
-            # Otherwise, add it with its semantic similarity score
-            combined_results[snippet.id] = {'snippet': snippet, 'score': similarities[snippet.id]}
-
-    # Sort by combined score
-    sorted_snippets_with_scores = sorted(
-        combined_results.values(), key=lambda x: x['score'], reverse=True
-    )
-    final_sorted_snippets = [item['snippet'] for item in sorted_snippets_with_scores]
+    results = search_snippets(current_user.id, query, page=page,
+                              per_page=current_app.config['POSTS_PER_PAGE'],
+                              collapse_duplicates=collapse, **filters)
 
-    if not final_sorted_snippets:
+    if not results.items and page == 1:
         flash('No snippets found matching your search.', 'info')
 
-    return render_template('search_results.html', title='Search Results', results=final_sorted_snippets, query=query)
+    return render_template('search_results.html', title='Search Results', results=results,
+                           query=query, filters=filters, collapse=collapse, endpoint='main.search')
 
 
 @bp.route('/collections', methods=['GET', 'POST'])
@@ -308,9 +377,10 @@ def search():
 def collections():
     """Page for viewing and managing collections."""
     form = CollectionForm()
-    # Populate parent_collection choices, excluding the collection itself if editing
-    form.parent_collection.choices = [(0, '--- No Parent ---')] + \
-                                     [(c.id, c.name) for c in current_user.collections.filter_by(parent_id=None).order_by(Collection.name).all()]
+    # The whole hierarchy, with subtree snippet counts, from one recursive query
+    tree, total_snippets_count = collection_tree(current_user.id)
+    # Any collection can be the parent of a new one
+    form.parent_collection.choices = [(0, '--- No Parent ---')] + [(node.id, node.path) for node in tree]
 
     if form.validate_on_submit():
         parent_id = form.parent_collection.data if form.parent_collection.data != 0 else None
@@ -320,18 +390,12 @@ def collections():
         flash('New collection created!', 'success')
         return redirect(url_for('main.collections'))
 
-    # Fetch top-level collections (those without a parent)
-    user_collections = db.session.query(Collection).filter_by(
-        user_id=current_user.id, parent_id=None).order_by(Collection.order.asc(), Collection.name.asc()).all()
-
-    # Get total snippet count for the user
-    total_snippets_count = current_user.snippets.count()
-
-    # Get snippet count for each collection
-    collections_with_counts = []
-    for collection in user_collections:
-        snippet_count = collection.snippets.count()
-        collections_with_counts.append({'collection': collection, 'snippet_count': snippet_count})
+    # Top-level collections, each with its descendants in depth-first order.
+    # A collection's count includes the snippets of its sub-collections.
+    collections_with_counts = [
+        {'collection': node, 'snippet_count': node.subtree_count,
+         'descendants': subtree(tree, node.id)[1:]}
+        for node in tree if node.depth == 0]
 
     return render_template('collections.html', title='My Solutions', form=form,
                            collections=collections_with_counts, total_snippets_count=total_snippets_count)
@@ -346,20 +410,30 @@ def view_collection(collection_id):
         flash('Collection not found.', 'danger')
         return redirect(url_for('main.collections'))
 
-    # Query for snippets in this collection and paginate the results
-    pagination = collection.snippets.order_by(Snippet.timestamp.desc()).paginate(
+    filters = _list_filters()
+    # The collection and all of its sub-collections, at any depth
+    nodes = subtree(collection_tree(current_user.id)[0], collection.id)
+    collection_ids = [node.id for node in nodes] or [collection.id]
+
+    # Query for snippets in this collection's subtree and paginate the results
+    pagination = current_user.snippets.filter(
+        Snippet.collection_id.in_(collection_ids), *snippet_criteria(**filters)).order_by(
+        Snippet.timestamp.desc()).paginate(
         page=page, per_page=current_app.config['POSTS_PER_PAGE'], error_out=False)
-    
-    # Fetch sub-collections
-    sub_collections = collection.children.order_by(Collection.name.asc()).all()
+
+    # Direct sub-collections, with the snippet counts of their own subtrees
+    sub_collections = [node for node in nodes if node.parent_id == collection.id]
+    # With filters the header counts the filtered snippets, like the list below it
+    snippet_count = nodes[0].subtree_count if nodes and not filters else pagination.total
 
     return render_template(
         'view_collection.html',
         title=f"Collection: {collection.name}",
         collection=collection,
         snippets=pagination,
-        snippet_count=collection.snippets.count(),
-        sub_collections=sub_collections
+        snippet_count=snippet_count,
+        sub_collections=sub_collections,
+        filters=filters
     )
 
 @bp.route('/collection/<int:collection_id>/rename', methods=['GET', 'POST'])
@@ -372,16 +446,12 @@ def rename_collection(collection_id):
         return redirect(url_for('main.collections'))
 
     form = CollectionForm(obj=collection)
-    # Populate parent_collection choices, excluding the collection itself and its descendants
+    # Populate parent_collection choices, excluding the collection itself and all its
+    # descendants at any depth, which would make the hierarchy a cycle
     form.parent_collection.choices = [(0, '--- No Parent ---')]
-    
-    # Get all collections that are not the current collection or its children
-    eligible_parents = current_user.collections.filter(
-        Collection.id != collection.id,
-        ~Collection.parent_id.in_([c.id for c in collection.children]) # Exclude direct children
-    ).order_by(Collection.name).all()
-
-    form.parent_collection.choices.extend([(c.id, c.name) for c in eligible_parents])
+    tree, _ = collection_tree(current_user.id)
+    excluded = descendant_ids(tree, collection.id)
+    form.parent_collection.choices.extend([(node.id, node.path) for node in tree if node.id not in excluded])
 
     if form.validate_on_submit():
         collection.name = form.name.data
@@ -473,31 +543,63 @@ def generate_solution(problem_id):
             flash(solution_code, 'danger')
             return redirect(url_for('main.view_problem', problem_id=problem.id))
 
-        explanation = ai_services.explain_leetcode_solution(
-            solution_code, problem.title, language
-        )
-        classification = ai_services.classify_leetcode_solution(
-            solution_code, problem.description
-        )
-
-        solution = LeetcodeSolution(
-            problem=problem,
-            contributor=current_user,
-            solution_code=solution_code,
-            language=language,
-            explanation=explanation,
-            classification=classification,
-            approved=False # Solutions need approval
-        )
-        solution.generate_and_set_embedding()
-        db.session.add(solution)
-        db.session.commit()
+        solution = _save_generated_solution(problem, language, solution_code)
         flash('Solution generated and awaiting approval!', 'success')
         return redirect(url_for('main.view_solution', solution_id=solution.id))
 
     return render_template('generate_solution.html', title='Generate Solution', form=form, problem=problem)
 
 
+def _save_generated_solution(problem, language, solution_code):
+    """Saves a generated solution for approval and queues its AI enrichment."""
+    solution = LeetcodeSolution(
+        problem=problem,
+        contributor=current_user,
+        solution_code=solution_code,
+        language=language,
+        approved=False # Solutions need approval
+    )
+    db.session.add(solution)
+    db.session.flush()
+    # The explanation, classification and embedding are filled in by a background job
+    enqueue('enrich_solution', {'solution_id': solution.id},
+            user_id=current_user.id, subject=f'solution:{solution.id}')
+    db.session.commit()
+    dispatch()
+    return solution
+
+
+@bp.route('/generate_solution/<int:problem_id>/stream', methods=['POST'])
+@login_required
+def generate_solution_stream(problem_id):
+    """
+    Streaming variant of `generate_solution`: sends the solution code as
+    Server-Sent Events while it is written, saves it, and finally sends its URL.
+    """
+    problem = db.session.get(LeetcodeProblem, problem_id)
+    if problem is None:
+        return jsonify({'error': 'Problem not found.'}), 404
+
+    form = GenerateSolutionForm()
+    form.problem.choices = [(problem.id, problem.title)]
+    form.problem.data = problem.id
+    if not form.validate_on_submit():
+        return jsonify({'error': 'Invalid request.', 'errors': form.errors}), 400
+    language = form.language.data
+
+    def events():
+        try:
+            solution_code = yield from _relay(
+                ai_services.stream_leetcode_solution(problem.title, problem.description, language), 'code')
+        except AIStreamError as e:
+            yield _sse('error', {'error': str(e)})
+            return
+        solution = _save_generated_solution(problem, language, solution_code)
+        yield _sse('done', {'redirect': url_for('main.view_solution', solution_id=solution.id)})
+
+    return _event_stream(events())
+
+
 @bp.route('/solution/<int:solution_id>')
 @login_required
 def view_solution(solution_id):
@@ -511,7 +613,22 @@ def view_solution(solution_id):
         flash('This solution is awaiting approval and cannot be viewed yet.', 'warning')
         return redirect(url_for('main.view_problem', problem_id=solution.problem.id))
 
-    return render_template('view_solution.html', title=f"Solution for {solution.problem.title}", solution=solution)
+    # Only the job's owner may poll its status, so other viewers get no pending jobs
+    pending_jobs = db.session.scalars(sa.select(Job).where(
+        Job.subject == f'solution:{solution.id}', Job.user_id == current_user.id,
+        Job.status.in_(('pending', 'running')))).all()
+    return render_template('view_solution.html', title=f"Solution for {solution.problem.title}",
+                           solution=solution, pending_jobs=pending_jobs)
+
+
+@bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """Returns the status of one of the current user's background jobs as JSON."""
+    job = db.session.get(Job, job_id)
+    if job is None or job.user_id != current_user.id:
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify(job.to_dict())
 
 
 @bp.route('/solution/<int:solution_id>/approve', methods=['GET', 'POST'])
@@ -531,6 +648,7 @@ def approve_solution(solution_id):
     if form.validate_on_submit():
         solution.approved = form.approve.data
         db.session.commit()
+        update_solution(solution)
         if solution.approved:
             current_app.award_points(current_user, 20, "Solution Approved") # Award points for approving a solution
         flash('Solution approval status updated.', 'success')
@@ -638,88 +756,17 @@ def search_solutions():
     query = request.args.get('q', '')
     if not query:
         return redirect(url_for('main.index'))
+    page = request.args.get('page', 1, type=int)
+    filters = _list_filters()
 
-    # --- Keyword Search ---
-    keyword_results = db.session.scalars(
-        sa.select(LeetcodeSolution).where(
-            LeetcodeSolution.approved == True,
-            or_(
-                LeetcodeSolution.solution_code.ilike(f'%{query}%'),
-                LeetcodeSolution.explanation.ilike(f'%{query}%'),
-                LeetcodeSolution.classification.ilike(f'%{query}%'),
-                LeetcodeSolution.problem.has(LeetcodeProblem.title.ilike(f'%{query}%')),
-                LeetcodeSolution.problem.has(LeetcodeProblem.description.ilike(f'%{query}%')),
-                LeetcodeSolution.problem.has(LeetcodeProblem.tags.ilike(f'%{query}%'))
-            )
-        )
-    ).all()
-
-    # --- Semantic Search ---
-    query_embedding = ai_services.generate_embedding(
-        query, task_type="RETRIEVAL_QUERY")
-
-    semantic_results = []
-    if query_embedding is not None:
-        query_vector = np.array(query_embedding)
-
-        # Search only approved solutions with valid embeddings
-        valid_solutions_with_embeddings = LeetcodeSolution.query.filter(
-            LeetcodeSolution.approved == True,
-            LeetcodeSolution.embedding.isnot(None)
-        ).all()
-
-        # Filter to ensure embeddings are valid (not None, not empty, and contain only numbers)
-        filtered_solutions = []
-        for s in valid_solutions_with_embeddings:
-            if s.embedding is not None and isinstance(s.embedding, list) and len(s.embedding) > 0:
-                if all(isinstance(x, (int, float)) for x in s.embedding):
-                    filtered_solutions.append(s)
-
-        if filtered_solutions:
-            solution_vectors = {s.id: np.array(s.embedding, dtype=np.float32)
-                               for s in filtered_solutions}
-
-            similarities = {
-                sid: ai_services.cosine_similarity(query_vector, s_vector)
-                for sid, s_vector in solution_vectors.items()
-            }
-
-            SIMILARITY_THRESHOLD = 0.65
-            relevant_ids = {
-                sid: score for sid, score in similarities.items()
-                if score > SIMILARITY_THRESHOLD
-            }
-
-            solution_map = {s.id: s for s in filtered_solutions}
-            semantic_results = [solution_map[sid] for sid in sorted(
-                relevant_ids, key=relevant_ids.get, reverse=True)]
-
-    # --- Combine and Re-rank Results ---
-    combined_results = {} # {solution_id: solution_object}
-
-    # Add keyword results with a base score
-    for solution in keyword_results:
-        combined_results[solution.id] = {'solution': solution, 'score': 0.1} # Base score for keyword match
-
-    # Add semantic results, boosting scores if already present from keyword search
-    for solution in semantic_results:
-        if solution.id in combined_results:
-            # If already found by keyword, boost its score with semantic similarity
-            combined_results[solution.id]['score'] += similarities[solution.id]
-        else:
-            # Otherwise, add it with its semantic similarity score
-            combined_results[solution.id] = {'solution': solution, 'score': similarities[solution.id]}
-
-    # Sort by combined score
-    sorted_solutions_with_scores = sorted(
-        combined_results.values(), key=lambda x: x['score'], reverse=True
-    )
-    final_sorted_solutions = [item['solution'] for item in sorted_solutions_with_scores]
+    results = search_approved_solutions(query, page=page,
+                                        per_page=current_app.config['POSTS_PER_PAGE'], **filters)
 
-    if not final_sorted_solutions:
+    if not results.items and page == 1:
         flash('No solutions found matching your search.', 'info')
 
-    return render_template('search_results.html', title='Search Results', results=final_sorted_solutions, query=query)
+    return render_template('search_results.html', title='Search Results', results=results,
+                           query=query, filters=filters, endpoint='main.search_solutions')
 
 
 @bp.route('/user_profile')
@@ -778,6 +825,7 @@ def move_snippet(snippet_id):
         if action == 'move':
             snippet.collection_id = target_collection_id
             db.session.commit()
+            invalidate_snippet_searches(current_user.id)
             flash(f'Snippet "{snippet.title}" moved successfully!', 'success')
         elif action == 'copy':
             new_snippet = Snippet(
@@ -789,9 +837,13 @@ def move_snippet(snippet_id):
                 language=snippet.language,
                 collection_id=target_collection_id
             )
-            new_snippet.generate_and_set_embedding()
+            new_snippet.copy_embedding_from(snippet) # Same content, so no new API call
             db.session.add(new_snippet)
             db.session.commit()
+            snippet_indexes().update(new_snippet)
+            duplicate_indexes().update(new_snippet)
+            update_related_snippets(new_snippet)
+            invalidate_snippet_searches(current_user.id)
             current_app.award_points(current_user, 5, "Snippet Copied") # Award points for copying a snippet
             flash(f'Snippet "{snippet.title}" copied successfully!', 'success')
         
@@ -0,0 +1,318 @@
+"""Hybrid (keyword and semantic) search over snippets and solutions."""
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+import numpy as np
+import sqlalchemy as sa
+from flask import current_app
+
+from app import db, ai_services
+from app.cache import TTLCache
+from app.dedup import duplicate_indexes
+from app.fulltext import keyword_snippet_ids, keyword_solution_ids
+from app.index_versions import bump_version, current_version, snippet_scope
+from app.models import Snippet, LeetcodeSolution, Tag, snippet_tag, problem_tag
+from app.vector_index import snippet_indexes, solution_index, top_k_indices
+
+SIMILARITY_THRESHOLD = 0.65
+KEYWORD_SCORE = 0.1 # Base score for a keyword match
+
+_version_lock = threading.Lock()
+
+
+class SearchPage:
+    """
+    One page of ranked search results.
+
+    Exposes the same attributes as Flask-SQLAlchemy's Pagination that
+    `_pagination.html` uses, without needing a total count.
+    """
+
+    def __init__(self, items, page, per_page, has_next):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = page > 1
+        self.next_num = page + 1 if has_next else None
+        self.prev_num = page - 1 if self.has_prev else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def rank_hybrid(keyword_ids, semantic_ids, semantic_scores, keyword_similarities, limit):
+    """
+    Merges keyword and semantic hits into one ranking.
+
+    Keyword hits score KEYWORD_SCORE, boosted by their semantic similarity when
+    it is above the threshold; semantic-only hits score their similarity.
+    Only the best `limit` ids are selected and sorted.
+
+    Args:
+        keyword_ids (list): Keyword hits, best first.
+        semantic_ids (np.ndarray): The top semantic hits above the threshold.
+        semantic_scores (np.ndarray): Their similarity scores.
+        keyword_similarities (dict): {id: similarity} for keyword hits.
+        limit (int): How many ids to return.
+
+    Returns:
+        list: The best `limit` ids, highest combined score first.
+    """
+    scores = {}
+    for item_id in keyword_ids:
+        similarity = keyword_similarities.get(item_id, 0.0)
+        scores[item_id] = KEYWORD_SCORE + (similarity if similarity > SIMILARITY_THRESHOLD else 0.0)
+    for item_id, score in zip(semantic_ids.tolist(), semantic_scores.tolist()):
+        scores.setdefault(item_id, score)
+
+    ids = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+    values = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+    return ids[top_k_indices(values, limit)].tolist()
+
+
+def snippet_criteria(tag=None, language=None):
+    """
+    Builds the WHERE criteria for optional tag and language filters on snippets.
+
+    The tag filter goes through the tag name and snippet_tag indexes instead of
+    scanning the comma-separated tag strings.
+
+    Returns:
+        list: SQLAlchemy criteria, empty when no filter is set.
+    """
+    criteria = []
+    if tag:
+        criteria.append(Snippet.id.in_(
+            sa.select(snippet_tag.c.snippet_id)
+            .join(Tag, Tag.id == snippet_tag.c.tag_id)
+            .where(Tag.name == Tag.normalize(tag))))
+    if language:
+        criteria.append(Snippet.language == language)
+    return criteria
+
+
+def solution_criteria(tag=None, language=None):
+    """
+    Builds the WHERE criteria for optional problem tag and solution language
+    filters on Leetcode solutions.
+
+    Returns:
+        list: SQLAlchemy criteria, empty when no filter is set.
+    """
+    criteria = []
+    if tag:
+        criteria.append(LeetcodeSolution.problem_id.in_(
+            sa.select(problem_tag.c.problem_id)
+            .join(Tag, Tag.id == problem_tag.c.tag_id)
+            .where(Tag.name == Tag.normalize(tag))))
+    if language:
+        criteria.append(LeetcodeSolution.language == language)
+    return criteria
+
+
+def _load_in_order(model, ids, *criteria):
+    objects = {obj.id: obj for obj in db.session.scalars(
+        sa.select(model).where(model.id.in_(ids), *criteria))}
+    return [objects[i] for i in ids if i in objects]
+
+
+def search_result_cache():
+    """Returns the cache of ranked snippet search results for the current application."""
+    cache = current_app.extensions.get('search_result_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('search_result_cache', TTLCache(
+            maxsize=current_app.config['SEARCH_RESULT_CACHE_SIZE'],
+            ttl=current_app.config['SEARCH_RESULT_CACHE_TTL']))
+    return cache
+
+
+def snippet_version(user_id):
+    """Returns the counter that changes whenever one of the user's snippets does, in any process."""
+    return current_version(snippet_scope(user_id))
+
+
+def invalidate_snippet_searches(user_id):
+    """
+    Bumps the user's snippet version after a snippet was created, edited,
+    moved or deleted and committed, so no process serves search results
+    cached before, and the other processes rebuild their indexes of the
+    user's snippets. This process's indexes must already be up to date.
+    """
+    version = bump_version(snippet_scope(user_id))
+    snippet_indexes().advance(user_id, version)
+    duplicate_indexes().advance(user_id, version)
+
+
+def _embedding_executor():
+    executor = current_app.extensions.get('search_executor')
+    if executor is None:
+        with _version_lock:
+            executor = current_app.extensions.get('search_executor')
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=current_app.config['SEARCH_EMBEDDING_WORKERS'],
+                    thread_name_prefix='search-embedding')
+                current_app.extensions['search_executor'] = executor
+    return executor
+
+
+def _start_query_embedding(query):
+    """Requests the query embedding on a worker thread and returns its future."""
+    app = current_app._get_current_object()
+
+    def embed():
+        with app.app_context():
+            return ai_services.generate_query_embedding(query)
+
+    return _embedding_executor().submit(embed)
+
+
+def _await_query_embedding(future, deadline):
+    """
+    Waits for a query embedding until the deadline (a `time.monotonic()` value).
+
+    Returns:
+        tuple: (embedding or None, whether the request finished in time).
+    """
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic())), True
+    except FuturesTimeoutError:
+        # The request keeps running and fills the query-embedding cache for next time
+        current_app.logger.warning("Query embedding missed the search deadline; returning keyword results only")
+        return None, False
+
+
+def _run_stages(query, *stages):
+    """
+    Runs the database stages (keyword query, index load, filters) while the
+    query embedding is requested in parallel, giving up on the embedding at
+    the deadline.
+
+    Returns:
+        tuple: (list of stage results, query embedding or None, whether the
+               embedding stage completed).
+    """
+    deadline = time.monotonic() + current_app.config['SEARCH_EMBEDDING_DEADLINE']
+    embedding_future = _start_query_embedding(query)
+    results = [stage() for stage in stages]
+    query_embedding, complete = _await_query_embedding(embedding_future, deadline)
+    return results, query_embedding, complete
+
+
+def _rank(index, keyword_ids, query_embedding, limit, candidate_ids=None):
+    semantic_ids = np.empty(0, dtype=np.int64)
+    semantic_scores = np.empty(0, dtype=np.float32)
+    keyword_similarities = {}
+
+    if candidate_ids is not None:
+        allowed = set(candidate_ids)
+        keyword_ids = [item_id for item_id in keyword_ids if item_id in allowed]
+
+    if query_embedding is not None:
+        if candidate_ids is None:
+            semantic_ids, semantic_scores = index.search(
+                query_embedding, threshold=SIMILARITY_THRESHOLD, k=limit)
+        else:
+            # Filtered searches only score the items that pass the filters
+            ids, scores = index.score(query_embedding, candidate_ids)
+            mask = scores > SIMILARITY_THRESHOLD
+            ids, scores = ids[mask], scores[mask]
+            order = top_k_indices(scores, limit)
+            semantic_ids, semantic_scores = ids[order], scores[order]
+        ids, scores = index.score(query_embedding, keyword_ids)
+        keyword_similarities = dict(zip(ids.tolist(), scores.tolist()))
+
+    return rank_hybrid(keyword_ids, semantic_ids, semantic_scores, keyword_similarities, limit)
+
+
+def _page_of(model, ranked, page, per_page, *criteria):
+    page_ids = ranked[(page - 1) * per_page:page * per_page]
+    items = _load_in_order(model, page_ids, *criteria)
+    return SearchPage(items, page, per_page, has_next=len(ranked) > page * per_page)
+
+
+def search_snippets(user_id, query, page=1, per_page=10, tag=None, language=None,
+                    collapse_duplicates=False):
+    """
+    Runs a hybrid search over one user's snippets.
+
+    The ranked ids are cached per user and query until one of the user's
+    snippets changes, so refreshing or paging back skips the keyword query,
+    the embedding call and the scoring.
+
+    Args:
+        user_id (int): The owner of the snippets.
+        query (str): The search text.
+        page (int): The 1-based page number.
+        per_page (int): Results per page.
+        tag (str): Only return snippets with this tag.
+        language (str): Only return snippets in this language.
+        collapse_duplicates (bool): Only keep the best ranked of each group of
+                                    near-duplicate snippets.
+
+    Returns:
+        SearchPage: The requested page of Snippet objects.
+    """
+    page = max(page, 1)
+    # One extra result tells us whether there is a next page
+    limit = page * per_page + 1
+    criteria = snippet_criteria(tag, language)
+
+    cache = search_result_cache()
+    key = (user_id, snippet_version(user_id), query, tag or None, language or None, collapse_duplicates)
+    cached = cache.get(key)
+    # A cached ranking can serve any page it covers, or every page if it was exhaustive
+    if cached is not None and (cached[0] >= limit or len(cached[1]) < cached[0]):
+        ranked = cached[1]
+    else:
+        stages = [lambda: snippet_indexes().get(user_id),
+                  lambda: keyword_snippet_ids(user_id, query)]
+        if criteria:
+            stages.append(lambda: db.session.scalars(
+                sa.select(Snippet.id).where(Snippet.user_id == user_id, *criteria)).all())
+        (index, keyword_ids, *candidates), query_embedding, complete = _run_stages(query, *stages)
+        candidate_ids = candidates[0] if candidates else None
+        if collapse_duplicates:
+            # Collapsing shortens the ranking, so rank every match once and page through that
+            ranked = duplicate_indexes().get(user_id).collapse(
+                _rank(index, keyword_ids, query_embedding, None, candidate_ids))
+            limit = math.inf
+        else:
+            ranked = _rank(index, keyword_ids, query_embedding, limit, candidate_ids)
+        # Keyword-only fallbacks (a missed deadline or a failed embedding) are not cached
+        if complete and query_embedding is not None:
+            cache.set(key, (limit, ranked))
+    return _page_of(Snippet, ranked, page, per_page, Snippet.user_id == user_id, *criteria)
+
+
+def search_approved_solutions(query, page=1, per_page=10, tag=None, language=None):
+    """
+    Runs a hybrid search over all approved solutions.
+
+    Args:
+        query (str): The search text.
+        page (int): The 1-based page number.
+        per_page (int): Results per page.
+        tag (str): Only return solutions whose problem has this tag.
+        language (str): Only return solutions in this language.
+
+    Returns:
+        SearchPage: The requested page of LeetcodeSolution objects.
+    """
+    page = max(page, 1)
+    criteria = solution_criteria(tag, language)
+    stages = [solution_index, lambda: keyword_solution_ids(query)]
+    if criteria:
+        stages.append(lambda: db.session.scalars(
+            sa.select(LeetcodeSolution.id).where(LeetcodeSolution.approved == True, *criteria)).all())
+    (index, keyword_ids, *candidates), query_embedding, _ = _run_stages(query, *stages)
+    ranked = _rank(index, keyword_ids, query_embedding, page * per_page + 1,
+                   candidates[0] if candidates else None)
+    return _page_of(LeetcodeSolution, ranked, page, per_page, LeetcodeSolution.approved == True, *criteria)
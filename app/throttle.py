@@ -0,0 +1,220 @@
+"""Request coalescing, rate limiting and circuit breaking for outbound API calls."""
+
+import threading
+import time
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call could not get a rate-limit token in time."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after `failure_threshold` consecutive failures.
+
+    Once open, calls raise CircuitOpenError for `cooldown` seconds. After that
+    one trial call is let through (half-open): success closes the circuit
+    again, failure reopens it for another cool-down.
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """'closed', 'open' or 'half-open'."""
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._trial or self._clock() >= self._opened_at + self.cooldown:
+                return 'half-open'
+            return 'open'
+
+    def before_call(self):
+        """
+        Checks that a call may be made now.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or a half-open trial is already running.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.cooldown - self._clock()
+            if remaining > 0 or self._trial:
+                raise CircuitOpenError("The service is unavailable; failing fast until it recovers.",
+                                       retry_after=max(remaining, 0.0))
+            self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial = False
+
+
+class SingleFlight:
+    """
+    Merges concurrent calls with the same key into one.
+
+    The first caller runs the function; callers that arrive while it is still
+    running wait for it and receive the same result, or the same exception.
+    """
+
+    def __init__(self):
+        self._calls = {}  # {key: _Call}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Runs `func()`, unless a call with the same key is already in flight.
+
+        Returns:
+            tuple: (result, whether this caller shared another caller's call).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average with bursts of up to `burst`.
+
+    Not thread-safe on its own; RateLimiter serializes access.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self):
+        """Returns the seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def take(self):
+        self._tokens -= 1
+
+    @property
+    def full(self):
+        self._refill()
+        return self._tokens >= self.burst
+
+
+class RateLimiter:
+    """
+    A global token bucket plus one token bucket per user.
+
+    `acquire` waits (queues) up to `max_wait` seconds for a token from both
+    buckets and raises RateLimitExceeded if none becomes available in time.
+    A rate of 0 disables that budget.
+    """
+
+    _MAX_IDLE_USERS = 1000  # Full per-user buckets are pruned beyond this many
+
+    def __init__(self, rate, burst, user_rate, user_burst, max_wait=10.0, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.max_wait = max_wait
+        self._global = TokenBucket(rate, burst, clock) if rate > 0 else None
+        self._user_rate = user_rate
+        self._user_burst = user_burst
+        self._users = {}  # {user key: TokenBucket}
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def _buckets(self, user):
+        buckets = [self._global] if self._global is not None else []
+        if user is not None and self._user_rate > 0:
+            bucket = self._users.get(user)
+            if bucket is None:
+                if len(self._users) >= self._MAX_IDLE_USERS:
+                    self._users = {key: b for key, b in self._users.items() if not b.full}
+                bucket = self._users[user] = TokenBucket(self._user_rate, self._user_burst, self._clock)
+            buckets.append(bucket)
+        return buckets
+
+    def acquire(self, user=None):
+        """
+        Takes one token for a call made on behalf of `user` (None for background work).
+
+        Raises:
+            RateLimitExceeded: If no token is available within `max_wait` seconds.
+        """
+        deadline = self._clock() + self.max_wait
+        while True:
+            with self._lock:
+                buckets = self._buckets(user)
+                wait = max((bucket.wait_time() for bucket in buckets), default=0.0)
+                if wait == 0:
+                    for bucket in buckets:
+                        bucket.take()
+                    return
+            if self._clock() + wait > deadline:
+                raise RateLimitExceeded("Too many AI requests right now. Please try again shortly.",
+                                        retry_after=wait)
+            self._sleep(wait)
@@ -0,0 +1,665 @@
+"""In-memory vector indexes used by semantic search."""
+
+import threading
+from functools import partial
+
+import numpy as np
+import sqlalchemy as sa
+from flask import current_app
+
+from app import db, ai_services
+from app.embeddings import decode_embedding
+from app.index_versions import SOLUTIONS_SCOPE, UserIndexRegistry, bump_version, current_version
+
+INDEX_DTYPES = ('float32', 'int8')
+
+_SCORE_BLOCK = 8192 # Quantized rows dequantized per block while scoring
+_SCORE_EPSILON = 1e-5 # Slack for float rounding in the quantization error bound
+
+
+def top_k_indices(scores, k=None):
+    """
+    Returns the positions of the `k` highest scores, best first.
+
+    Uses `np.argpartition` so only the selected items are fully sorted. Ties
+    are broken by position, including at the cut-off, so consecutive pages of
+    the same ranking never overlap or skip items.
+
+    Args:
+        scores (np.ndarray): A 1-D array of scores.
+        k (int): How many positions to return; all of them if None.
+
+    Returns:
+        np.ndarray: The selected positions, sorted by descending score.
+    """
+    n = scores.shape[0]
+    if k is None or k >= n:
+        candidates = np.arange(n)
+    elif k <= 0:
+        return np.empty(0, dtype=np.int64)
+    else:
+        kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        # Keep everything tied with the k-th score so the cut is deterministic
+        candidates = np.flatnonzero(scores >= kth_score)
+    order = candidates[np.lexsort((candidates, -scores[candidates]))]
+    return order[:k]
+
+
+def quantize(vector):
+    """
+    Scalar-quantizes a vector to int8 codes with one float32 scale.
+
+    Every component of `codes * scale` is within `scale / 2` of the original.
+
+    Args:
+        vector (np.ndarray): A 1-D float array.
+
+    Returns:
+        tuple: (int8 codes, scale).
+    """
+    peak = float(np.max(np.abs(vector))) if vector.size else 0.0
+    scale = np.float32(peak / 127.0) if peak > 0 else np.float32(1.0)
+    codes = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+def _shortlist(approx, margin, threshold=None, k=None):
+    """
+    Returns the positions of the approximately scored items whose exact score
+    could be above the threshold and among the `k` best.
+
+    Each exact score lies within `margin` of its approximation, so an item can
+    only be in the top `k` if its upper bound reaches the k-th best lower bound.
+    """
+    upper = approx + margin
+    keep = np.flatnonzero(upper > threshold) if threshold is not None else np.arange(approx.size)
+    if k is not None and k <= 0:
+        return keep[:0]
+    if k is not None and k < keep.size:
+        lower = approx[keep] - margin[keep]
+        kth_lower = lower[np.argpartition(-lower, k - 1)[k - 1]]
+        keep = keep[upper[keep] >= kth_lower]
+    return keep
+
+
+def _exact_scores(query, ids, approx, exact_vectors):
+    """
+    Replaces approximate scores with exact ones computed from the full-precision
+    vectors. Items whose vectors cannot be loaded keep their approximate score.
+    """
+    scores = approx.astype(np.float32, copy=True)
+    if exact_vectors is None or ids.size == 0:
+        return scores
+    vectors = exact_vectors(ids.tolist())
+    for i, item_id in enumerate(ids.tolist()):
+        vector = VectorIndex.normalize(vectors.get(item_id))
+        if vector is not None and vector.size == query.size:
+            scores[i] = vector @ query
+    return scores
+
+
+def _rescore(query, ids, approx, exact_vectors, threshold=None, k=None):
+    scores = _exact_scores(query, ids, approx, exact_vectors)
+    if threshold is not None:
+        mask = scores > threshold
+        ids, scores = ids[mask], scores[mask]
+    order = top_k_indices(scores, k)
+    return ids[order], scores[order]
+
+
+class VectorIndex:
+    """
+    A contiguous float32 matrix of L2-normalized embeddings plus their ids.
+
+    Rows are kept normalized so that scoring a query is a single
+    matrix-vector product. Storage grows geometrically, so incremental
+    inserts are amortized O(1); removals swap the last row into the hole.
+
+    A quantized index stores each row as int8 codes with a per-row scale,
+    about a quarter of the memory. Searches score the codes first, then
+    rescore only the candidates that could make the cut with the exact
+    vectors returned by `exact_vectors` (a callable mapping a list of ids to
+    {id: embedding}), so results match the float index.
+    """
+
+    def __init__(self, dim=None, quantized=False, exact_vectors=None):
+        self.dim = dim
+        self.quantized = quantized
+        self.exact_vectors = exact_vectors
+        self._ids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, dim or 0), dtype=self._storage_dtype)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._rows = {}  # {item_id: row}
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    @property
+    def ids(self):
+        """The ids of the indexed items, in row order."""
+        return self._ids[:self._size]
+
+    @property
+    def _storage_dtype(self):
+        return np.int8 if self.quantized else np.float32
+
+    @property
+    def matrix(self):
+        """
+        The normalized embedding matrix, one row per indexed item. A quantized
+        index returns a dequantized float32 copy.
+        """
+        if self.quantized:
+            return self._matrix[:self._size].astype(np.float32) * self._scales[:self._size, None]
+        return self._matrix[:self._size]
+
+    @property
+    def nbytes(self):
+        """The memory held by the stored rows and their scales."""
+        return self._matrix[:self._size].nbytes + (self._scales[:self._size].nbytes if self.quantized else 0)
+
+    @staticmethod
+    def normalize(vector):
+        """
+        Converts an embedding to a normalized 1-D float32 array.
+
+        Args:
+            vector: A list or array of numbers.
+
+        Returns:
+            np.ndarray: The unit-length vector (or the zero vector if its norm
+                        is zero), or None if the input is not a valid embedding.
+        """
+        if vector is None:
+            return None
+        try:
+            array = np.asarray(vector, dtype=np.float32)
+        except (TypeError, ValueError):
+            return None
+        if array.ndim != 1 or array.size == 0 or not np.all(np.isfinite(array)):
+            return None
+        norm = np.linalg.norm(array)
+        if norm == 0:
+            return array
+        return array / norm
+
+    def _grow(self, min_capacity):
+        capacity = max(min_capacity, 2 * self._matrix.shape[0], 16)
+        matrix = np.zeros((capacity, self.dim), dtype=self._storage_dtype)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._ids = matrix, ids
+        if self.quantized:
+            scales = np.ones(capacity, dtype=np.float32)
+            scales[:self._size] = self._scales[:self._size]
+            self._scales = scales
+
+    def upsert(self, item_id, vector):
+        """
+        Inserts or replaces the embedding for an item.
+
+        Args:
+            item_id (int): The id of the item.
+            vector: The raw (not necessarily normalized) embedding.
+
+        Returns:
+            bool: True if the item is indexed afterwards. Invalid embeddings or
+                  embeddings whose dimension does not match the index remove
+                  the item instead.
+        """
+        normalized = self.normalize(vector)
+        with self._lock:
+            if normalized is None or (self.dim is not None and normalized.size != self.dim):
+                self.remove(item_id)
+                return False
+            if self.dim is None:
+                self.dim = normalized.size
+                self._matrix = np.empty((0, self.dim), dtype=self._storage_dtype)
+
+            row = self._rows.get(item_id)
+            if row is None:
+                if self._size == self._matrix.shape[0]:
+                    self._grow(self._size + 1)
+                row = self._size
+                self._size += 1
+                self._rows[item_id] = row
+                self._ids[row] = item_id
+            if self.quantized:
+                self._matrix[row], self._scales[row] = quantize(normalized)
+            else:
+                self._matrix[row] = normalized
+            return True
+
+    def remove(self, item_id):
+        """
+        Removes an item from the index, if present.
+
+        Args:
+            item_id (int): The id of the item.
+        """
+        with self._lock:
+            row = self._rows.pop(item_id, None)
+            if row is None:
+                return
+            last = self._size - 1
+            if row != last:
+                moved_id = int(self._ids[last])
+                self._matrix[row] = self._matrix[last]
+                if self.quantized:
+                    self._scales[row] = self._scales[last]
+                self._ids[row] = moved_id
+                self._rows[moved_id] = row
+            self._size = last
+
+    def _approximate_scores(self, query, rows=None):
+        """
+        Scores quantized rows against a normalized query.
+
+        Returns:
+            tuple: (approximate scores, bound on each score's error).
+        """
+        codes = self._matrix[:self._size] if rows is None else self._matrix[rows]
+        scales = self._scales[:self._size] if rows is None else self._scales[rows]
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], _SCORE_BLOCK):
+            block = codes[start:start + _SCORE_BLOCK]
+            scores[start:start + block.shape[0]] = block.astype(np.float32) @ query
+        scores *= scales
+        # Each code is off by at most half a step, so a score is off by at most this
+        margin = scales * (0.5 * float(np.abs(query).sum())) + _SCORE_EPSILON
+        return scores, margin
+
+    def _candidates(self, query, threshold=None, k=None):
+        """
+        Returns (ids, approximate scores, error bounds) for the quantized rows
+        that could be among the `k` best above the threshold. Call with the lock held.
+        """
+        approx, margin = self._approximate_scores(query)
+        keep = _shortlist(approx, margin, threshold, k)
+        return self._ids[keep], approx[keep], margin[keep]
+
+    def search(self, query_vector, threshold=None, k=None):
+        """
+        Scores every indexed item against a query by cosine similarity.
+
+        Args:
+            query_vector: The raw query embedding.
+            threshold (float): If given, only items scoring strictly above it
+                               are returned.
+            k (int): If given, only the `k` best items are returned.
+
+        Returns:
+            tuple: (ids, scores) as NumPy arrays, sorted by descending score.
+        """
+        query = self.normalize(query_vector)
+        with self._lock:
+            if query is None or self._size == 0 or query.size != self.dim:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            if self.quantized:
+                ids, approx, _ = self._candidates(query, threshold, k)
+            else:
+                scores = self.matrix @ query
+                ids = self.ids.copy()
+
+        if self.quantized:
+            return _rescore(query, ids, approx, self.exact_vectors, threshold, k)
+
+        if threshold is not None:
+            mask = scores > threshold
+            ids, scores = ids[mask], scores[mask]
+        order = top_k_indices(scores, k)
+        return ids[order], scores[order]
+
+    def score(self, query_vector, item_ids):
+        """
+        Scores specific items against a query by cosine similarity.
+
+        Args:
+            query_vector: The raw query embedding.
+            item_ids: The ids to score; ids that are not indexed are skipped.
+
+        Returns:
+            tuple: (ids, scores) as NumPy arrays, in the order given.
+        """
+        query = self.normalize(query_vector)
+        with self._lock:
+            present = [item_id for item_id in item_ids if item_id in self._rows]
+            if query is None or not present or query.size != self.dim:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            rows = np.fromiter((self._rows[item_id] for item_id in present),
+                               dtype=np.int64, count=len(present))
+            if self.quantized:
+                scores, _ = self._approximate_scores(query, rows)
+            else:
+                scores = self._matrix[rows] @ query
+        ids = np.asarray(present, dtype=np.int64)
+        if self.quantized:
+            scores = _exact_scores(query, ids, scores, self.exact_vectors)
+        return ids, scores
+
+
+class IVFIndex:
+    """
+    An inverted-file (IVF) approximate nearest-neighbour index.
+
+    Vectors are bucketed by their nearest k-means centroid, and a query only
+    scores the `n_probe` buckets whose centroids are closest to it. Until the
+    index holds `min_size` items it keeps a single bucket, so small corpora
+    are always searched exactly. Setting `n_probe` to at least the number of
+    buckets also gives exact results.
+
+    With `quantized`, the buckets hold int8 rows and the candidates from all
+    probed buckets are rescored together with `exact_vectors`.
+    """
+
+    def __init__(self, n_probe=8, min_size=1000, max_iterations=10, train_sample=10000, seed=0,
+                 quantized=False, exact_vectors=None):
+        self.n_probe = n_probe
+        self.min_size = min_size
+        self.max_iterations = max_iterations
+        self.train_sample = train_sample
+        self.seed = seed
+        self.quantized = quantized
+        self.exact_vectors = exact_vectors
+        self.dim = None
+        self._centroids = None
+        self._lists = [VectorIndex(quantized=quantized)]
+        self._assignment = {}  # {item_id: list number}
+        self._trained_size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._assignment)
+
+    def __contains__(self, item_id):
+        return item_id in self._assignment
+
+    @property
+    def n_lists(self):
+        """The number of inverted lists (buckets)."""
+        return len(self._lists)
+
+    def _nearest_list(self, normalized):
+        if self._centroids is None:
+            return 0
+        return int(np.argmax(self._centroids @ normalized))
+
+    def upsert(self, item_id, vector):
+        """
+        Inserts or replaces the embedding for an item.
+
+        Args:
+            item_id (int): The id of the item.
+            vector: The raw (not necessarily normalized) embedding.
+
+        Returns:
+            bool: True if the item is indexed afterwards.
+        """
+        normalized = VectorIndex.normalize(vector)
+        with self._lock:
+            if normalized is None or (self.dim is not None and normalized.size != self.dim):
+                self.remove(item_id)
+                return False
+            self.dim = normalized.size
+
+            list_no = self._nearest_list(normalized)
+            previous = self._assignment.get(item_id)
+            if previous is not None and previous != list_no:
+                self._lists[previous].remove(item_id)
+            self._lists[list_no].upsert(item_id, normalized)
+            self._assignment[item_id] = list_no
+
+            if len(self) >= self.min_size and len(self) >= 2 * self._trained_size:
+                self.train()
+            return True
+
+    def remove(self, item_id):
+        """Removes an item from the index, if present."""
+        with self._lock:
+            list_no = self._assignment.pop(item_id, None)
+            if list_no is not None:
+                self._lists[list_no].remove(item_id)
+
+    def train(self):
+        """
+        Clusters the indexed vectors (or a sample of `train_sample` of them)
+        with spherical k-means and rebuilds the inverted lists. Called automatically whenever the index has
+        doubled in size since it was last trained.
+        """
+        with self._lock:
+            ids = np.concatenate([lst.ids for lst in self._lists])
+            if ids.size == 0:
+                return
+            matrix = np.concatenate([lst.matrix for lst in self._lists])
+            n_lists = max(1, int(np.sqrt(ids.size)))
+
+            rng = np.random.default_rng(self.seed)
+            sample = matrix
+            if ids.size > self.train_sample:
+                sample = matrix[rng.choice(ids.size, size=self.train_sample, replace=False)]
+            centroids = sample[rng.choice(sample.shape[0], size=n_lists, replace=False)].copy()
+            for _ in range(self.max_iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                # Empty clusters keep their previous centroid
+                new_centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1), centroids)
+                if np.allclose(new_centroids, centroids):
+                    break
+                centroids = new_centroids.astype(np.float32)
+            labels = np.argmax(matrix @ centroids.T, axis=1)
+
+            self._centroids = centroids
+            self._lists = [VectorIndex(self.dim, quantized=self.quantized) for _ in range(n_lists)]
+            self._assignment = {}
+            for item_id, label, row in zip(ids.tolist(), labels.tolist(), matrix):
+                self._lists[label].upsert(item_id, row)
+                self._assignment[item_id] = label
+            self._trained_size = ids.size
+
+    def search(self, query_vector, threshold=None, k=None, n_probe=None):
+        """
+        Finds the items most similar to a query.
+
+        Args:
+            query_vector: The raw query embedding.
+            threshold (float): If given, only items scoring strictly above it
+                               are returned.
+            k (int): If given, only the `k` best items are returned.
+            n_probe (int): Overrides the number of buckets to scan.
+
+        Returns:
+            tuple: (ids, scores) as NumPy arrays, sorted by descending score.
+        """
+        query = VectorIndex.normalize(query_vector)
+        n_probe = n_probe or self.n_probe
+        with self._lock:
+            if query is None or query.size != self.dim:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            if self._centroids is None or n_probe >= self.n_lists:
+                probed = self._lists
+            else:
+                centroid_scores = self._centroids @ query
+                nearest = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+                probed = [self._lists[i] for i in nearest]
+            if self.quantized:
+                candidates = [lst._candidates(query, threshold, k) for lst in probed if len(lst)]
+            else:
+                results = [lst.search(query, threshold=threshold, k=k) for lst in probed]
+
+        if self.quantized:
+            if not candidates:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            ids, approx, margin = (np.concatenate(parts) for parts in zip(*candidates))
+            keep = _shortlist(approx, margin, threshold, k)
+            return _rescore(query, ids[keep], approx[keep], self.exact_vectors, threshold, k)
+
+        ids = np.concatenate([r[0] for r in results])
+        scores = np.concatenate([r[1] for r in results])
+        order = top_k_indices(scores, k)
+        return ids[order], scores[order]
+
+    def score(self, query_vector, item_ids):
+        """
+        Scores specific items against a query exactly, whichever bucket they are in.
+
+        Returns:
+            tuple: (ids, scores) as NumPy arrays.
+        """
+        by_list = {}
+        with self._lock:
+            for item_id in item_ids:
+                list_no = self._assignment.get(item_id)
+                if list_no is not None:
+                    by_list.setdefault(list_no, []).append(item_id)
+            results = [self._lists[list_no].score(query_vector, ids) for list_no, ids in by_list.items()]
+        if not results:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = np.concatenate([r[0] for r in results])
+        scores = np.concatenate([r[1] for r in results])
+        if self.quantized:
+            scores = _exact_scores(VectorIndex.normalize(query_vector), ids, scores, self.exact_vectors)
+        return ids, scores
+
+
+class SnippetIndexRegistry(UserIndexRegistry):
+    """Lazily builds and caches one VectorIndex per user."""
+
+    def _build(self, user_id):
+        from app.models import Snippet
+
+        model_name = ai_services.embedding_model_name()
+        index = VectorIndex(quantized=_quantized_indexes(),
+                            exact_vectors=partial(_load_embeddings, Snippet))
+        rows = db.session.execute(
+            sa.select(Snippet.id, Snippet.embedding_data).where(
+                Snippet.user_id == user_id,
+                Snippet.embedding_data.isnot(None)
+            ).order_by(Snippet.id)
+        ).all()
+        for snippet_id, embedding_data in rows:
+            try:
+                embedding = decode_embedding(embedding_data, model_name)
+            except ValueError:
+                embedding = None
+            else:
+                if embedding is None:
+                    continue  # Made by another embedding provider; `flask embeddings backfill` replaces it
+            if not index.upsert(snippet_id, embedding):
+                current_app.logger.warning(
+                    f"Skipping snippet {snippet_id} with an invalid or mismatched embedding")
+        return index
+
+    def _upsert(self, index, snippet):
+        index.upsert(snippet.id, snippet.embedding)
+
+
+def _quantized_indexes():
+    dtype = current_app.config['VECTOR_INDEX_DTYPE']
+    if dtype not in INDEX_DTYPES:
+        raise ValueError(f"Unsupported vector index dtype: {dtype}")
+    return dtype == 'int8'
+
+
+def _load_embeddings(model, ids):
+    """Returns {id: embedding} for the given rows, skipping undecodable ones."""
+    vectors = {}
+    model_name = ai_services.embedding_model_name()
+    rows = db.session.execute(
+        sa.select(model.id, model.embedding_data).where(model.id.in_(ids)))
+    for item_id, embedding_data in rows:
+        try:
+            embedding = decode_embedding(embedding_data, model_name)
+        except ValueError:
+            continue
+        if embedding is not None:
+            vectors[item_id] = embedding
+    return vectors
+
+
+def snippet_indexes():
+    """Returns the snippet index registry for the current application."""
+    return current_app.extensions.setdefault('snippet_index', SnippetIndexRegistry())
+
+
+_solution_index_lock = threading.Lock()
+
+
+def solution_index():
+    """
+    Returns the approximate index over approved solution embeddings for the
+    current application, building it from the database on first use or when
+    another process changed the solutions (see app.index_versions).
+    """
+    version = current_version(SOLUTIONS_SCOPE)
+    entry = current_app.extensions.get('solution_index') # (index, version it was built at)
+    if entry is not None and entry[1] == version:
+        return entry[0]
+
+    with _solution_index_lock:
+        entry = current_app.extensions.get('solution_index')
+        if entry is None or entry[1] != version:
+            entry = current_app.extensions['solution_index'] = (_build_solution_index(), version)
+        return entry[0]
+
+
+def _build_solution_index():
+    from app.models import LeetcodeSolution
+
+    index = IVFIndex(n_probe=current_app.config['SOLUTION_ANN_NPROBE'],
+                     min_size=current_app.config['SOLUTION_ANN_MIN_SIZE'],
+                     quantized=_quantized_indexes(),
+                     exact_vectors=partial(_load_embeddings, LeetcodeSolution))
+    model_name = ai_services.embedding_model_name()
+    rows = db.session.execute(
+        sa.select(LeetcodeSolution.id, LeetcodeSolution.embedding_data).where(
+            LeetcodeSolution.approved == True,
+            LeetcodeSolution.embedding_data.isnot(None)
+        ).order_by(LeetcodeSolution.id)
+    ).all()
+    for solution_id, embedding_data in rows:
+        try:
+            embedding = decode_embedding(embedding_data, model_name)
+        except ValueError:
+            embedding = None
+        else:
+            if embedding is None:
+                continue  # Made by another embedding provider
+        if not index.upsert(solution_id, embedding):
+            current_app.logger.warning(
+                f"Skipping solution {solution_id} with an invalid or mismatched embedding")
+    return index
+
+
+def update_solution(solution):
+    """Adds an approved solution to the index, or drops an unapproved one (see `update_solutions`)."""
+    update_solutions([solution])
+
+
+def update_solutions(solutions):
+    """
+    Adds approved solutions to the index, or drops unapproved ones, and tells
+    the other processes that their solution index is out of date.
+    """
+    entry = current_app.extensions.get('solution_index')
+    if entry is not None:
+        for solution in solutions:
+            if solution.approved:
+                entry[0].upsert(solution.id, solution.embedding)
+            else:
+                entry[0].remove(solution.id)
+    version = bump_version(SOLUTIONS_SCOPE)
+    with _solution_index_lock:
+        entry = current_app.extensions.get('solution_index')
+        if entry is not None:
+            if entry[1] == version - 1:
+                current_app.extensions['solution_index'] = (entry[0], version)
+            else:
+                del current_app.extensions['solution_index']
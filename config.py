@@ -15,4 +15,109 @@ class Config:
 
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 
+    # AI backend: 'gemini', or 'fake' for load tests and benchmarks, which
+    # answers deterministically offline with the given latency in seconds per
+    # call, fraction of failed calls, embedding dimension and failure seed
+    AI_PROVIDER = os.environ.get('AI_PROVIDER') or 'gemini'
+    AI_FAKE_LATENCY = float(os.environ.get('AI_FAKE_LATENCY') or 0.0)
+    AI_FAKE_ERROR_RATE = float(os.environ.get('AI_FAKE_ERROR_RATE') or 0.0)
+    AI_FAKE_EMBEDDING_DIM = int(os.environ.get('AI_FAKE_EMBEDDING_DIM') or 768)
+    AI_FAKE_SEED = int(os.environ.get('AI_FAKE_SEED') or 0)
+
+    # Shared Gemini client: 'rest' (pooled keep-alive HTTP) or 'grpc', timeouts in
+    # seconds, and pooled connections (at least the number of worker threads)
+    GEMINI_TRANSPORT = os.environ.get('GEMINI_TRANSPORT') or 'rest'
+    GEMINI_CONNECT_TIMEOUT = float(os.environ.get('GEMINI_CONNECT_TIMEOUT') or 5.0)
+    GEMINI_READ_TIMEOUT = float(os.environ.get('GEMINI_READ_TIMEOUT') or 60.0)
+    GEMINI_POOL_SIZE = int(os.environ.get('GEMINI_POOL_SIZE') or 16)
+
+    # Embedding provider: 'gemini' (text-embedding-004 over the network),
+    # 'local' (offline hashed n-grams, NumPy only) with its vector dimension, or
+    # 'fake' (with AI_PROVIDER 'fake'). After switching, run
+    # `flask embeddings backfill` to re-embed everything
+    EMBEDDING_PROVIDER = os.environ.get('EMBEDDING_PROVIDER') or (
+        'fake' if AI_PROVIDER == 'fake' else 'gemini')
+    LOCAL_EMBEDDING_DIM = int(os.environ.get('LOCAL_EMBEDDING_DIM') or 256)
+
+    # Deadline budget in seconds for each kind of Gemini call: search query
+    # embeddings, document embeddings, explanations/tags/classifications, and
+    # code generation (per chunk when streamed)
+    GEMINI_QUERY_EMBEDDING_DEADLINE = float(os.environ.get('GEMINI_QUERY_EMBEDDING_DEADLINE') or 3.0)
+    GEMINI_EMBEDDING_DEADLINE = float(os.environ.get('GEMINI_EMBEDDING_DEADLINE') or 15.0)
+    GEMINI_ANALYSIS_DEADLINE = float(os.environ.get('GEMINI_ANALYSIS_DEADLINE') or 30.0)
+    GEMINI_GENERATION_DEADLINE = float(os.environ.get('GEMINI_GENERATION_DEADLINE') or 60.0)
+
+    # Circuit breaker: after this many consecutive failed or timed-out Gemini
+    # calls, fail fast for the cool-down (seconds) before trying again
+    GEMINI_BREAKER_FAILURES = int(os.environ.get('GEMINI_BREAKER_FAILURES') or 5)
+    GEMINI_BREAKER_COOLDOWN = float(os.environ.get('GEMINI_BREAKER_COOLDOWN') or 30.0)
+
+    # Persistent cache of AI explanations, tags and classifications: maximum
+    # entries (0 disables it) and seconds before an entry expires
+    AI_CACHE_SIZE = int(os.environ.get('AI_CACHE_SIZE') or 10000)
+    AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL') or 30 * 24 * 3600)
+
+    # Background AI jobs: 'threads' (in-process workers), 'external' (only
+    # `flask jobs work`) or 'eager' (run in the request); worker threads, attempts
+    # per job, first retry delay and idle poll interval in seconds, and seconds
+    # after which a job still marked running is presumed lost and run again
+    JOB_QUEUE_MODE = os.environ.get('JOB_QUEUE_MODE') or 'threads'
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS') or 5)
+    JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF') or 10.0)
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL') or 5.0)
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS') or 600)
+
+    # Independent AI calls made concurrently for one item: threads shared by
+    # all jobs, and seconds to wait for a solution's explanation and classification
+    AI_FAN_OUT_WORKERS = int(os.environ.get('AI_FAN_OUT_WORKERS') or 8)
+    SOLUTION_AI_DEADLINE = float(os.environ.get('SOLUTION_AI_DEADLINE') or 90.0)
+
+    # Token-bucket budgets for Gemini text generation: calls per second and burst
+    # size for the whole app and for each user (a rate of 0 disables a budget),
+    # and seconds a call may queue for a token before it is rejected
+    AI_RATE_LIMIT = float(os.environ.get('AI_RATE_LIMIT') or 5.0)
+    AI_RATE_BURST = int(os.environ.get('AI_RATE_BURST') or 20)
+    AI_USER_RATE_LIMIT = float(os.environ.get('AI_USER_RATE_LIMIT') or 0.5)
+    AI_USER_RATE_BURST = int(os.environ.get('AI_USER_RATE_BURST') or 5)
+    AI_RATE_LIMIT_WAIT = float(os.environ.get('AI_RATE_LIMIT_WAIT') or 10.0)
+
     POSTS_PER_PAGE = 10
+
+    # Precision of stored embeddings: 'float32', or 'float16' for half the size
+    EMBEDDING_STORAGE_DTYPE = os.environ.get('EMBEDDING_STORAGE_DTYPE') or 'float32'
+
+    # Approximate solution search: corpora smaller than SOLUTION_ANN_MIN_SIZE are
+    # searched exactly; above it, raising SOLUTION_ANN_NPROBE trades latency for recall
+    SOLUTION_ANN_MIN_SIZE = int(os.environ.get('SOLUTION_ANN_MIN_SIZE') or 1000)
+    SOLUTION_ANN_NPROBE = int(os.environ.get('SOLUTION_ANN_NPROBE') or 8)
+
+    # Precision of the in-memory search indexes: 'float32', or 'int8' for about a
+    # quarter of the memory (candidates are rescored exactly from stored embeddings)
+    VECTOR_INDEX_DTYPE = os.environ.get('VECTOR_INDEX_DTYPE') or 'float32'
+
+    # In-memory cache of search query embeddings (entries, seconds)
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE') or 2048)
+    QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get('QUERY_EMBEDDING_CACHE_TTL') or 3600)
+
+    # Tokenizer for the SQLite FTS5 keyword index: 'unicode61' matches words,
+    # 'trigram' matches arbitrary substrings (larger index, better for code).
+    # Only used when the index is created.
+    FULLTEXT_TOKENIZER = os.environ.get('FULLTEXT_TOKENIZER') or 'unicode61'
+
+    # Cache of ranked snippet search results (entries, seconds); entries are
+    # also invalidated as soon as one of the user's snippets changes
+    SEARCH_RESULT_CACHE_SIZE = int(os.environ.get('SEARCH_RESULT_CACHE_SIZE') or 1024)
+    SEARCH_RESULT_CACHE_TTL = int(os.environ.get('SEARCH_RESULT_CACHE_TTL') or 300)
+
+    # Estimated share of code shingles two snippets must have in common to count
+    # as near-duplicates (warned about on create, collapsed in search on request)
+    DUPLICATE_SIMILARITY = float(os.environ.get('DUPLICATE_SIMILARITY') or 0.8)
+
+    # Related snippets listed on each snippet's page
+    RELATED_SNIPPETS_K = int(os.environ.get('RELATED_SNIPPETS_K') or 5)
+
+    # Seconds a search waits for the query embedding before returning keyword-only
+    # results, and the worker threads that request embeddings in parallel
+    SEARCH_EMBEDDING_DEADLINE = float(os.environ.get('SEARCH_EMBEDDING_DEADLINE') or 2.0)
+    SEARCH_EMBEDDING_WORKERS = int(os.environ.get('SEARCH_EMBEDDING_WORKERS') or 8)
@@ -0,0 +1,82 @@
+"""Store embeddings as binary instead of JSON
+
+Revision ID: 3f9c2d7a1b4e
+Revises: 510e1639e649
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+import json
+import struct
+
+from alembic import op
+import sqlalchemy as sa
+import numpy as np
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2d7a1b4e'
+down_revision = '510e1639e649'
+branch_labels = None
+depends_on = None
+
+# Mirrors the version 1 float32 format of app/embeddings.py. It is copied here so
+# this migration keeps working if the application code changes later.
+_HEADER = struct.Struct('<2sBBIH')
+_MODEL = b'models/text-embedding-004'
+_TABLES = ('snippet', 'leetcode_solution')
+
+
+def _encode(vector):
+    array = np.asarray(vector, dtype='<f4')
+    header = _HEADER.pack(b'SE', 1, 0, array.size, len(_MODEL)) + _MODEL
+    return header + b'\x00' * (-len(header) % 8) + array.tobytes()
+
+
+def _decode(data):
+    _, _, code, dim, model_length = _HEADER.unpack_from(data)
+    offset = _HEADER.size + model_length
+    offset += -offset % 8
+    return np.frombuffer(data, dtype='<f2' if code == 1 else '<f4', count=dim, offset=offset)
+
+
+def _valid_vector(value):
+    if isinstance(value, str):
+        value = json.loads(value)
+    if isinstance(value, list) and value and all(isinstance(x, (int, float)) for x in value):
+        return value
+    return None
+
+
+def upgrade():
+    for table_name in _TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('embedding_data', sa.LargeBinary(), nullable=True))
+
+        table = sa.table(table_name, sa.column('id', sa.Integer),
+                         sa.column('embedding', sa.JSON), sa.column('embedding_data', sa.LargeBinary))
+        bind = op.get_bind()
+        rows = bind.execute(sa.select(table.c.id, table.c.embedding).where(table.c.embedding.isnot(None)))
+        for row_id, embedding in rows.all():
+            vector = _valid_vector(embedding)
+            if vector is not None:
+                bind.execute(table.update().where(table.c.id == row_id).values(embedding_data=_encode(vector)))
+
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_column('embedding')
+
+
+def downgrade():
+    for table_name in _TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('embedding', sa.JSON(), nullable=True))
+
+        table = sa.table(table_name, sa.column('id', sa.Integer),
+                         sa.column('embedding', sa.JSON), sa.column('embedding_data', sa.LargeBinary))
+        bind = op.get_bind()
+        rows = bind.execute(sa.select(table.c.id, table.c.embedding_data).where(table.c.embedding_data.isnot(None)))
+        for row_id, embedding_data in rows.all():
+            vector = _decode(embedding_data).astype(float).tolist()
+            bind.execute(table.update().where(table.c.id == row_id).values(embedding=vector))
+
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_column('embedding_data')
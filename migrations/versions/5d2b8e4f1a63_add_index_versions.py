@@ -0,0 +1,28 @@
+"""Add index versions
+
+Revision ID: 5d2b8e4f1a63
+Revises: 0a4d9e2c7b15
+Create Date: 2026-10-18 19:12:47.318552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2b8e4f1a63'
+down_revision = '0a4d9e2c7b15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('index_version',
+    sa.Column('scope', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('scope')
+    )
+
+
+def downgrade():
+    op.drop_table('index_version')
@@ -0,0 +1,59 @@
+"""Add embedding content hash
+
+Revision ID: 7c1e5a93d2f0
+Revises: 3f9c2d7a1b4e
+Create Date: 2026-10-18 10:04:52.771530
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e5a93d2f0'
+down_revision = '3f9c2d7a1b4e'
+branch_labels = None
+depends_on = None
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    with op.batch_alter_table('snippet', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('embedding_hash', sa.String(length=64), nullable=True))
+    with op.batch_alter_table('leetcode_solution', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('embedding_hash', sa.String(length=64), nullable=True))
+
+    # Existing embeddings were generated from the current content on the last save,
+    # so hash that same text (built exactly as in generate_and_set_embedding).
+    bind = op.get_bind()
+    snippet = sa.table('snippet', sa.column('id', sa.Integer), sa.column('title', sa.String),
+                       sa.column('description', sa.Text), sa.column('code', sa.Text),
+                       sa.column('embedding_data', sa.LargeBinary), sa.column('embedding_hash', sa.String))
+    rows = bind.execute(sa.select(snippet.c.id, snippet.c.title, snippet.c.description, snippet.c.code)
+                        .where(snippet.c.embedding_data.isnot(None))).all()
+    for row_id, title, description, code in rows:
+        text = f"Title: {title}\nDescription: {description}\nCode: {code}"
+        bind.execute(snippet.update().where(snippet.c.id == row_id).values(embedding_hash=_hash(text)))
+
+    solution = sa.table('leetcode_solution', sa.column('id', sa.Integer), sa.column('problem_id', sa.Integer),
+                        sa.column('solution_code', sa.Text), sa.column('explanation', sa.Text),
+                        sa.column('embedding_data', sa.LargeBinary), sa.column('embedding_hash', sa.String))
+    problem = sa.table('leetcode_problem', sa.column('id', sa.Integer), sa.column('title', sa.String))
+    rows = bind.execute(sa.select(solution.c.id, problem.c.title, solution.c.solution_code, solution.c.explanation)
+                        .join(problem, problem.c.id == solution.c.problem_id)
+                        .where(solution.c.embedding_data.isnot(None))).all()
+    for row_id, problem_title, solution_code, explanation in rows:
+        text = f"Problem: {problem_title}\nSolution: {solution_code}\nExplanation: {explanation}"
+        bind.execute(solution.update().where(solution.c.id == row_id).values(embedding_hash=_hash(text)))
+
+
+def downgrade():
+    with op.batch_alter_table('leetcode_solution', schema=None) as batch_op:
+        batch_op.drop_column('embedding_hash')
+    with op.batch_alter_table('snippet', schema=None) as batch_op:
+        batch_op.drop_column('embedding_hash')
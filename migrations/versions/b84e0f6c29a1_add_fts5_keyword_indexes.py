@@ -0,0 +1,74 @@
+"""Add FTS5 keyword indexes
+
+Revision ID: b84e0f6c29a1
+Revises: 7c1e5a93d2f0
+Create Date: 2026-10-18 11:37:06.215904
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'b84e0f6c29a1'
+down_revision = '7c1e5a93d2f0'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic')
+
+# Mirrors app/fulltext.py at the time of this revision.
+_FTS_TABLES = {
+    'snippet_fts': ('snippet', ('title', 'description', 'code', 'tags')),
+    'leetcode_solution_fts': ('leetcode_solution', ('solution_code', 'explanation', 'classification')),
+    'leetcode_problem_fts': ('leetcode_problem', ('title', 'description', 'tags')),
+}
+
+
+def _create_statements(fts_table, content_table, columns, tokenizer):
+    cols = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    delete_old = (f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) "
+                  f"VALUES ('delete', old.id, {old_values});")
+    insert_new = f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts_table} USING fts5({cols}, content='{content_table}', "
+        f"content_rowid='id', tokenize='{tokenizer}')",
+        f"CREATE TRIGGER {fts_table}_ai AFTER INSERT ON {content_table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER {fts_table}_ad AFTER DELETE ON {content_table} BEGIN {delete_old} END",
+        f"CREATE TRIGGER {fts_table}_au AFTER UPDATE OF {cols} ON {content_table} "
+        f"BEGIN {delete_old} {insert_new} END",
+        f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')",
+    ]
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return  # Keyword search keeps using LIKE scans on other databases
+
+    tokenizer = current_app.config.get('FULLTEXT_TOKENIZER', 'unicode61')
+    if tokenizer not in ('unicode61', 'trigram'):
+        raise ValueError(f"Unsupported full-text tokenizer: {tokenizer}")
+    try:
+        with bind.begin_nested():
+            for fts_table, (content_table, columns) in _FTS_TABLES.items():
+                for statement in _create_statements(fts_table, content_table, columns, tokenizer):
+                    bind.execute(sa.text(statement))
+    except sa.exc.OperationalError as e:
+        # SQLite built without FTS5: the application falls back to LIKE scans
+        logger.warning(f"Skipping FTS5 keyword indexes: {e}")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    for fts_table in _FTS_TABLES:
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {fts_table}_{suffix}")
+        op.execute(f"DROP TABLE IF EXISTS {fts_table}")
@@ -0,0 +1,98 @@
+"""Add normalized tags
+
+Revision ID: c3d81f5e7a20
+Revises: b84e0f6c29a1
+Create Date: 2026-10-18 14:21:07.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d81f5e7a20'
+down_revision = 'b84e0f6c29a1'
+branch_labels = None
+depends_on = None
+
+
+def _split(tags):
+    # Same rules as Tag.split: comma-separated, trimmed, lowercase, unique
+    names = []
+    for part in (tags or '').split(','):
+        name = ' '.join(part.split()).lower()[:50]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def upgrade():
+    tag = op.create_table('tag',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('tag', schema=None) as batch_op:
+        batch_op.create_index('ix_tag_name', ['name'], unique=True)
+
+    snippet_tag = op.create_table('snippet_tag',
+    sa.Column('snippet_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['snippet_id'], ['snippet.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('snippet_id', 'tag_id')
+    )
+    with op.batch_alter_table('snippet_tag', schema=None) as batch_op:
+        batch_op.create_index('ix_snippet_tag_tag_id', ['tag_id', 'snippet_id'], unique=False)
+
+    problem_tag = op.create_table('problem_tag',
+    sa.Column('problem_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['problem_id'], ['leetcode_problem.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('problem_id', 'tag_id')
+    )
+    with op.batch_alter_table('problem_tag', schema=None) as batch_op:
+        batch_op.create_index('ix_problem_tag_tag_id', ['tag_id', 'problem_id'], unique=False)
+
+    # Plain CREATE INDEX, so SQLite does not rebuild these tables and drop their FTS5 triggers
+    op.create_index('ix_snippet_user_id_language', 'snippet', ['user_id', 'language'], unique=False)
+    op.create_index('ix_leetcode_solution_language', 'leetcode_solution', ['language'], unique=False)
+
+    # Split the existing comma-separated strings into tag rows and links
+    bind = op.get_bind()
+    tag_ids = {}
+
+    def tag_id(name):
+        if name not in tag_ids:
+            tag_ids[name] = bind.execute(tag.insert().values(name=name)).inserted_primary_key[0]
+        return tag_ids[name]
+
+    snippet = sa.table('snippet', sa.column('id', sa.Integer), sa.column('tags', sa.String))
+    for row_id, tags in bind.execute(sa.select(snippet.c.id, snippet.c.tags)
+                                     .where(snippet.c.tags.isnot(None))).all():
+        for name in _split(tags):
+            bind.execute(snippet_tag.insert().values(snippet_id=row_id, tag_id=tag_id(name)))
+
+    problem = sa.table('leetcode_problem', sa.column('id', sa.Integer), sa.column('tags', sa.String))
+    for row_id, tags in bind.execute(sa.select(problem.c.id, problem.c.tags)
+                                     .where(problem.c.tags.isnot(None))).all():
+        for name in _split(tags):
+            bind.execute(problem_tag.insert().values(problem_id=row_id, tag_id=tag_id(name)))
+
+
+def downgrade():
+    op.drop_index('ix_leetcode_solution_language', table_name='leetcode_solution')
+    op.drop_index('ix_snippet_user_id_language', table_name='snippet')
+
+    with op.batch_alter_table('problem_tag', schema=None) as batch_op:
+        batch_op.drop_index('ix_problem_tag_tag_id')
+    op.drop_table('problem_tag')
+
+    with op.batch_alter_table('snippet_tag', schema=None) as batch_op:
+        batch_op.drop_index('ix_snippet_tag_tag_id')
+    op.drop_table('snippet_tag')
+
+    with op.batch_alter_table('tag', schema=None) as batch_op:
+        batch_op.drop_index('ix_tag_name')
+    op.drop_table('tag')
@@ -0,0 +1,37 @@
+"""Add snippet neighbor graph
+
+Revision ID: e6f2a4b8c913
+Revises: c3d81f5e7a20
+Create Date: 2026-10-18 15:02:44.190562
+
+The graph starts empty; fill it with `flask embeddings related`.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6f2a4b8c913'
+down_revision = 'c3d81f5e7a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('snippet_neighbor',
+    sa.Column('snippet_id', sa.Integer(), nullable=False),
+    sa.Column('neighbor_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['neighbor_id'], ['snippet.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['snippet_id'], ['snippet.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('snippet_id', 'neighbor_id')
+    )
+    with op.batch_alter_table('snippet_neighbor', schema=None) as batch_op:
+        batch_op.create_index('ix_snippet_neighbor_neighbor_id', ['neighbor_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('snippet_neighbor', schema=None) as batch_op:
+        batch_op.drop_index('ix_snippet_neighbor_neighbor_id')
+    op.drop_table('snippet_neighbor')
@@ -0,0 +1,39 @@
+"""Add AI response cache
+
+Revision ID: f1b7d3c05a68
+Revises: e6f2a4b8c913
+Create Date: 2026-10-18 15:48:31.604217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b7d3c05a68'
+down_revision = 'e6f2a4b8c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ai_response_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('function', sa.String(length=64), nullable=False),
+    sa.Column('model', sa.String(length=100), nullable=False),
+    sa.Column('response', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('ai_response_cache', schema=None) as batch_op:
+        batch_op.create_index('ix_ai_response_cache_function', ['function'], unique=False)
+        batch_op.create_index('ix_ai_response_cache_last_used_at', ['last_used_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ai_response_cache', schema=None) as batch_op:
+        batch_op.drop_index('ix_ai_response_cache_last_used_at')
+        batch_op.drop_index('ix_ai_response_cache_function')
+    op.drop_table('ai_response_cache')
@@ -1,3 +1,7 @@
+import numpy as np
+import pytest
+
+
 def test_index_page(client):
     """
     GIVEN a Flask application configured for testing
@@ -10,6 +14,7 @@ def test_index_page(client):
     assert b"Login" in response.data
     assert b"Register" in response.data
 
+
 def test_protected_page_redirects(client):
     """
     GIVEN a Flask application configured for testing
@@ -21,3 +26,1119 @@ def test_protected_page_redirects(client):
     # Check that the redirected page is the login page
     assert b"Sign In" in response.data
     assert b"Username" in response.data
+
+
+def test_vector_index_upsert_search_and_remove():
+    """
+    GIVEN a VectorIndex holding a few embeddings
+    WHEN it is searched, updated and has items removed
+    THEN check that scores are cosine similarities sorted in descending order
+    """
+    from app.vector_index import VectorIndex
+
+    index = VectorIndex()
+    assert index.upsert(1, [1.0, 0.0])
+    assert index.upsert(2, [1.0, 1.0])
+    assert index.upsert(3, [0.0, 2.0])
+    assert not index.upsert(4, [1.0, 2.0, 3.0])  # Wrong dimension
+    assert not index.upsert(5, ['a', 'b'])  # Not numeric
+
+    ids, scores = index.search([2.0, 0.0])
+    assert ids.tolist() == [1, 2, 3]
+    assert scores[0] == pytest.approx(1.0)
+    assert scores[1] == pytest.approx(np.sqrt(0.5))
+
+    ids, _ = index.search([2.0, 0.0], threshold=0.5)
+    assert ids.tolist() == [1, 2]
+
+    index.remove(1)
+    index.upsert(3, [1.0, 0.0])
+    ids, _ = index.search([1.0, 0.0])
+    assert len(index) == 2
+    assert ids.tolist() == [3, 2]
+
+
+def _register_and_login(client, username='alice'):
+    client.post('/register', data={'username': username, 'email': f'{username}@example.com',
+                                   'password': 'secret', 'password2': 'secret'})
+    client.post('/login', data={'username': username, 'password': 'secret'})
+
+
+def _apps_sharing_a_database(path, count=2, **settings):
+    """Creates apps that stand in for separate processes using one SQLite file."""
+    from app import create_app, db
+    from config import Config
+
+    # The engine is created from the config class, so the URI cannot be changed afterwards
+    config_class = type('SharedConfig', (Config,), dict(
+        TESTING=True, SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}', WTF_CSRF_ENABLED=False, **settings))
+    apps = [create_app(config_class) for _ in range(count)]
+    with apps[0].app_context():
+        db.create_all()
+    return apps
+
+
+def test_semantic_search_tracks_created_and_deleted_snippets(client, monkeypatch):
+    """
+    GIVEN a logged-in user and a stubbed embedding service
+    WHEN snippets are created, searched for and deleted
+    THEN check that the per-user index is kept in sync with the database
+    """
+    from app import ai_services
+
+    vectors = {'Sorting': [1.0, 0.0], 'Parsing': [0.0, 1.0], 'sort things': [1.0, 0.1]}
+    monkeypatch.setattr(ai_services, 'generate_embedding',
+                        lambda text, task_type=None: next(
+                            (v for k, v in vectors.items() if k in text), None))
+    _register_and_login(client)
+
+    for title in ('Sorting', 'Parsing'):
+        client.post('/create_snippet', data={'title': title, 'code': 'pass', 'language': 'python',
+                                              'collection': 0, 'tags': ''})
+
+    response = client.get('/search?q=sort things')
+    assert b'Sorting' in response.data
+    assert b'Parsing' not in response.data
+
+    client.post('/snippet/1/delete')
+    response = client.get('/search?q=sort things')
+    assert b'Sorting' not in response.data
+
+
+def test_embedding_binary_round_trip():
+    """
+    GIVEN an embedding vector
+    WHEN it is encoded for storage and decoded again
+    THEN check that the values, model name and precision are preserved without copying
+    """
+    from app.embeddings import encode_embedding, decode_embedding, embedding_model
+
+    data = encode_embedding([0.5, -1.25, 3.0], 'models/test-model')
+    vector = decode_embedding(data)
+    assert vector.dtype == np.float32
+    assert vector.tolist() == [0.5, -1.25, 3.0]
+    assert not vector.flags.owndata
+    assert embedding_model(data) == 'models/test-model'
+
+    half = encode_embedding([0.5, -1.25, 3.0], 'models/test-model', dtype='float16')
+    assert len(half) < len(data)
+    assert decode_embedding(half).tolist() == [0.5, -1.25, 3.0]
+
+    assert encode_embedding(None, 'models/test-model') is None
+    with pytest.raises(ValueError):
+        decode_embedding(b'not an embedding')
+
+
+def test_ivf_index_matches_exact_search():
+    """
+    GIVEN an IVF index and an exact VectorIndex over the same random vectors
+    WHEN the corpus is below the ANN threshold, or every bucket is probed
+    THEN check that both return identical results
+    """
+    from app.vector_index import IVFIndex, VectorIndex
+
+    rng = np.random.default_rng(42)
+    vectors = rng.normal(size=(400, 16))
+    query = rng.normal(size=16)
+
+    exact = VectorIndex()
+    small = IVFIndex(min_size=1000)
+    trained = IVFIndex(n_probe=4, min_size=100)
+    for item_id, vector in enumerate(vectors):
+        exact.upsert(item_id, vector)
+        small.upsert(item_id, vector)
+        trained.upsert(item_id, vector)
+
+    expected_ids, expected_scores = exact.search(query, threshold=0.1)
+    ids, scores = small.search(query, threshold=0.1)
+    assert ids.tolist() == expected_ids.tolist()
+    assert np.allclose(scores, expected_scores)
+
+    assert trained.n_lists > 1
+    ids, _ = trained.search(query, threshold=0.1, n_probe=trained.n_lists)
+    assert ids.tolist() == expected_ids.tolist()
+
+    # Probing a few buckets still finds the nearest neighbour and only returns true matches
+    ids, _ = trained.search(query, threshold=0.1)
+    assert ids[0] == expected_ids[0]
+    assert set(ids.tolist()) <= set(expected_ids.tolist())
+
+    trained.remove(int(expected_ids[0]))
+    assert int(expected_ids[0]) not in trained
+
+
+def test_query_embedding_cache(app, monkeypatch):
+    """
+    GIVEN a stubbed embedding service
+    WHEN equivalent search queries are embedded repeatedly
+    THEN check that only the first one reaches the API and the counters reflect it
+    """
+    from app import ai_services
+
+    calls = []
+    monkeypatch.setattr(ai_services, 'generate_embedding',
+                        lambda text, task_type=None: calls.append(text) or [1.0, 2.0])
+
+    first = ai_services.generate_query_embedding('Binary  Search')
+    second = ai_services.generate_query_embedding('  binary search ')
+    assert calls == ['binary search']
+    assert second is first
+    assert ai_services.query_embedding_cache().stats()['hits'] == 1
+    assert ai_services.query_embedding_cache().stats()['misses'] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used_and_expired_entries():
+    """
+    GIVEN a TTLCache with a fake clock
+    WHEN it overflows and time passes
+    THEN check that the LRU entry is evicted and stale entries expire
+    """
+    from app.cache import TTLCache
+
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    now[0] = 11
+    assert cache.get('a') is None
+    assert len(cache) == 1
+
+
+def test_unchanged_snippet_content_is_not_re_embedded(client, monkeypatch):
+    """
+    GIVEN a saved snippet and a stubbed embedding service
+    WHEN only its tags are edited, and then it is copied
+    THEN check that neither action calls the embedding API again
+    """
+    from app import ai_services, db
+    from app.embeddings import content_hash
+    from app.models import Snippet
+
+    calls = []
+    monkeypatch.setattr(ai_services, 'generate_embedding',
+                        lambda text, task_type=None: calls.append(text) or [1.0, 0.0])
+    _register_and_login(client)
+    snippet_data = {'title': 'Sorting', 'code': 'pass', 'language': 'python', 'collection': 0, 'tags': ''}
+    client.post('/create_snippet', data=snippet_data)
+    assert len(calls) == 1
+
+    client.post('/snippet/1/edit', data=dict(snippet_data, tags='algorithms'))
+    assert len(calls) == 1
+
+    client.post('/collections', data={'name': 'Algorithms', 'parent_collection': 0})
+    client.post('/snippet/1/move', data={'target_collection': 1, 'action': 'copy'})
+    assert len(calls) == 1
+    copy = db.session.get(Snippet, 2)
+    assert copy.embedding.tolist() == [1.0, 0.0]
+    assert copy.embedding_hash == content_hash(copy.embedding_text())
+
+    client.post('/snippet/1/edit', data=dict(snippet_data, code='return 1'))
+    assert len(calls) == 2
+
+
+def test_keyword_search_uses_fts5_index_and_falls_back_to_like(app):
+    """
+    GIVEN snippets stored in a database with the FTS5 keyword index
+    WHEN they are edited and searched, and again after the index is dropped
+    THEN check that the triggers keep the index current and LIKE is used as a fallback
+    """
+    from app import db
+    from app.fulltext import fulltext_tokenizer, keyword_snippet_ids, drop_fulltext_indexes
+    from app.models import User, Snippet
+
+    user = User(username='alice', email='alice@example.com')
+    db.session.add(user)
+    db.session.add_all([
+        Snippet(title='Quick sort', code='def quicksort(items): ...', author=user),
+        Snippet(title='Parser', code='import ast', description='sort of a parser', author=user),
+        Snippet(title='Sorting', code='sorted(items)', author=User(username='bob')),
+    ])
+    db.session.commit()
+    assert fulltext_tokenizer() == 'unicode61'
+
+    quick_sort, parser = user.snippets.order_by(Snippet.id).all()
+    assert keyword_snippet_ids(user.id, 'quicksort') == [quick_sort.id]
+    assert set(keyword_snippet_ids(user.id, 'sort')) == {quick_sort.id, parser.id}
+    assert keyword_snippet_ids(user.id, '"') == []
+
+    parser.description = 'a parser'
+    db.session.commit()
+    assert keyword_snippet_ids(user.id, 'sort') == [quick_sort.id]
+
+    with db.engine.begin() as connection:
+        drop_fulltext_indexes(connection)
+    app.extensions.pop('fulltext')
+    assert fulltext_tokenizer() is None
+    assert keyword_snippet_ids(user.id, 'quicksort') == [quick_sort.id]
+
+
+def test_embeddings_backfill_command(app, runner, monkeypatch):
+    """
+    GIVEN snippets with missing, stale and up-to-date embeddings
+    WHEN 'flask embeddings backfill' is run twice
+    THEN check that only missing and stale rows are embedded, in batches, and a re-run does nothing
+    """
+    from app import ai_services, db
+    from app.embeddings import content_hash
+    from app.models import User, Snippet
+
+    batches = []
+    monkeypatch.setattr(ai_services, 'generate_embeddings',
+                        lambda texts, task_type=None: batches.append(texts) or [[1.0, 0.0]] * len(texts))
+
+    user = User(username='alice', email='alice@example.com')
+    missing = Snippet(title='Missing', code='a', author=user)
+    stale = Snippet(title='Stale', code='b', author=user, embedding=[0.0, 1.0], embedding_hash='outdated')
+    current = Snippet(title='Current', code='c', author=user, embedding=[0.0, 1.0])
+    current.embedding_hash = content_hash(current.embedding_text())
+    db.session.add_all([missing, stale, current])
+    db.session.commit()
+
+    result = runner.invoke(args=['embeddings', 'backfill', '--only', 'snippets', '--batch-size', '1'])
+    assert 'embedded 2 of 3 rows' in result.output
+    assert sorted(len(batch) for batch in batches) == [1, 1]
+    assert missing.embedding.tolist() == [1.0, 0.0]
+    assert stale.embedding.tolist() == [1.0, 0.0]
+    assert current.embedding.tolist() == [0.0, 1.0]
+
+    result = runner.invoke(args=['embeddings', 'backfill', '--only', 'snippets'])
+    assert 'embedded 0 of 3 rows' in result.output
+
+
+def test_top_k_indices_breaks_ties_by_position():
+    """
+    GIVEN scores with ties across the top-k cut-off
+    WHEN consecutive pages are selected
+    THEN check that they are sorted, deterministic and do not overlap
+    """
+    from app.vector_index import top_k_indices
+
+    scores = np.array([0.5, 0.9, 0.7, 0.7, 0.7, 0.1])
+    assert top_k_indices(scores, 3).tolist() == [1, 2, 3]
+    assert top_k_indices(scores, 5).tolist() == [1, 2, 3, 4, 0]
+    assert top_k_indices(scores).tolist() == [1, 2, 3, 4, 0, 5]
+    assert top_k_indices(scores, 0).tolist() == []
+
+
+def test_search_results_are_paginated(app, client, monkeypatch):
+    """
+    GIVEN more matching snippets than fit on one page
+    WHEN the search results are paged through
+    THEN check that every result appears exactly once, best first
+    """
+    from app import ai_services
+
+    app.config['POSTS_PER_PAGE'] = 2
+    vectors = {'Alpha': [1.0, 0.0], 'Beta': [1.0, 0.2], 'Gamma': [1.0, 0.4], 'query': [1.0, 0.0]}
+    monkeypatch.setattr(ai_services, 'generate_embedding',
+                        lambda text, task_type=None: next(
+                            (v for k, v in vectors.items() if k.casefold() in text.casefold()), None))
+    _register_and_login(client)
+    for title in ('Gamma', 'Alpha', 'Beta'):
+        client.post('/create_snippet', data={'title': title, 'code': 'pass', 'language': 'python',
+                                              'collection': 0, 'tags': ''})
+
+    first = client.get('/search?q=query').data.decode()
+    assert first.index('Alpha') < first.index('Beta')
+    assert 'Gamma' not in first
+    assert 'page=2' in first
+
+    second = client.get('/search?q=query&page=2').data.decode()
+    assert 'Gamma' in second
+    assert 'Alpha' not in second and 'Beta' not in second
+
+
+def test_search_results_are_cached_until_a_snippet_changes(client, monkeypatch):
+    """
+    GIVEN a user who searches for the same query twice
+    WHEN one of their snippets is edited in between further searches
+    THEN check that repeats are served from the cache and edits invalidate it
+    """
+    from app import ai_services, fulltext
+
+    keyword_calls = []
+    original = fulltext.keyword_snippet_ids
+    monkeypatch.setattr('app.search.keyword_snippet_ids',
+                        lambda user_id, query: keyword_calls.append(query) or original(user_id, query))
+    monkeypatch.setattr(ai_services, 'generate_embedding',
+                        lambda text, task_type=None: [1.0, 0.0] if task_type == 'RETRIEVAL_QUERY' else None)
+    _register_and_login(client)
+    snippet_data = {'title': 'Sorting', 'code': 'pass', 'language': 'python', 'collection': 0, 'tags': ''}
+    client.post('/create_snippet', data=snippet_data)
+
+    assert b'Sorting' in client.get('/search?q=sorting').data
+    assert b'Sorting' in client.get('/search?q=sorting').data
+    assert len(keyword_calls) == 1
+
+    client.post('/snippet/1/edit', data=dict(snippet_data, title='Parsing'))
+    response = client.get('/search?q=sorting')
+    assert len(keyword_calls) == 2
+    assert b'Parsing' not in response.data
+
+
+def test_keyword_only_search_results_are_not_cached(client, monkeypatch):
+    """
+    GIVEN a search whose query embedding fails
+    WHEN the same search is repeated after the embedding service recovers
+    THEN check that the keyword-only ranking was not cached and semantic hits appear
+    """
+    from app import ai_services
+
+    query_embeddings = iter([None, [1.0, 0.0]])
+    monkeypatch.setattr(ai_services, 'generate_embedding',
+                        lambda text, task_type=None: next(query_embeddings) if task_type == 'RETRIEVAL_QUERY'
+                        else [1.0, 0.0])
+    _register_and_login(client)
+    client.post('/create_snippet', data={'title': 'Sorting', 'code': 'pass', 'language': 'python',
+                                          'collection': 0, 'tags': ''})
+
+    assert b'Sorting' not in client.get('/search?q=ordering').data
+    assert b'Sorting' in client.get('/search?q=ordering').data
+
+
+def test_search_returns_keyword_results_when_embedding_misses_deadline(app, client, monkeypatch):
+    """
+    GIVEN an embedding service slower than the search deadline
+    WHEN a search is run
+    THEN check that keyword results are returned without waiting for the embedding
+    """
+    import time
+    from app import ai_services
+
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: None)
+    _register_and_login(client)
+    client.post('/create_snippet', data={'title': 'Sorting', 'code': 'pass', 'language': 'python',
+                                          'collection': 0, 'tags': ''})
+
+    app.config['SEARCH_EMBEDDING_DEADLINE'] = 0.05
+    monkeypatch.setattr(ai_services, 'generate_embedding',
+                        lambda text, task_type=None: time.sleep(0.5) or [1.0, 0.0])
+    started = time.monotonic()
+    response = client.get('/search?q=sorting')
+    assert time.monotonic() - started < 0.4
+    assert b'Sorting' in response.data
+
+
+def test_quantized_indexes_match_float_search():
+    """
+    GIVEN float32 and int8 indexes over the same random vectors
+    WHEN they are searched and scored
+    THEN check that the int8 indexes return the same ranking in about a quarter of the memory
+    """
+    from app.vector_index import IVFIndex, VectorIndex
+
+    rng = np.random.default_rng(1)
+    vectors = {i: rng.normal(size=64).astype(np.float32) for i in range(1, 501)}
+    def exact_vectors(ids):
+        return {i: vectors[i] for i in ids}
+
+    exact = VectorIndex()
+    quantized = VectorIndex(quantized=True, exact_vectors=exact_vectors)
+    quantized_ivf = IVFIndex(n_probe=100, min_size=100, quantized=True, exact_vectors=exact_vectors)
+    for item_id, vector in vectors.items():
+        exact.upsert(item_id, vector)
+        quantized.upsert(item_id, vector)
+        quantized_ivf.upsert(item_id, vector)
+    quantized.remove(7)
+    exact.remove(7)
+    quantized_ivf.remove(7)
+
+    assert quantized.nbytes < exact.nbytes / 3
+    for _ in range(5):
+        query = rng.normal(size=64)
+        expected_ids, expected_scores = exact.search(query, threshold=0.1, k=10)
+        for index in (quantized, quantized_ivf):
+            ids, scores = index.search(query, threshold=0.1, k=10)
+            assert ids.tolist() == expected_ids.tolist()
+            assert np.allclose(scores, expected_scores, atol=1e-5)
+        ids, scores = quantized.score(query, [3, 7, 42])
+        assert ids.tolist() == [3, 42]
+        assert np.allclose(scores, exact.score(query, [3, 42])[1], atol=1e-5)
+
+
+def test_tag_and_language_filters(app, client, monkeypatch):
+    """
+    GIVEN snippets with comma-separated tags in different languages
+    WHEN the index, a collection and search are filtered by tag and language
+    THEN check that tags are normalized into shared rows and only matching snippets are listed
+    """
+    from app import db, ai_services
+    from app.models import Tag, Collection, Snippet
+
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: None)
+    _register_and_login(client)
+    client.post('/collections', data={'name': 'ORM', 'parent_collection': 0})
+    with app.app_context():
+        collection_id = db.session.scalar(db.select(Collection.id))
+    for title, tags, language in [('Session setup', 'SQLAlchemy, orm', 'python'),
+                                  ('Join query', ' sqlalchemy ,sql,sql', 'python'),
+                                  ('Entity mapping', 'orm', 'java')]:
+        client.post('/create_snippet', data={'title': title, 'code': 'pass', 'language': language,
+                                              'collection': collection_id, 'tags': tags})
+
+    with app.app_context():
+        assert sorted(db.session.scalars(db.select(Tag.name))) == ['orm', 'sql', 'sqlalchemy']
+        assert db.session.get(Snippet, 2).tags == ' sqlalchemy ,sql,sql'  # Kept as typed
+
+    # Another request creates the same new tag between the lookup and the insert
+    insert_missing = Tag._insert_missing.__func__
+    def racing_insert(cls, names):
+        db.session.execute(Tag.__table__.insert().values(name='jpa'))
+        insert_missing(cls, names)
+    monkeypatch.setattr(Tag, '_insert_missing', classmethod(racing_insert))
+    response = client.post('/create_snippet', data={'title': 'Repository', 'code': 'pass', 'language': 'java',
+                                                     'collection': 0, 'tags': 'JPA'})
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.scalars(db.select(Tag.name).where(Tag.name == 'jpa')).all() == ['jpa']
+
+    response = client.get('/index?tag=SQLAlchemy')
+    assert b'Session setup' in response.data and b'Join query' in response.data
+    assert b'Entity mapping' not in response.data
+
+    response = client.get(f'/collection/{collection_id}?tag=orm&language=java')
+    assert b'Entity mapping' in response.data and b'Session setup' not in response.data
+
+    response = client.get('/search?q=query&tag=sql')
+    assert b'Join query' in response.data
+    response = client.get('/search?q=query&tag=orm')
+    assert b'Join query' not in response.data
+
+
+def test_near_duplicate_snippets_are_flagged_and_collapsed(app, client, monkeypatch):
+    """
+    GIVEN a saved snippet
+    WHEN a near-duplicate of its code is saved and then searched for with collapse=1
+    THEN check that the user is warned and only one of the two appears in the results
+    """
+    from app import ai_services
+    from app.dedup import DuplicateIndex
+
+    code = "def add(a, b):\n    return a + b\n\nprint(add(1, 2))\nfor i in range(10):\n    print(i)\n"
+    index = DuplicateIndex(threshold=0.8)
+    index.upsert(1, code)
+    index.upsert(2, "class Stack:\n    def __init__(self):\n        self.items = []\n")
+    assert [item_id for item_id, _ in index.find(code.replace('    ', '\t').upper())] == [1]
+    assert index.collapse([2, 1, 3]) == [2, 1, 3]
+
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: None)
+    _register_and_login(client)
+    client.post('/create_snippet', data={'title': 'Adder one', 'code': code, 'language': 'python',
+                                          'collection': 0, 'tags': ''})
+    response = client.post('/create_snippet', data={'title': 'Adder two', 'code': code + "\nprint(i * 2)\n",
+                                                     'language': 'python', 'collection': 0, 'tags': ''},
+                           follow_redirects=True)
+    assert b'near-duplicate of 1 of your existing snippets' in response.data
+
+    response = client.get('/search?q=adder')
+    assert b'Adder one' in response.data and b'Adder two' in response.data
+    response = client.get('/search?q=adder&collapse=1')
+    assert (b'Adder one' in response.data) != (b'Adder two' in response.data)
+
+
+def test_related_snippets_graph(app, client, runner, monkeypatch):
+    """
+    GIVEN snippets with known embeddings
+    WHEN snippets are created, deleted and the graph is rebuilt in batch
+    THEN check that each snippet page lists its nearest neighbours and the incremental graph matches the batch one
+    """
+    from app import db, ai_services
+    from app.models import Snippet, SnippetNeighbor
+    from app.related import knn_graph
+
+    ids = np.array([10, 20, 30])
+    matrix = np.array([[1.0, 0.0], [0.8, 0.6], [0.0, 1.0]], dtype=np.float32)
+    sources, neighbors, scores = knn_graph(ids, matrix, 1)
+    assert sources.tolist() == [10, 20, 30]
+    assert neighbors.tolist() == [20, 10, 20]
+
+    app.config['RELATED_SNIPPETS_K'] = 2
+    vectors = {'Alpha': [1.0, 0.0, 0.0], 'Beta': [0.9, 0.1, 0.0], 'Gamma': [0.0, 1.0, 0.0],
+               'Delta': [0.0, 0.9, 0.2], 'Epsilon': [0.5, 0.5, 0.0]}
+    monkeypatch.setattr(ai_services, 'generate_embedding',
+                        lambda text, task_type=None: next(v for t, v in vectors.items() if t in text))
+    _register_and_login(client)
+    for title in vectors:
+        client.post('/create_snippet', data={'title': title, 'code': f'# {title}', 'language': 'python',
+                                              'collection': 0, 'tags': ''})
+
+    with app.app_context():
+        titles = {s.title: s.id for s in db.session.scalars(db.select(Snippet))}
+    response = client.get(f"/snippet/{titles['Alpha']}")
+    assert b'Related Snippets' in response.data and b'Beta' in response.data
+
+    client.post(f"/snippet/{titles['Epsilon']}/delete")
+
+    def edges():
+        with app.app_context():
+            return sorted(db.session.execute(
+                db.select(SnippetNeighbor.snippet_id, SnippetNeighbor.neighbor_id)).all())
+
+    incremental = edges()
+    assert all(titles['Epsilon'] not in edge for edge in incremental)
+    result = runner.invoke(args=['embeddings', 'related'])
+    assert 'Rebuilt the related-snippets graph' in result.output
+    assert edges() == incremental
+
+
+def test_gemini_client_is_shared_and_reused(app, monkeypatch):
+    """
+    GIVEN the application's shared Gemini client
+    WHEN models are requested and text is generated several times
+    THEN check that the API is never reconfigured and one pooled service client with timeouts is reused
+    """
+    import google.generativeai as genai
+    from app import ai_services
+    from app.ai_client import gemini
+
+    monkeypatch.setattr(genai, 'configure', lambda **kwargs: pytest.fail('genai.configure called'))
+    with app.app_context():
+        client = gemini()
+        client.api_key = 'test-key'
+        model = client.model('gemini-2.5-flash', {'temperature': 0.4, 'top_k': 32})
+        assert client.model('gemini-2.5-flash', {'top_k': 32, 'temperature': 0.4}) is model
+        assert model._client is client.service
+        adapter = client.service._transport._session.get_adapter('https://example.com')
+        assert (adapter.connect_timeout, adapter.read_timeout) == (
+            app.config['GEMINI_CONNECT_TIMEOUT'], app.config['GEMINI_READ_TIMEOUT'])
+
+        prompts = []
+        class Response:
+            text = ' tags \n'
+        def generate_content(self, prompt, request_options=None):
+            prompts.append((self, request_options))
+            return Response()
+        monkeypatch.setattr(genai.GenerativeModel, 'generate_content', generate_content)
+        assert ai_services.suggest_tags_for_code('x = 1') == 'tags'
+        assert ai_services.explain_code('x = 1') == 'tags'
+        assert prompts[0][0] is prompts[1][0]
+        assert prompts[0][1] == {'timeout': app.config['GEMINI_ANALYSIS_DEADLINE']}
+
+
+def test_ai_responses_are_cached_persistently(app, runner, monkeypatch):
+    """
+    GIVEN the persistent AI response cache limited to two entries
+    WHEN the same code is explained repeatedly and other calls push it out
+    THEN check that Gemini is called once per distinct input, errors are not cached and LRU entries are evicted
+    """
+    from app import ai_services
+    from app.ai_client import GeminiClient
+
+    calls = []
+    def generate(self, prompt, model_name=None, generation_config=None, timeout=None):
+        calls.append(prompt)
+        return 'Error: quota' if 'broken' in prompt else f'answer {len(calls)}'
+    monkeypatch.setattr(GeminiClient, 'generate', generate)
+    app.config['AI_CACHE_SIZE'] = 2
+
+    with app.app_context():
+        assert ai_services.explain_code('x = 1') == 'answer 1'
+        assert ai_services.explain_code('x = 1') == 'answer 1'
+        assert ai_services.suggest_tags_for_code('x = 1') == 'answer 2'
+        assert len(calls) == 2
+
+        assert ai_services.explain_code('broken') == 'Error: quota'
+        assert ai_services.explain_code('broken') == 'Error: quota'
+        assert len(calls) == 4
+
+        ai_services.explain_code('x = 1')  # Now the most recently used entry
+        ai_services.classify_leetcode_solution('pass', 'desc')
+        assert ai_services.explain_code('x = 1') == 'answer 1'
+        assert ai_services.suggest_tags_for_code('x = 1') == 'answer 6'
+
+    result = runner.invoke(args=['ai-cache', 'stats'])
+    assert 'explain_code: 1 entries, 3 hits, 75% hit rate' in result.output
+
+
+def test_background_jobs_retry_with_backoff(app, client, monkeypatch):
+    """
+    GIVEN a new snippet whose embedding job fails on its first attempt
+    WHEN the job is retried after its backoff delay
+    THEN check that the job status endpoint reports the retry and the snippet is embedded in the end
+    """
+    from datetime import datetime
+    from app import ai_services, db
+    from app.jobs import run_pending_jobs
+    from app.models import Job, Snippet
+
+    embeddings = [None, [1.0, 0.0]]
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: embeddings.pop(0))
+    _register_and_login(client)
+    client.post('/create_snippet', data={'title': 'Sorting', 'code': 'pass', 'language': 'python',
+                                         'collection': 0, 'tags': ''})
+    assert db.session.get(Snippet, 1).embedding is None
+
+    status = client.get('/jobs/1').get_json()
+    assert (status['kind'], status['subject'], status['status'], status['attempts']) == (
+        'embed_snippet', 'snippet:1', 'pending', 1)
+    assert 'no embedding' in status['error']
+    assert run_pending_jobs() == 0  # Not due until the backoff has passed
+
+    job = db.session.get(Job, 1)
+    assert job.run_after > datetime.utcnow()
+    job.run_after = datetime.utcnow()
+    db.session.commit()
+    assert run_pending_jobs() == 1
+    assert client.get('/jobs/1').get_json()['status'] == 'done'
+    assert db.session.get(Snippet, 1).embedding.tolist() == [1.0, 0.0]
+
+    client.get('/logout')
+    _register_and_login(client, username='bob')
+    assert client.get('/jobs/1').status_code == 404
+
+
+def test_solution_explanation_and_classification_run_concurrently(app, client, monkeypatch):
+    """
+    GIVEN a generated LeetCode solution whose classification fails once
+    WHEN its enrichment job runs and is retried
+    THEN check that explanation and classification run at the same time and the retry only repeats the failed part
+    """
+    import threading
+    from datetime import datetime
+    from app import ai_services, db
+    from app.jobs import run_pending_jobs
+    from app.models import Job, LeetcodeProblem, LeetcodeSolution
+
+    both_running = threading.Barrier(2, timeout=5)
+    calls = []
+    def explain(code, title, language):
+        calls.append('explain')
+        both_running.wait()  # Raises if the other call is not running concurrently
+        return 'Uses a hash map.'
+    def classify(code, description):
+        calls.append('classify')
+        if calls.count('classify') == 1:
+            both_running.wait()
+            return 'Error: quota'
+        return 'Hash Table'
+    monkeypatch.setattr(ai_services, 'generate_leetcode_solution', lambda *args: 'def two_sum(): pass')
+    monkeypatch.setattr(ai_services, 'explain_leetcode_solution', explain)
+    monkeypatch.setattr(ai_services, 'classify_leetcode_solution', classify)
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: [0.0, 1.0])
+    _register_and_login(client)
+    db.session.add(LeetcodeProblem(title='Two Sum', description='Find two numbers.', difficulty='Easy'))
+    db.session.commit()
+
+    client.post('/generate_solution/1', data={'problem': 1, 'language': 'python'})
+    solution = db.session.get(LeetcodeSolution, 1)
+    assert (solution.explanation, solution.classification) == ('Uses a hash map.', None)
+    assert solution.embedding.tolist() == [0.0, 1.0]
+    job = db.session.get(Job, 1)
+    assert (job.status, job.error) == ('pending', 'Could not generate the classification.')
+
+    job.run_after = datetime.utcnow()
+    db.session.commit()
+    assert run_pending_jobs() == 1
+    assert sorted(calls) == ['classify', 'classify', 'explain']
+    assert db.session.get(LeetcodeSolution, 1).classification == 'Hash Table'
+    assert db.session.get(Job, 1).status == 'done'
+
+
+def test_only_the_job_owner_polls_pending_solution_jobs(app, client):
+    """
+    GIVEN an approved solution whose enrichment job is still pending
+    WHEN its owner and another user view it
+    THEN check that only the owner's page polls the job status
+    """
+    from app import db
+    from app.jobs import enqueue
+    from app.models import LeetcodeProblem, LeetcodeSolution
+
+    _register_and_login(client)
+    db.session.add(LeetcodeProblem(title='Two Sum', description='Find two numbers.', difficulty='Easy'))
+    db.session.add(LeetcodeSolution(problem_id=1, user_id=1, solution_code='pass', language='python',
+                                    approved=True))
+    enqueue('enrich_solution', {'solution_id': 1}, user_id=1, subject='solution:1')
+    db.session.commit()
+
+    assert b'/jobs/1' in client.get('/solution/1').data
+    client.get('/logout')
+    _register_and_login(client, username='bob')
+    response = client.get('/solution/1')
+    assert response.status_code == 200 and b'/jobs/1' not in response.data
+
+
+def test_ai_responses_stream_as_server_sent_events(app, client, monkeypatch):
+    """
+    GIVEN a Gemini client that streams its responses in chunks
+    WHEN an explanation and a LeetCode solution are requested from the streaming endpoints
+    THEN check that the chunks arrive as SSE events and the full text is cached and saved as before
+    """
+    from app import ai_services, db
+    from app.ai_client import GeminiClient
+    from app.models import LeetcodeProblem, LeetcodeSolution
+
+    def generate_stream(self, prompt, model_name=None, generation_config=None, timeout=None):
+        if 'quota' in prompt:
+            raise RuntimeError('quota exceeded')
+        yield from ['def two_sum', '(nums):\n', '    pass\n']
+    monkeypatch.setattr(GeminiClient, 'generate_stream', generate_stream)
+    monkeypatch.setattr(ai_services, 'explain_leetcode_solution', lambda *args: 'Explained.')
+    monkeypatch.setattr(ai_services, 'classify_leetcode_solution', lambda *args: 'Array')
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: None)
+    _register_and_login(client)
+
+    response = client.post('/explain/stream', json={'code': 'x = 1'})
+    assert response.mimetype == 'text/event-stream'
+    events = [message.split('\n') for message in response.get_data(as_text=True).split('\n\n') if message]
+    assert [event for event, _ in events] == ['event: chunk'] * 3 + ['event: done']
+    assert events[0][1] == 'data: {"field": "explanation", "text": "def two_sum"}'
+    assert events[-1][1] == 'data: {"explanation": "def two_sum(nums):\\n    pass"}'
+    assert ai_services.explain_code('x = 1') == 'def two_sum(nums):\n    pass'  # Served from the cache
+
+    error = client.post('/explain/stream', json={'code': 'quota'}).get_data(as_text=True)
+    assert error == 'event: error\ndata: {"error": "Error: Could not generate explanation."}\n\n'
+
+    db.session.add(LeetcodeProblem(title='Two Sum', description='Find two numbers.', difficulty='Easy'))
+    db.session.commit()
+    response = client.post('/generate_solution/1/stream', data={'language': 'python'})
+    assert response.get_data(as_text=True).endswith(
+        'event: done\ndata: {"redirect": "/solution/1"}\n\n')
+    solution = db.session.get(LeetcodeSolution, 1)
+    assert (solution.solution_code, solution.explanation) == ('def two_sum(nums):\n    pass', 'Explained.')
+
+
+def test_gemini_calls_are_coalesced_and_rate_limited(app, client, monkeypatch):
+    """
+    GIVEN a stubbed Gemini client, a per-user budget of one call and no queueing
+    WHEN identical explanations are requested concurrently, and a user exceeds their budget
+    THEN check that the concurrent calls share one request and the excess request gets a 429
+    """
+    import threading
+    import time
+    from app import ai_services
+    from app.ai_client import GeminiClient
+    from app.throttle import RateLimiter, RateLimitExceeded
+
+    release = threading.Event()
+    calls = []
+    def generate(self, prompt, model_name=None, generation_config=None, timeout=None):
+        calls.append(prompt)
+        release.wait(5)
+        return f'answer {len(calls)}'
+    monkeypatch.setattr(GeminiClient, 'generate', generate)
+    app.config.update(AI_CACHE_SIZE=0, AI_USER_RATE_BURST=1, AI_RATE_LIMIT_WAIT=0)
+
+    results = []
+    def explain():
+        with app.app_context():
+            results.append(ai_services.explain_code('x = 1'))
+    threads = [threading.Thread(target=explain) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ['answer 1'] * 3 and len(calls) == 1
+
+    _register_and_login(client)
+    assert client.post('/explain', json={'code': 'a = 1'}).get_json() == {'explanation': 'answer 2'}
+    response = client.post('/explain', json={'code': 'b = 1'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'  # The per-user budget refills at 0.5 calls/s
+    assert len(calls) == 2
+
+    now = [0.0]
+    limiter = RateLimiter(rate=10, burst=2, user_rate=1, user_burst=1, max_wait=0.5,
+                          clock=lambda: now[0], sleep=lambda seconds: now.__setitem__(0, now[0] + seconds))
+    limiter.acquire('alice')
+    limiter.acquire('bob')
+    limiter.acquire(None)  # The global burst is spent, so this call queues for the next token
+    assert now[0] == pytest.approx(0.1)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire('alice')  # Alice's next token is 0.9s away, longer than max_wait
+
+
+def test_gemini_circuit_breaker_fails_fast_and_search_degrades(app, client, monkeypatch):
+    """
+    GIVEN an embedding API that keeps timing out and a breaker that opens after two failures
+    WHEN snippets are saved and searched
+    THEN check that later calls fail fast, snippets are stored without embeddings and search returns keyword results
+    """
+    import google.generativeai as genai
+    from google.api_core import exceptions as api_exceptions
+    from app import db
+    from app.ai_client import gemini
+    from app.models import Snippet
+
+    timeouts = []
+    def embed_content(model, content, task_type, client, request_options):
+        timeouts.append(request_options['timeout'])
+        raise api_exceptions.DeadlineExceeded('timed out')
+    monkeypatch.setattr(genai, 'embed_content', embed_content)
+    app.config['SEARCH_EMBEDDING_DEADLINE'] = 5
+    gemini().api_key = 'test-key'
+    gemini().breaker.failure_threshold = 2
+    _register_and_login(client)
+
+    for title in ('Sorting', 'Parsing', 'Hashing'):
+        client.post('/create_snippet', data={'title': title, 'code': 'pass', 'language': 'python',
+                                             'collection': 0, 'tags': ''})
+    assert timeouts == [app.config['GEMINI_EMBEDDING_DEADLINE']] * 2
+    assert gemini().breaker.state == 'open'
+    assert db.session.scalar(db.select(db.func.count()).select_from(Snippet)) == 3
+    assert db.session.get(Snippet, 3).embedding is None
+
+    response = client.get('/search?q=hashing')
+    assert b'Hashing' in response.data
+    assert len(timeouts) == 2
+
+    from app.throttle import CircuitBreaker, CircuitOpenError
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=30, clock=lambda: now[0])
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    now[0] = 30
+    breaker.before_call()  # The half-open trial call
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Only one trial at a time
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_local_embedding_provider_works_offline_and_is_never_mixed(app, runner, monkeypatch):
+    """
+    GIVEN a snippet embedded by Gemini and the app switched to the local embedding provider
+    WHEN snippets are embedded, indexed and backfilled without network access
+    THEN check that local vectors are deterministic and meaningful, and Gemini vectors are ignored until re-embedded
+    """
+    from app import ai_services, db
+    from app.ai_services import LocalEmbeddingProvider
+    from app.models import User, Snippet
+    from app.vector_index import snippet_indexes
+
+    user = User(username='alice', email='alice@example.com')
+    gemini_snippet = Snippet(title='Parse JSON', code='json.loads(text)', author=user, embedding=[1.0, 0.0])
+    db.session.add(gemini_snippet)
+    db.session.commit()
+
+    monkeypatch.setattr(ai_services.GeminiEmbeddingProvider, 'embed',
+                        lambda *args: pytest.fail('the Gemini API was called'))
+    app.config.update(EMBEDDING_PROVIDER='local', LOCAL_EMBEDDING_DIM=64)
+    app.extensions.pop('embedding_provider')
+    snippet_indexes().clear()
+    assert gemini_snippet.embedding is None
+
+    local_snippet = Snippet(title='Sort numbers', code='sorted(numbers)', author=user)
+    local_snippet.generate_and_set_embedding()
+    db.session.add(local_snippet)
+    db.session.commit()
+    assert snippet_indexes().get(user.id).ids.tolist() == [local_snippet.id]
+
+    result = runner.invoke(args=['embeddings', 'backfill', '--only', 'snippets'])
+    assert 'embedded 1 of 2 rows' in result.output
+    assert gemini_snippet.embedding.shape == (64,)
+
+    provider = LocalEmbeddingProvider(dim=64)
+    query = np.asarray(provider.embed(['parse a JSON string'], 'RETRIEVAL_QUERY')[0])
+    assert np.allclose(query, ai_services.generate_embedding('parse a JSON string'))
+    assert np.linalg.norm(query) == pytest.approx(1.0)
+    assert query @ gemini_snippet.embedding > query @ local_snippet.embedding
+
+
+def test_fake_ai_provider_is_deterministic_and_offline(app, client, monkeypatch):
+    """
+    GIVEN the app configured with the fake AI provider
+    WHEN snippets are saved and searched, a solution is generated and failures are injected
+    THEN check that everything works offline with reproducible responses, embeddings and failures
+    """
+    import google.generativeai as genai
+    from app import ai_client, ai_services, db
+    from app.fake_ai import FakeAIClient
+    from app.models import LeetcodeProblem, LeetcodeSolution, Snippet
+
+    monkeypatch.setattr(genai.GenerativeModel, 'generate_content', lambda *args, **kwargs: pytest.fail('network'))
+    monkeypatch.setattr(genai, 'embed_content', lambda *args, **kwargs: pytest.fail('network'))
+    app.config.update(AI_PROVIDER='fake', EMBEDDING_PROVIDER='fake', AI_FAKE_EMBEDDING_DIM=16)
+    ai_client.init_app(app)
+    app.extensions.pop('embedding_provider', None)
+
+    _register_and_login(client)
+    client.post('/create_snippet', data={'title': 'Sorting', 'code': 'pass', 'language': 'python',
+                                         'collection': 0, 'tags': ''})
+    snippet = db.session.get(Snippet, 1)
+    assert snippet.embedding.shape == (16,)
+    assert b'Sorting' in client.get('/search?q=sorting').data
+
+    db.session.add(LeetcodeProblem(title='Two Sum', description='Find two numbers.', difficulty='Easy'))
+    db.session.commit()
+    client.post('/generate_solution/1', data={'problem': 1, 'language': 'python'})
+    solution = db.session.get(LeetcodeSolution, 1)
+    assert solution.solution_code == ai_services.generate_leetcode_solution('Two Sum', 'Find two numbers.', 'python')
+    assert len(solution.explanation.split()) == 24
+    # Fake replies are cached apart from real ones
+    from app.models import AIResponseCache
+    assert {entry.model for entry in db.session.scalars(db.select(AIResponseCache))} == {'fake:gemini-2.5-flash'}
+
+    first, second = (FakeAIClient(error_rate=0.5, embedding_dim=4, seed=7) for _ in range(2))
+    def outcomes(fake):
+        results = []
+        for number in range(8):
+            try:
+                results.append(fake.generate(f'prompt {number}'))
+            except Exception as e:
+                results.append(type(e).__name__)
+        return results
+    assert outcomes(first) == outcomes(second)
+    assert 'ServiceUnavailable' in outcomes(FakeAIClient(error_rate=0.5, seed=7))
+    assert FakeAIClient(embedding_dim=4).embed('m', 'text', 'RETRIEVAL_DOCUMENT') == first.fake_embedding('text')
+    with pytest.raises(Exception, match='deadline'):
+        FakeAIClient(latency=0.2).generate('slow', timeout=0.01)
+
+
+def test_collection_snippet_counts_use_one_query(app, client, monkeypatch):
+    """
+    GIVEN snippets in a collection, in its sub-collection and in no collection
+    WHEN the collections page is requested
+    THEN check that the counts include sub-collections and come from a single count query
+    """
+    import sqlalchemy as sa
+    from app import db, ai_services
+    from app.collection_tree import collection_tree
+
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: None)
+    _register_and_login(client)
+    client.post('/collections', data={'name': 'Algorithms', 'parent_collection': 0})
+    client.post('/collections', data={'name': 'Graphs', 'parent_collection': 1})
+    for title, collection_id in [('Sort', 1), ('BFS', 2), ('DFS', 2), ('Scratch', 0)]:
+        client.post('/create_snippet', data={'title': title, 'code': 'pass', 'language': 'python',
+                                              'collection': collection_id, 'tags': ''})
+
+    with app.app_context():
+        tree, total = collection_tree(1)
+        assert {node.id: node.snippet_count for node in tree} == {1: 1, 2: 2}
+        assert total == 4
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        sa.event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get('/collections')
+        finally:
+            sa.event.remove(db.engine, 'before_cursor_execute', record)
+    assert sum('count(' in statement.lower() for statement in statements) == 1
+    assert response.status_code == 200
+    assert b'4 problems solved' in response.data
+    assert b'<span class="badge bg-secondary rounded-pill">3</span>' in response.data
+
+
+def test_collection_tree_lists_subtrees_and_prevents_cycles(app, client, monkeypatch):
+    """
+    GIVEN a three-level collection hierarchy with snippets at each level
+    WHEN the tree is loaded, a collection is viewed and a parent is chosen for the root
+    THEN check depths, paths and subtree counts, subtree listing and that no descendant is offered as parent
+    """
+    from app import db, ai_services
+    from app.collection_tree import collection_tree
+
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: None)
+    _register_and_login(client)
+    for name, parent in [('Algorithms', 0), ('Graphs', 1), ('Shortest paths', 2), ('Notes', 0)]:
+        client.post('/collections', data={'name': name, 'parent_collection': parent})
+    for title, collection_id in [('Sort', 1), ('BFS', 2), ('Dijkstra', 3), ('Todo', 4)]:
+        client.post('/create_snippet', data={'title': title, 'code': 'pass', 'language': 'python',
+                                              'collection': collection_id, 'tags': ''})
+
+    with app.app_context():
+        tree, total = collection_tree(1)
+    assert total == 4
+    assert [(node.path, node.depth, node.snippet_count, node.subtree_count) for node in tree] == [
+        ('Algorithms', 0, 1, 3),
+        ('Algorithms / Graphs', 1, 1, 2),
+        ('Algorithms / Graphs / Shortest paths', 2, 1, 1),
+        ('Notes', 0, 1, 1),
+    ]
+
+    response = client.get('/collection/2')
+    assert b'BFS' in response.data and b'Dijkstra' in response.data and b'Sort' not in response.data
+    assert b'2 snippets' in response.data
+    assert b'0 snippets' in client.get('/collection/2?language=java').data
+
+    response = client.get('/collection/1/rename')
+    assert b'Notes' in response.data and b'Shortest paths' not in response.data
+    client.post('/collection/1/rename', data={'name': 'Algorithms', 'parent_collection': 3})
+    with app.app_context():
+        assert [node.id for node in collection_tree(1)[0]] == [1, 2, 3, 4]
+
+
+def test_indexes_pick_up_changes_made_by_another_process(tmp_path, monkeypatch):
+    """
+    GIVEN a web app and a separate job worker app sharing one database
+    WHEN the web app searches, and the worker then embeds a new snippet
+    THEN check that the web app's next search rebuilds its index and finds the snippet
+    """
+    from app import ai_services
+    from app.jobs import run_pending_jobs
+
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: [1.0, 0.0])
+    web, worker = _apps_sharing_a_database(tmp_path / 'shared.db', JOB_QUEUE_MODE='external')
+
+    client = web.test_client()
+    _register_and_login(client)
+    client.post('/create_snippet', data={'title': 'Sorting', 'code': 'pass', 'language': 'python',
+                                          'collection': 0, 'tags': ''})
+    assert b'Sorting' not in client.get('/search?q=ordering').data
+
+    with worker.app_context():
+        assert run_pending_jobs() == 1
+    assert b'Sorting' in client.get('/search?q=ordering').data
+
+
+def test_edited_snippet_is_not_found_by_its_stale_embedding(tmp_path, monkeypatch):
+    """
+    GIVEN an embedded snippet and a job queue that only a separate worker runs
+    WHEN its code is edited and searched for before and after the worker re-embeds it
+    THEN check that the old embedding is dropped until the new one is stored
+    """
+    from app import ai_services, db
+    from app.jobs import run_pending_jobs
+    from app.models import Snippet
+
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: [1.0, 0.0])
+    (web,) = _apps_sharing_a_database(tmp_path / 'shared.db', count=1, JOB_QUEUE_MODE='external')
+
+    client = web.test_client()
+    _register_and_login(client)
+    snippet_data = {'title': 'Sorting', 'code': 'pass', 'language': 'python', 'collection': 0, 'tags': ''}
+    client.post('/create_snippet', data=snippet_data)
+    with web.app_context():
+        run_pending_jobs()
+    assert b'Sorting' in client.get('/search?q=ordering').data
+
+    client.post('/snippet/1/edit', data=dict(snippet_data, code='return 1'))
+    assert b'Sorting' not in client.get('/search?q=ordering').data
+    with web.app_context():
+        assert db.session.get(Snippet, 1).embedding is None
+        assert run_pending_jobs() == 1
+    assert b'Sorting' in client.get('/search?q=ordering').data
+
+
+def test_embeddings_backfill_reaches_a_running_server(tmp_path, monkeypatch):
+    """
+    GIVEN a web app that already built its search index and cached a search
+    WHEN 'flask embeddings backfill' embeds a snippet from another process
+    THEN check that the web app's next search finds the snippet without a restart
+    """
+    from app import ai_services, db
+    from app.models import Snippet
+
+    monkeypatch.setattr(ai_services, 'generate_embedding', lambda text, task_type=None: [1.0, 0.0])
+    monkeypatch.setattr(ai_services, 'generate_embeddings',
+                        lambda texts, task_type=None: [[1.0, 0.0]] * len(texts))
+    web, cli = _apps_sharing_a_database(tmp_path / 'shared.db')
+
+    client = web.test_client()
+    _register_and_login(client)
+    with web.app_context():
+        db.session.add(Snippet(title='Sorting', code='pass', user_id=1))
+        db.session.commit()
+    assert b'Sorting' not in client.get('/search?q=ordering').data
+
+    result = cli.test_cli_runner().invoke(args=['embeddings', 'backfill', '--only', 'snippets'])
+    assert 'embedded 1 of 1 rows' in result.output
+    assert b'Sorting' in client.get('/search?q=ordering').data